@@ -0,0 +1,117 @@
+"""
+Periodically save the board on a worker thread, so the UI loop never waits for encoding or disk I/O.
+"""
+import logging
+import os
+import threading
+import time
+from metrics import REGISTRY
+from vector_manager import write_board
+
+_SAVE_MS = REGISTRY.histogram('autosave.save_ms', "time to write the board (on the worker thread)")
+
+
+class AutoSaver(object):
+    """
+    Call tick() every frame:  every interval seconds, if the board changed since the last save, a snapshot
+    (see VectorManager.get_snapshot) is handed to the worker thread which writes it.  If the previous save
+    is still being written, the snapshot waits for the next tick.
+    """
+
+    def __init__(self, vector_manager, filename, interval=30.0):
+        """
+        :param filename: where to save (format by extension, see write_board)
+        :param interval: seconds between saves
+        """
+        self._vm = vector_manager
+        self._filename = filename
+        self._interval = interval
+        self._saved_generation = None
+        self._t_last = time.perf_counter()
+        self._pending = None  # snapshot for the worker
+        self._busy = False
+        self._stop = False
+        self._cond = threading.Condition()
+        self._stats = {'n_saves': 0, 'n_skipped': 0, 'last_duration': None, 'last_bytes': None,
+                       'last_n_vectors': None, 'last_error': None}
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def tick(self):
+        t = time.perf_counter()
+        if t - self._t_last < self._interval:
+            return
+        self._t_last = t
+        self.save_now()
+
+    def save_now(self):
+        """
+        Queue a save (unless nothing changed since the last one or one is in progress).
+        :returns: True if a save was queued
+        """
+        if self._vm.get_generation() == self._saved_generation or self._vm.is_loading():
+            self._stats['n_skipped'] += 1
+            return False
+        with self._cond:
+            if self._busy or self._pending is not None:
+                return False
+            self._pending = self._vm.get_snapshot()
+            self._cond.notify()
+        return True
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stop:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                generation, vectors, deleted = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                self._write(generation, vectors, deleted)
+            except Exception as e:
+                self._stats['last_error'] = str(e)
+                logging.error("Autosave to %s failed:  %s" % (self._filename, e))
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write(self, generation, vectors, deleted):
+        t_start = time.perf_counter()
+        root, ext = os.path.splitext(self._filename)
+        temp_filename = root + '.autosave_tmp' + ext  # keep the extension, it picks the format
+        write_board(temp_filename, vectors, deleted)
+        os.replace(temp_filename, self._filename)
+        duration = time.perf_counter() - t_start
+        _SAVE_MS.observe(duration * 1000.)
+        self._saved_generation = generation
+        self._stats.update(n_saves=self._stats['n_saves'] + 1, last_duration=duration,
+                           last_bytes=os.path.getsize(self._filename), last_n_vectors=len(vectors), last_error=None)
+        logging.info("Autosaved %i vectors to %s, %i bytes in %.3f sec." %
+                     (len(vectors), self._filename, self._stats['last_bytes'], duration))
+
+    def get_stats(self):
+        """
+        :returns: dict(n_saves, n_skipped, last_duration (sec), last_bytes, last_n_vectors, last_error)
+        """
+        return dict(self._stats)
+
+    def wait(self):
+        """
+        Block until nothing is being written.
+        """
+        with self._cond:
+            while self._busy or self._pending is not None:
+                self._cond.wait()
+
+    def close(self, final_save=True):
+        if final_save:
+            self.save_now()
+        self.wait()
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._worker.join()
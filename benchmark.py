@@ -0,0 +1,232 @@
+"""
+Benchmarks on synthetic boards, for hard numbers before & after performance changes.
+
+Boards of a given total number of points are made of random-walk strokes (as in test_vectors.py), plus some
+circles and text, spread so the density of ink stays the same at every size.  For each board this times:
+    render at several zooms (whole board, 1:1, zoomed in), get_vectors_in, save & load, selecting the vectors
+    in a window-sized area (and deselecting them), and rendering a sequence of panned views.
+
+Results are written as JSON, and compared with a stored baseline if one is given:
+
+    python benchmark.py --sizes 1000,10000,100000 --out after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+import cv2
+import numpy as np
+from board_view import BoardView
+from layout import COLORS_BGR
+from util import get_bbox
+from vector_manager import VectorManager
+from vectors import PencilVec, CircleVec, TextVec
+
+BOARD_SIZES = [1000, 10000, 100000, 1000000]  # total points
+VIEW_SIZE = (1280, 720)
+ZOOMS = {'fit': None, '1x': 1.0, '4x': 4.0}  # (None:  zoomed out to the whole board)
+INK_SPACING = 20.  # board units^2 per point is INK_SPACING^2
+
+# Points per stroke, functions of (rng, n_strokes):
+STROKE_LENGTHS = {'short': lambda rng, n: rng.integers(2, 20, n),
+                  'lognormal': lambda rng, n: np.clip(rng.lognormal(np.log(40), 0.8, n), 2, 2000).astype(int),
+                  'long': lambda rng, n: rng.integers(200, 1000, n)}
+
+_COLORS = ['red', 'green', 'blue', 'black']
+_WORDS = ['foo', 'bar', 'baz', 'p(a|b)', 'hello world', 'x^2 + y^2']
+
+
+def make_board(n_points, stroke_lengths='lognormal', circle_fraction=0.05, text_fraction=0.02, dist_sd=3.,
+               seed=0):
+    """
+    :param n_points: total number of points in the pencil strokes
+    :param stroke_lengths: name in STROKE_LENGTHS, or function(rng, n_strokes) returning points per stroke
+    :param circle_fraction: circles added, per stroke
+    :param text_fraction: text vectors added, per stroke
+    :param dist_sd: standard deviation of the step between points (random walk)
+    :returns: VectorManager
+    """
+    rng = np.random.default_rng(seed)
+    lengths_fn = STROKE_LENGTHS[stroke_lengths] if isinstance(stroke_lengths, str) else stroke_lengths
+    half_width = np.sqrt(n_points) * INK_SPACING / 2
+
+    lengths = np.zeros(0, dtype=int)
+    while lengths.sum() < n_points:
+        lengths = np.concatenate([lengths, lengths_fn(rng, max(1, n_points // 20))])
+    lengths = lengths[:np.searchsorted(np.cumsum(lengths), n_points) + 1]
+    lengths[-1] -= lengths.sum() - n_points  # (trim the last stroke)
+
+    steps = rng.normal(0, dist_sd, (n_points, 2))
+    starts = np.cumsum(lengths) - lengths
+    steps[starts] = rng.uniform(-half_width, half_width, (len(lengths), 2))  # (first point of each stroke)
+    walks = np.cumsum(steps, axis=0)
+    walks -= np.repeat(walks[starts] - steps[starts], lengths, axis=0)  # (each walk starts at its first point)
+
+    vm = VectorManager(None)
+    vectors = []
+    for start, length in zip(starts, lengths):
+        vec = PencilVec(_COLORS[rng.integers(len(_COLORS))], thickness=int(rng.integers(1, 5)))
+        vec._points = walks[start:start + length]
+        vectors.append(vec)
+    for _ in range(int(len(lengths) * circle_fraction)):
+        vec = CircleVec(_COLORS[rng.integers(len(_COLORS))], thickness=int(rng.integers(1, 5)))
+        center = rng.uniform(-half_width, half_width, 2)
+        vec._points = np.array([center, center + rng.normal(0, 20, 2)])
+        vectors.append(vec)
+    for _ in range(int(len(lengths) * text_fraction)):
+        vec = TextVec('black', text_size=int(rng.integers(6, 22)))
+        vec._points = [rng.uniform(-half_width, half_width, 2)]
+        vec.add_letters(_WORDS[rng.integers(len(_WORDS))])
+        vectors.append(vec)
+    for vec in vectors:
+        vec._bbox = get_bbox(vec._points)
+        vec.finalize()
+    vm._vectors = vectors
+    return vm
+
+
+def _time(fn, repeat):
+    """
+    :returns: dict with timings of fn() in ms:  'min', 'median', 'mean', and 'n' (repeats)
+    """
+    times = []
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t_start) * 1000.)
+    return {'min': float(np.min(times)), 'median': float(np.median(times)), 'mean': float(np.mean(times)),
+            'n': repeat}
+
+
+def _get_view(vm, zoom):
+    """
+    :param zoom: pixels per board unit, centered on (0, 0), or None to see the whole board
+    """
+    if zoom is None:
+        bboxes = [vec.get_bbox() for vec in vm.get_all_vectors()]
+        x_min, x_max = min(b['x'][0] for b in bboxes), max(b['x'][1] for b in bboxes)
+        y_min, y_max = min(b['y'][0] for b in bboxes), max(b['y'][1] for b in bboxes)
+        zoom = min(VIEW_SIZE[0] / (x_max - x_min), VIEW_SIZE[1] / (y_max - y_min))
+        center = np.array([x_max + x_min, y_max + y_min]) / 2
+    else:
+        center = np.zeros(2)
+    return BoardView('benchmark', VIEW_SIZE, center - np.array(VIEW_SIZE) / 2. / zoom, zoom)
+
+
+def benchmark_board(vm, repeat=5):
+    """
+    :returns: dict, benchmark name: timings (see _time)
+    """
+    results = {}
+    blank = np.full((VIEW_SIZE[1], VIEW_SIZE[0], 3), COLORS_BGR['off_white'], dtype=np.uint8)
+
+    for name, zoom in ZOOMS.items():
+        view = _get_view(vm, zoom)
+        vm.render(blank.copy(), view)  # (first render fills caches, e.g. circle points)
+        results['render_%s' % name] = _time(lambda: vm.render(blank.copy(), view), repeat)
+
+    view = _get_view(vm, 1.0)
+    results['get_vectors_in'] = _time(lambda: vm.get_vectors_in(view.board_bbox), repeat)
+
+    def _select():
+        vm.select_vectors(vm.get_vectors_in(view.board_bbox))
+        vm.deselect_vectors_unchanged()
+    results['select'] = _time(_select, repeat)
+
+    views = [view.get_panned_view((dx, dx / 2)) for dx in range(0, 400, 20)]  # (20 frames)
+
+    def _pan():
+        for panned in views:
+            vm.render(blank.copy(), panned)
+    results['pan_20_frames'] = _time(_pan, repeat)
+
+    temp_dir = mkdtemp()
+    try:
+        board_file = os.path.join(temp_dir, 'board.npz')
+        results['save'] = _time(lambda: vm.save(board_file), repeat)
+        results['load'] = _time(lambda: VectorManager(board_file), repeat)
+        results['file_bytes'] = os.path.getsize(board_file)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def run_benchmarks(sizes=None, stroke_lengths='lognormal', repeat=5, log=print):
+    """
+    :param sizes: board sizes (total points), default:  BOARD_SIZES
+    :returns: dict, JSON-able:  {'meta': {...}, 'results': {'<benchmark>@<size>': timings, ...}}
+    """
+    sizes = BOARD_SIZES if sizes is None else sizes
+    results = {}
+    for n_points in sizes:
+        t_start = time.perf_counter()
+        vm = make_board(n_points, stroke_lengths)
+        log("Board with %i points (%i vectors) made in %.2f sec." %
+            (n_points, len(vm.get_all_vectors()), time.perf_counter() - t_start))
+        for name, timings in benchmark_board(vm, repeat).items():
+            results['%s@%i' % (name, n_points)] = timings
+            if isinstance(timings, dict):
+                log("    %-28s %10.3f ms" % (name, timings['median']))
+    meta = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'stroke_lengths': stroke_lengths if isinstance(stroke_lengths, str) else 'custom',
+            'repeat': repeat}
+    return {'meta': meta, 'results': results}
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    :param results, baseline: as returned by run_benchmarks
+    :param threshold: relative slowdown (of median times) counted as a regression
+    :returns: list of (name, baseline ms, ms, ratio, is_regression), for benchmarks in both
+    """
+    comparison = []
+    for name, timings in results['results'].items():
+        old = baseline['results'].get(name)
+        if not isinstance(timings, dict) or not isinstance(old, dict):
+            continue
+        ratio = timings['median'] / max(old['median'], 1e-9)
+        comparison.append((name, old['median'], timings['median'], ratio, ratio > 1. + threshold))
+    return comparison
+
+
+def print_comparison(comparison):
+    print("%-36s %12s %12s %8s" % ("benchmark", "baseline ms", "ms", "ratio"))
+    for name, old_ms, ms, ratio, is_regression in comparison:
+        print("%-36s %12.3f %12.3f %7.2fx%s" % (name, old_ms, ms, ratio, "  SLOWER" if is_regression else ""))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the whiteboard on synthetic boards.")
+    parser.add_argument('--sizes', default=','.join(str(n) for n in BOARD_SIZES),
+                        help="comma separated board sizes (total points)")
+    parser.add_argument('--strokes', default='lognormal', choices=sorted(STROKE_LENGTHS),
+                        help="stroke length distribution")
+    parser.add_argument('--repeat', type=int, default=5, help="times each benchmark is run")
+    parser.add_argument('--out', default=None, help="write results to this JSON file")
+    parser.add_argument('--baseline', default=None, help="compare with results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = parser.parse_args(args)
+
+    results = run_benchmarks([int(n) for n in args.sizes.split(',')], args.strokes, args.repeat)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Wrote %s" % (args.out,))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.threshold)
+        print_comparison(comparison)
+        return 1 if any(is_regression for *_, is_regression in comparison) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Binary board files.
+
+A board file is an (uncompressed) numpy .npz container holding one column per vector attribute,
+so saving/loading is a handful of bulk array reads/writes instead of one JSON string per vector:
+
+    version:     int, BOARD_FILE_VERSION
+    n_vectors:   int, number of vectors on the board (the rest of the rows are deleted vectors)
+    kinds:       N, uint8 index into VECTOR_CLASSES
+    ids:         N, int64 vector ids
+    colors:      Nx3, uint8 (BGR)
+    thickness:   N, int32
+    timestamps:  N, float64 (epoch time the vector was finalized)
+    text:        N, unicode (empty except for TextVecs)
+    text_size:   N, float64
+    offsets:     N+1, int64, vector i has points[offsets[i]:offsets[i+1]]
+    points:      Mx2, float32, all points of all vectors, concatenated,
+                 (or, if saved with a point_grid:)
+    points_encoded:  uint8, all points of all vectors, concatenated and encoded by point_codec.encode_points.
+    journal_seq: int, (optional) last journal record included in this snapshot (see journal.py)
+
+The old format (a JSON list of JSON-encoded vectors) is still read by load_board.
+"""
+import json
+import struct
+import numpy as np
+from point_codec import encode_points, decode_points, PointDecoder, DEFAULT_GRID
+from vectors import PencilVec, LineVec, CircleVec, RectangleVec, TextVec
+
+BOARD_FILE_VERSION = 2
+
+# Row order is part of the file format, only append to this.
+VECTOR_CLASSES = [PencilVec, LineVec, CircleVec, RectangleVec, TextVec]
+_KIND_CODES = {cls.__name__: code for code, cls in enumerate(VECTOR_CLASSES)}
+
+_NPZ_MAGIC = b'PK'  # .npz files are zip archives
+
+
+def pack_vectors(vectors, point_dtype=np.float32):
+    """
+    Collect the vectors into the column arrays described above.
+    :param vectors: list of finalized Vector objects
+    :param point_dtype: dtype to store points with.
+    :returns: dict(name=np.array)
+    """
+    n = len(vectors)
+    lengths = np.array([len(vec._points) for vec in vectors], dtype=np.int64)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    points = np.empty((offsets[-1], 2), dtype=point_dtype)
+    for i, vec in enumerate(vectors):
+        if vec._finalized_t is None:
+            raise ValueError("Vector not finalized, don't serialize!")
+        points[offsets[i]:offsets[i + 1]] = vec._points
+
+    texts = [getattr(vec, '_text', '') for vec in vectors]
+    return {'kinds': np.array([_KIND_CODES[vec.name] for vec in vectors], dtype=np.uint8),
+            'ids': np.array([vec.id for vec in vectors], dtype=np.int64),
+            'colors': np.array([vec._color for vec in vectors], dtype=np.uint8).reshape(-1, 3),
+            'thickness': np.array([vec._thickness for vec in vectors], dtype=np.int32),
+            'timestamps': np.array([vec._finalized_t for vec in vectors], dtype=np.float64),
+            'text': np.array(texts if n else [], dtype=str),
+            'text_size': np.array([getattr(vec, '_text_size', 0) for vec in vectors], dtype=np.float64),
+            'offsets': offsets,
+            'points': points}
+
+
+def unpack_vectors(columns, start=0, stop=None):
+    """
+    Inverse of pack_vectors, create Vector objects for rows start:stop.
+    :param columns: dict (or NpzFile) with the arrays from pack_vectors.
+    :returns: list of Vector objects
+    """
+    offsets = columns['offsets']
+    stop = len(offsets) - 1 if stop is None else stop
+    if stop <= start:
+        return []
+    offsets = offsets[start:stop + 1]
+    points = np.asarray(columns['points'][offsets[0]:offsets[-1]], dtype=np.float64)
+    local_offsets = offsets - offsets[0]
+
+    # per-vector bounding boxes & centroids in bulk (all vectors have at least one point)
+    starts = local_offsets[:-1]
+    counts = np.diff(local_offsets)
+    mins = np.minimum.reduceat(points, starts, axis=0) if len(points) else np.zeros((0, 2))
+    maxs = np.maximum.reduceat(points, starts, axis=0) if len(points) else np.zeros((0, 2))
+    centroids = np.add.reduceat(points, starts, axis=0) / counts[:, None] if len(points) else np.zeros((0, 2))
+    per_vec_points = np.split(points, local_offsets[1:-1])
+
+    kinds = columns['kinds'][start:stop]
+    ids = columns['ids'][start:stop].tolist()
+    colors = columns['colors'][start:stop].tolist()
+    thickness = columns['thickness'][start:stop].tolist()
+    timestamps = columns['timestamps'][start:stop].tolist()
+    texts = columns['text'][start:stop].tolist()
+    text_sizes = columns['text_size'][start:stop].tolist()
+
+    vectors = []
+    for i in range(stop - start):
+        data = {'color': tuple(colors[i]),
+                'thickness': thickness[i],
+                'points': per_vec_points[i],
+                'timestamp': timestamps[i],
+                'id': ids[i],
+                'bbox': {'x': [mins[i, 0], maxs[i, 0]], 'y': [mins[i, 1], maxs[i, 1]]},
+                'centroid': centroids[i],
+                'text': texts[i],
+                'text_size': text_sizes[i]}
+        vectors.append(VECTOR_CLASSES[kinds[i]].from_data(data))
+    return vectors
+
+
+def take_rows(columns, indices):
+    """
+    :returns: columns for just the vectors in rows indices (in that order).
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    offsets = columns['offsets']
+    starts, lengths = offsets[indices], offsets[indices + 1] - offsets[indices]
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    point_rows = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    taken = {name: columns[name][indices] for name in _COLUMN_NAMES if name not in ('offsets', 'points')}
+    taken['offsets'] = new_offsets
+    taken['points'] = columns['points'][point_rows]
+    return taken
+
+
+def column_bboxes(columns):
+    """
+    :returns: Nx4 array of vector bboxes, (x_min, x_max, y_min, y_max)
+    """
+    offsets, points = columns['offsets'], columns['points']
+    if len(offsets) < 2:
+        return np.zeros((0, 4))
+    mins = np.minimum.reduceat(points, offsets[:-1], axis=0)
+    maxs = np.maximum.reduceat(points, offsets[:-1], axis=0)
+    return np.stack([mins[:, 0], maxs[:, 0], mins[:, 1], maxs[:, 1]], axis=1).astype(np.float64)
+
+
+_COLUMN_NAMES = ['kinds', 'ids', 'colors', 'thickness', 'timestamps', 'text', 'text_size', 'offsets', 'points']
+
+
+def encode_vectors(vectors, point_grid=DEFAULT_GRID):
+    """
+    Pack the vectors into a compact byte string (no container overhead, for journal/network records).
+    Each column is:  dtype string length (uint8), dtype string, ndim (uint8), shape (uint32 each), raw data.
+    :param point_grid: encode points with point_codec on this grid (the points column is then uint8),
+        or None to store them as float32.
+    """
+    columns = pack_vectors(vectors, point_dtype=np.float32 if point_grid is None else np.float64)
+    if point_grid is not None:
+        columns['points'] = np.frombuffer(encode_points(columns['points'], grid=point_grid), dtype=np.uint8)
+    parts = []
+    for name in _COLUMN_NAMES:
+        array = np.ascontiguousarray(columns[name])
+        dtype = array.dtype.str.encode()
+        parts.append(struct.pack('<B', len(dtype)) + dtype +
+                     struct.pack('<B%iI' % array.ndim, array.ndim, *array.shape))
+        parts.append(array.tobytes())
+    return b''.join(parts)
+
+
+def decode_vectors(buf):
+    """
+    Inverse of encode_vectors.
+    :returns: list of Vector objects
+    """
+    buf = memoryview(buf)
+    pos = 0
+    columns = {}
+    for name in _COLUMN_NAMES:
+        dtype_len = buf[pos]
+        dtype = np.dtype(bytes(buf[pos + 1:pos + 1 + dtype_len]).decode())
+        pos += 1 + dtype_len
+        ndim = buf[pos]
+        shape = struct.unpack_from('<%iI' % ndim, buf, pos + 1)
+        pos += 1 + 4 * ndim
+        count = int(np.prod(shape))
+        columns[name] = np.frombuffer(buf, dtype=dtype, count=count, offset=pos).reshape(shape)
+        pos += count * dtype.itemsize
+    if columns['points'].dtype == np.uint8:
+        columns['points'] = decode_points(columns['points'])
+    return unpack_vectors(columns)
+
+
+def save_board(filename, vectors, deleted, point_grid=None, journal_seq=0):
+    """
+    Write the board in the binary format.
+    :param vectors: list of vectors on the board
+    :param deleted: list of deleted vectors (for undo)
+    :param point_grid: encode points with point_codec on this grid (board units), or None for float32 points.
+        (Encoding makes the file ~2x smaller but saving ~8x and loading ~2x slower, so it's off for local saves,
+        autosaves & journal snapshots, and used for journal records & sync ops, see encode_vectors.)
+    :param journal_seq: the last journal record reflected in vectors/deleted (if saving a snapshot)
+    """
+    columns = pack_vectors(list(vectors) + list(deleted),
+                           point_dtype=np.float32 if point_grid is None else np.float64)
+    if point_grid is not None:
+        columns['points_encoded'] = np.frombuffer(encode_points(columns.pop('points'), grid=point_grid),
+                                                  dtype=np.uint8)
+    with open(filename, 'wb') as f:
+        np.savez(f, version=np.array(BOARD_FILE_VERSION), n_vectors=np.array(len(vectors)),
+                 journal_seq=np.array(journal_seq), **columns)
+
+
+def read_board_info(filename):
+    """
+    Read just the small fields of a binary board file (without loading the vectors).
+    :returns: dict(version=int, n_vectors=int, journal_seq=int), or None if the file isn't a binary board.
+    """
+    if not is_binary_board(filename):
+        return None
+    with np.load(filename) as npz:
+        return {'version': int(npz['version']),
+                'n_vectors': int(npz['n_vectors']),
+                'journal_seq': int(npz['journal_seq']) if 'journal_seq' in npz.files else 0}
+
+
+def read_columns(npz):
+    """
+    :param npz: the opened (np.load) binary board file
+    :returns: the column arrays (as from pack_vectors)
+    """
+    columns = {name: npz[name] for name in _COLUMN_NAMES if name != 'points'}
+    if 'points_encoded' in npz.files:
+        columns['points'] = decode_points(npz['points_encoded'])
+    else:
+        columns['points'] = npz['points']
+    return columns
+
+
+def iter_columns(npz, batch_size):
+    """
+    Like read_columns, but a batch of rows at a time (in file order), decoding only the points of each batch.
+    :param npz: the opened (np.load) binary board file, (keep it open while iterating)
+    :param batch_size: rows per batch
+    :returns: generator of (first row, the columns of rows first to first + batch_size)
+    """
+    columns = {name: npz[name] for name in _COLUMN_NAMES if name != 'points'}
+    offsets = columns['offsets']
+    decoder = PointDecoder(npz['points_encoded']) if 'points_encoded' in npz.files else None
+    points = npz['points'] if decoder is None else None
+    for start in range(0, len(columns['ids']), batch_size):
+        stop = min(start + batch_size, len(columns['ids']))
+        batch = {name: columns[name][start:stop] for name in _COLUMN_NAMES if name not in ('offsets', 'points')}
+        batch['offsets'] = offsets[start:stop + 1] - offsets[start]
+        batch['points'] = points[offsets[start]:offsets[stop]] if decoder is None else \
+            decoder.decode(offsets[stop] - offsets[start])
+        yield start, batch
+
+
+def is_binary_board(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(_NPZ_MAGIC)) == _NPZ_MAGIC
+
+
+def load_board(filename, types):
+    """
+    Read either board file format.
+    :param types: {class name: Vector subclass}, for the old JSON format.
+    :returns: vectors, deleted (lists of Vector objects)
+    """
+    if not is_binary_board(filename):
+        return _load_board_json(filename, types)
+
+    with np.load(filename) as npz:
+        version = int(npz['version'])
+        if version > BOARD_FILE_VERSION:
+            raise ValueError("Board file %s has version %i, newer than this program's (%i)." %
+                             (filename, version, BOARD_FILE_VERSION))
+        n_vectors = int(npz['n_vectors'])
+        columns = read_columns(npz)
+    everything = unpack_vectors(columns)
+    return everything[:n_vectors], everything[n_vectors:]
+
+
+def save_board_json(filename, vectors, deleted):
+    """
+    Write the board in the old (slow) JSON format.
+    """
+    def _serialize(vector):
+        packet = {'class': vector.name,  # vector names are their separate class names.
+                  'data': vector.get_data()}
+        return json.dumps(packet)
+
+    with open(filename, 'w') as f:
+        json.dump([[_serialize(vector) for vector in vectors],
+                   [_serialize(vector) for vector in deleted]], f)
+
+
+def _load_board_json(filename, types):
+
+    def _deserialize(string):
+        packet = json.loads(string)
+        return types[packet['class']].from_data(packet['data'])
+
+    with open(filename, 'r') as f:
+        vectors, deleted = json.load(f)
+
+    return [_deserialize(vector) for vector in vectors], [_deserialize(vector) for vector in deleted]
@@ -0,0 +1,64 @@
+"""
+Gauges of what's on the board, kept up to date by op callbacks.
+"""
+from metrics import REGISTRY
+from vector_manager import BoardOps
+
+
+class BoardMetrics(object):
+    """
+    Keeps gauges of the vectors on the board, by type, and their total number of points, up to date with each op
+    (so nothing walks the whole board).  Vectors of lazily loaded boards are counted from the chunk index.
+    """
+
+    def __init__(self, vector_manager, registry=REGISTRY, prefix='board'):
+        self._vm = vector_manager
+        self._registry = registry
+        self._prefix = prefix
+        self._counts = {}  # type name: number of vectors
+        self._n_points = 0
+        self.recount()
+        registry.gauge(prefix + '.vectors', "vectors on the board, by type", fn=lambda: dict(self._counts))
+        registry.gauge(prefix + '.points', "points in all the vectors on the board", fn=lambda: self._n_points)
+        registry.gauge(prefix + '.in_progress', "vectors being drawn",
+                       fn=lambda: len(self._vm.get_vectors_in_progress()))
+        registry.gauge(prefix + '.lazy_chunks', "chunks of a lazily loaded board (resident, total)",
+                       fn=self._get_lazy_chunks)
+        vector_manager.add_op_callback(self._on_op)
+
+    def recount(self):
+        """
+        Count from scratch, (e.g. after VectorManager.load, which isn't an op).
+        """
+        self._counts, self._n_points = {}, 0
+        self._add(self._vm._vectors, 1)
+        lazy = self._vm._lazy
+        if lazy is not None:
+            chunks = lazy._file.chunks
+            self._counts['(not loaded)'] = sum(chunk['n_vectors'] for chunk in chunks)
+            self._n_points += sum(chunk['n_points'] for chunk in chunks)
+
+    def _get_lazy_chunks(self):
+        lazy = self._vm._lazy
+        return None if lazy is None else [len(lazy._resident), len(lazy._file.chunks)]
+
+    def _add(self, vectors, sign):
+        for vector in vectors:
+            self._counts[vector.name] = self._counts.get(vector.name, 0) + sign
+            self._n_points += sign * len(vector._points)
+
+    def _on_op(self, op, vectors, old_vectors):
+        if op == BoardOps.clear:
+            self._counts, self._n_points = {}, 0
+        elif op == BoardOps.add:
+            self._add(vectors, 1)
+        elif op == BoardOps.delete:
+            self._add(vectors, -1)
+        else:
+            self._add(old_vectors or [], -1)
+            self._add(vectors, 1)
+
+    def close(self):
+        self._vm.remove_op_callback(self._on_op)
+        for name in ['.vectors', '.points', '.in_progress', '.lazy_chunks']:
+            self._registry.remove(self._prefix + name)
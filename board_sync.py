@@ -0,0 +1,457 @@
+"""
+Stream the board to remote viewers as vector ops (not pixels), each viewer renders it with its own view/zoom.
+
+Everything that changes in a frame goes out as one packet:
+    packet header:  length of the rest (uint32), frame seq (uint64)
+    messages, each:  type (uint8), payload length (uint32), payload
+
+Message types:
+    0-4 (BoardOps):  finished-vector ops, payload as in the journal (see journal.encode_op)
+    START:  a vector was started:  id (int64), class (uint8, index into board_file.VECTOR_CLASSES), color (3 x uint8),
+            thickness / text size (float64)
+    POINTS:  in-progress points:  id (int64), index (uint32), point_codec points (replace the points from index on)
+    TEXT:  in-progress text:  id (int64), utf-8 text
+    CANCEL:  vector in progress dropped:  id (int64)
+    RESET:  clear the board and the vectors in progress, (starts a snapshot)
+
+Viewers joining late (or falling too far behind) get a snapshot packet (RESET, an add of the whole board and the
+vectors in progress), taken on the UI thread between frames so it's consistent with the packets that follow, (only
+the list of vectors, the board is encoded by the first sender thread to need it, once for every viewer).
+Each viewer has a sender thread and a byte budget for queued packets (not counting a snapshot), a viewer over
+budget has its queue dropped and gets a fresh snapshot instead, so slow viewers never slow down drawing or the
+other viewers.  While no viewer is connected, nothing is encoded.
+"""
+import logging
+import socket
+import struct
+import threading
+import numpy as np
+from board_file import VECTOR_CLASSES
+from journal import encode_op, decode_op
+from point_codec import encode_points, decode_points
+from util import get_bbox
+from vector_manager import BoardOps
+from vectors import TextVec
+
+MSG_START = 16
+MSG_POINTS = 17
+MSG_TEXT = 18
+MSG_CANCEL = 19
+MSG_RESET = 20
+
+_PACKET_HEADER = struct.Struct('<IQ')
+_MSG_HEADER = struct.Struct('<BI')
+_START = struct.Struct('<qB3Bd')
+_POINTS = struct.Struct('<qI')
+_ID = struct.Struct('<q')
+
+
+def _msg(msg_type, payload):
+    return _MSG_HEADER.pack(int(msg_type), len(payload)) + payload
+
+
+def encode_start(vector):
+    size = vector._text_size if isinstance(vector, TextVec) else vector._thickness
+    return _msg(MSG_START, _START.pack(vector.id, VECTOR_CLASSES.index(type(vector)), *vector._color, size))
+
+
+def encode_progress_points(vector, index):
+    points = np.array(vector._points[index:], dtype=np.float64).reshape(-1, 2)
+    return _msg(MSG_POINTS, _POINTS.pack(vector.id, index) + encode_points(points, compress=False))
+
+
+def encode_text(vector):
+    return _msg(MSG_TEXT, _ID.pack(vector.id) + vector._text.encode('utf-8'))
+
+
+def encode_packet(seq, msgs):
+    body = b''.join(msgs)
+    return _PACKET_HEADER.pack(len(body) + 8, seq) + body
+
+
+def decode_packet(packet):
+    """
+    :param packet: bytes after the length field
+    :returns: seq, list of (type, payload)
+    """
+    packet = memoryview(packet)
+    seq = struct.unpack_from('<Q', packet, 0)[0]
+    pos, msgs = 8, []
+    while pos < len(packet):
+        msg_type, length = _MSG_HEADER.unpack_from(packet, pos)
+        pos += _MSG_HEADER.size
+        msgs.append((msg_type, packet[pos:pos + length]))
+        pos += length
+    return seq, msgs
+
+
+class _Snapshot(object):
+    """
+    A snapshot packet, the board's part encoded on first use.
+    """
+
+    def __init__(self, seq, vectors, progress_msgs):
+        """
+        :param vectors: the vectors on the board, as from VectorManager.get_snapshot
+        :param progress_msgs: messages for the vectors in progress, (encoded already, they do change)
+        """
+        self._seq = seq
+        self._vectors = vectors
+        self._progress_msgs = progress_msgs
+        self._packet = None
+        self._lock = threading.Lock()
+
+    def get_packet(self):
+        with self._lock:
+            if self._packet is None:
+                msgs = [_msg(MSG_RESET, b''), _msg(BoardOps.add, encode_op(BoardOps.add, self._vectors))]
+                self._packet = encode_packet(self._seq, msgs + self._progress_msgs)
+                self._vectors, self._progress_msgs = None, None
+            return self._packet
+
+
+class _Viewer(object):
+    """
+    A connected viewer, packets are sent by its own thread.
+    """
+
+    def __init__(self, sock, address, max_queued_bytes):
+        self.address = address
+        self.needs_snapshot = True
+        self._sock = sock
+        self._max_queued_bytes = max_queued_bytes
+        self._packets = []
+        self._n_queued_bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.n_resets = 0
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def is_closed(self):
+        return self._closed
+
+    def send(self, packet):
+        """
+        Queue a packet, or if over budget, drop the queue and ask for a snapshot.
+        """
+        with self._cond:
+            if self._n_queued_bytes + len(packet) > self._max_queued_bytes:
+                self._packets, self._n_queued_bytes = [], 0
+                self.needs_snapshot = True
+                self.n_resets += 1
+                logging.info("Sync viewer %s fell behind, will send a new snapshot." % (self.address,))
+                return
+            self._packets.append(packet)
+            self._n_queued_bytes += len(packet)
+            self._cond.notify()
+
+    def send_snapshot(self, snapshot):
+        """
+        Replace the queue with a snapshot, (always queued, the budget is for the packets after it).
+        :param snapshot: _Snapshot
+        """
+        with self._cond:
+            self._packets, self._n_queued_bytes = [snapshot], 0
+            self._cond.notify()
+
+    def _send_loop(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._packets and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    packets, self._packets, self._n_queued_bytes = self._packets, [], 0
+                self._sock.sendall(b''.join(packet.get_packet() if isinstance(packet, _Snapshot) else packet
+                                            for packet in packets))
+        except OSError as e:
+            logging.info("Sync viewer %s disconnected:  %s" % (self.address, e))
+        finally:
+            self.close()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._sock.close()
+
+
+class OpEncoder(object):
+    """
+    Turns a VectorManager's changes into messages, frame by frame (also used for session files).
+    """
+
+    def __init__(self, vector_manager):
+        self._vm = vector_manager
+        self._frame_msgs = []  # ops since the last frame
+        self._progress = {}  # vector id: (number of points sent, last point sent, text sent)
+        self._paused = False
+        self._vm.add_op_callback(self._on_op)
+
+    def _on_op(self, op, vectors, old_vectors):
+        if not self._paused:
+            self._frame_msgs.append(_msg(op, encode_op(op, vectors)))
+
+    def set_paused(self, paused):
+        """
+        Stop encoding while nobody needs the messages (e.g. no viewers).  After resuming, frame_msgs() only has the
+        changes from then on, so whoever gets them should start from a snapshot.
+        """
+        if paused and not self._paused:
+            self._frame_msgs = []
+        elif not paused and self._paused:
+            self._progress_msgs()  # (a snapshot has the vectors in progress as they are now)
+        self._paused = paused
+
+    def _progress_msgs(self):
+        """
+        :returns: messages for the changes to the vectors in progress since the last frame.
+        """
+        msgs, progress = [], {}
+        for vector in self._vm.get_vectors_in_progress():
+            n_sent, last_sent, text_sent = self._progress.get(vector.id, (0, None, ''))
+            if vector.id not in self._progress:
+                msgs.append(encode_start(vector))
+            n = len(vector._points)
+            index = n_sent if 0 < n_sent <= n and np.array_equal(vector._points[n_sent - 1], last_sent) else 0
+            if index < n or n < n_sent:
+                msgs.append(encode_progress_points(vector, index))
+            if isinstance(vector, TextVec) and vector._text != text_sent:
+                msgs.append(encode_text(vector))
+            progress[vector.id] = (n, np.array(vector._points[-1]) if n else None, getattr(vector, '_text', ''))
+        for vector_id in self._progress:
+            if vector_id not in progress:  # (finished or cancelled, viewers ignore it if it was finished)
+                msgs.append(_msg(MSG_CANCEL, _ID.pack(vector_id)))
+        self._progress = progress
+        return msgs
+
+    def frame_msgs(self):
+        """
+        :returns: messages for everything that changed since the last call, (none while paused)
+        """
+        if self._paused:
+            return []
+        msgs = self._frame_msgs + self._progress_msgs()
+        self._frame_msgs = []
+        return msgs
+
+    def _in_progress_msgs(self):
+        msgs = []
+        for vector in self._vm.get_vectors_in_progress():
+            msgs.append(encode_start(vector))
+            msgs.append(encode_progress_points(vector, 0))
+            if isinstance(vector, TextVec):
+                msgs.append(encode_text(vector))
+        return msgs
+
+    def snapshot(self, seq):
+        """
+        Messages rebuilding the current board (and vectors in progress) from scratch, as one packet.  Only the vector
+        list is taken now, the board is encoded when the packet is first needed (see _Snapshot).
+        :returns: _Snapshot, (get_packet() for the packet)
+        """
+        return _Snapshot(seq, self._vm.get_snapshot()[1], self._in_progress_msgs())
+
+    def close(self):
+        self._vm.remove_op_callback(self._on_op)
+
+
+class BoardMirror(object):
+    """
+    Applies messages from an OpEncoder to another VectorManager.
+    """
+
+    def __init__(self, vector_manager):
+        self._vm = vector_manager
+        self.seq = None  # last packet applied
+
+    def _in_progress(self, vector_id):
+        for vector in self._vm.get_vectors_in_progress():
+            if vector.id == vector_id:
+                return vector
+        return None
+
+    def apply_packet(self, packet):
+        seq, msgs = decode_packet(packet)
+        for msg_type, payload in msgs:
+            self.apply_msg(msg_type, payload)
+        self.seq = seq
+
+    def apply_msg(self, msg_type, payload):
+        if msg_type < MSG_START:
+            op = BoardOps(msg_type)
+            kwargs = decode_op(op, payload)
+            if op == BoardOps.add:
+                self._vm.cancel_vectors(kwargs['vectors'])
+            self._vm.apply_op(op, **kwargs)
+        elif msg_type == MSG_START:
+            vector_id, class_index, b, g, r, size = _START.unpack_from(payload, 0)
+            cls = VECTOR_CLASSES[class_index]
+            vector = cls((b, g, r), size if cls == TextVec else int(size))
+            vector.id = vector_id
+            self._vm.start_vector(vector)
+        elif msg_type == MSG_POINTS:
+            vector_id, index = _POINTS.unpack_from(payload, 0)
+            vector = self._in_progress(vector_id)
+            if vector is not None:
+                points = decode_points(payload[_POINTS.size:])
+                vector._points = list(vector._points[:index]) + list(points)
+                vector._bbox = get_bbox(vector._points)
+                if hasattr(vector, '_view_cache'):
+                    vector._view_cache = {}
+        elif msg_type == MSG_TEXT:
+            vector = self._in_progress(_ID.unpack_from(payload, 0)[0])
+            if vector is not None:
+                vector._text = bytes(payload[_ID.size:]).decode('utf-8')
+        elif msg_type == MSG_CANCEL:
+            vector = self._in_progress(_ID.unpack_from(payload, 0)[0])
+            if vector is not None:
+                self._vm.cancel_vectors([vector])
+        elif msg_type == MSG_RESET:
+            self._vm.cancel_vectors()
+            self._vm.apply_op(BoardOps.clear)
+
+
+class SyncServer(object):
+    """
+    Serves a VectorManager's board to SyncClients.  Call tick() once per frame from the UI thread.
+    """
+
+    def __init__(self, vector_manager, port=0, host='127.0.0.1', max_queued_bytes=8 * 2**20):
+        """
+        :param port: TCP port (0 for any free one, see get_address())
+        :param host: interface to listen on
+        :param max_queued_bytes: per viewer, beyond this it gets a snapshot instead of the backlog
+        """
+        self._vm = vector_manager
+        self._max_queued_bytes = max_queued_bytes
+        self._seq = 0
+        self._encoder = OpEncoder(vector_manager)
+        self._encoder.set_paused(True)  # (until there are viewers, they start with a snapshot)
+        self._viewers = []
+        self._lock = threading.Lock()
+        self._stats = {'n_packets': 0, 'n_bytes': 0, 'n_snapshots': 0}
+        self._sock = socket.create_server((host, port))
+        self._closed = False
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        logging.info("Sharing board ops at %s:%i" % self.get_address())
+
+    def get_address(self):
+        return self._sock.getsockname()[:2]
+
+    def get_seq(self):
+        return self._seq
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        with self._lock:
+            stats['n_viewers'] = len(self._viewers)
+        return stats
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                sock, address = self._sock.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._viewers.append(_Viewer(sock, address, self._max_queued_bytes))
+            logging.info("Sync viewer %s connected." % (address,))
+
+    def tick(self):
+        """
+        Send everything that changed since the last call, (once per frame).
+        """
+        with self._lock:
+            self._viewers = [viewer for viewer in self._viewers if not viewer.is_closed()]
+            viewers = list(self._viewers)  # (any connecting after this wait for the next tick's snapshot)
+        # (new viewers start with a snapshot, so nothing is lost while paused)
+        self._encoder.set_paused(len(viewers) == 0)
+        msgs = self._encoder.frame_msgs()
+        if msgs:
+            self._seq += 1
+        packet = encode_packet(self._seq, msgs) if msgs else None
+        snapshot = None
+        for viewer in viewers:
+            if viewer.needs_snapshot:
+                viewer.needs_snapshot = False
+                if snapshot is None:
+                    snapshot = self._encoder.snapshot(self._seq)
+                    self._stats['n_snapshots'] += 1
+                viewer.send_snapshot(snapshot)
+            elif packet is not None:
+                viewer.send(packet)
+                self._stats['n_packets'] += 1
+                self._stats['n_bytes'] += len(packet)
+
+    def close(self):
+        self._closed = True
+        self._encoder.close()
+        self._sock.close()
+        with self._lock:
+            for viewer in self._viewers:
+                viewer.close()
+
+
+class SyncClient(object):
+    """
+    Mirrors a SyncServer's board into a local VectorManager.  Packets are read on a thread, call tick() (e.g. every
+    frame) to apply them.
+    """
+
+    def __init__(self, vector_manager, host, port):
+        self._vm = vector_manager
+        self._sock = socket.create_connection((host, port))
+        self._packets = []
+        self._lock = threading.Lock()
+        self._connected = True
+        self._mirror = BoardMirror(vector_manager)
+        self.seq = None  # last packet applied
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def is_connected(self):
+        return self._connected
+
+    def _read_exactly(self, n):
+        chunks = []
+        while n > 0:
+            chunk = self._sock.recv(min(n, 2**20))
+            if not chunk:
+                raise ConnectionError("Sync server closed the connection.")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    def _read_loop(self):
+        try:
+            while True:
+                length = struct.unpack('<I', self._read_exactly(4))[0]
+                packet = self._read_exactly(length)
+                with self._lock:
+                    self._packets.append(packet)
+        except OSError as e:
+            logging.info("Sync client disconnected:  %s" % (e,))
+            self._connected = False
+
+    def tick(self):
+        """
+        Apply the packets received so far.
+        :returns: number of packets applied
+        """
+        with self._lock:
+            packets, self._packets = self._packets, []
+        for packet in packets:
+            self.apply_packet(packet)
+        return len(packets)
+
+    def apply_packet(self, packet):
+        self._mirror.apply_packet(packet)
+        self.seq = self._mirror.seq
+
+    def close(self):
+        self._sock.close()
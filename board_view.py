@@ -28,6 +28,13 @@ class BoardView(object):
         self._board_bbox = {'x': (upper_left[0], lower_right[0]),
                             'y': (upper_left[1], lower_right[1])}
 
+    @property
+    def board_bbox(self):
+        """
+        The part of the board this view sees, {'x': (x_min, x_max), 'y': (y_min, y_max)} in board coords.
+        """
+        return self._board_bbox
+
     def get_scope(self):
         return self._zoom, self._origin
 
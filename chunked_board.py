@@ -0,0 +1,322 @@
+"""
+Spatially chunked board files, for boards too big to load all at once.
+
+The board plane is cut into square cells (chunk_size board units on a side), each vector belongs to the cell
+containing its bbox center, and all vectors of a cell are stored together as one "chunk" of the column arrays
+from board_file.pack_vectors.  File layout:
+
+    8 bytes:   _MAGIC
+    8 bytes:   uint64, length of the header
+    header:    JSON, {'version', 'chunk_size', 'data_start', 'n_vectors', 'journal_seq',
+                      'chunks': [chunk, ...], 'deleted': chunk}
+                   where chunk = {'key': [cx, cy], 'bbox': {...}, 'n_vectors', 'n_points',
+                                  'columns': {name: [dtype, shape, offset], ...}}
+    data:      raw column arrays, offsets are relative to data_start.
+
+The file is mmap-ed and the header (chunk index) is all that is read when opening, so opening is instant.
+LazyBoard materializes chunks as the views need them and evicts old ones to stay under a memory budget.
+"""
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from board_file import pack_vectors, unpack_vectors
+from metrics import REGISTRY
+from util import bboxes_intersect
+
+_MAGIC = b'WBCHUNK1'
+CHUNKED_FILE_VERSION = 1
+DEFAULT_CHUNK_SIZE = 500.  # board units
+_ALIGN = 64
+
+# Rough cost of one materialized vector in addition to its points (python object, dicts, bbox, ...)
+_VECTOR_OVERHEAD_BYTES = 1500
+
+_CHUNK_HITS, _CHUNK_MISSES = REGISTRY.hit_rate('lazy_board.chunks', "chunks a view needed that were already loaded")
+
+
+def is_chunked_board(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+def _chunk_key(vector, chunk_size):
+    bbox = vector.get_bbox()
+    x = (bbox['x'][0] + bbox['x'][1]) / 2.
+    y = (bbox['y'][0] + bbox['y'][1]) / 2.
+    return int(np.floor(x / chunk_size)), int(np.floor(y / chunk_size))
+
+
+def _union_bbox(vectors):
+    bboxes = np.array([[v.get_bbox()['x'][0], v.get_bbox()['x'][1],
+                        v.get_bbox()['y'][0], v.get_bbox()['y'][1]] for v in vectors], dtype=np.float64)
+    return {'x': [float(bboxes[:, 0].min()), float(bboxes[:, 1].max())],
+            'y': [float(bboxes[:, 2].min()), float(bboxes[:, 3].max())]}
+
+
+def save_chunked_board(filename, vectors, deleted, chunk_size=DEFAULT_CHUNK_SIZE, journal_seq=0):
+    """
+    Write the board, grouped into spatial chunks.
+    Writes to a temporary file first, so a board can be saved over the (mmap-ed) file it was opened from.
+    :param journal_seq: the last journal record reflected in vectors/deleted (if saving a snapshot)
+    """
+    cells = {}
+    for vector in vectors:
+        cells.setdefault(_chunk_key(vector, chunk_size), []).append(vector)
+
+    blocks = []  # (offset, array)
+    data_size = 0
+
+    def _add_chunk(chunk_vectors, key):
+        nonlocal data_size
+        columns = pack_vectors(chunk_vectors)
+        chunk = {'key': key,
+                 'bbox': _union_bbox(chunk_vectors) if len(chunk_vectors) else None,
+                 'n_vectors': len(chunk_vectors),
+                 'n_points': int(columns['offsets'][-1]),
+                 'columns': {}}
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            chunk['columns'][name] = [array.dtype.str, list(array.shape), data_size]
+            blocks.append((data_size, array))
+            data_size += (array.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+        return chunk
+
+    chunks = [_add_chunk(cell_vectors, list(key)) for key, cell_vectors in cells.items()]
+    deleted_chunk = _add_chunk(list(deleted), None)
+
+    header = {'version': CHUNKED_FILE_VERSION,
+              'chunk_size': chunk_size,
+              'n_vectors': len(vectors),
+              'chunks': chunks,
+              'deleted': deleted_chunk,
+              'journal_seq': journal_seq,
+              'data_start': 0}
+    # data_start depends on the header length, which depends (a little) on data_start
+    header_len = len(json.dumps(header).encode()) + 32
+    header['data_start'] = (len(_MAGIC) + 8 + header_len + _ALIGN - 1) // _ALIGN * _ALIGN
+    header_bytes = json.dumps(header).encode().ljust(header_len)
+
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<Q', header_len))
+        f.write(header_bytes)
+        for offset, array in blocks:
+            f.seek(header['data_start'] + offset)
+            f.write(array.tobytes())
+        f.truncate(header['data_start'] + data_size)  # zero-pad the last block
+    os.replace(temp_filename, filename)
+
+
+class ChunkedBoardFile(object):
+    """
+    Read-only, mmap-ed chunked board file.  Only the header is parsed when opening.
+    """
+
+    def __init__(self, filename, fd=None):
+        """
+        :param fd: an open file descriptor of the file to use (and close), instead of opening filename
+        """
+        self.filename = filename
+        self._file = open(filename, 'rb') if fd is None else os.fdopen(fd, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Not a chunked board file: %s" % filename)
+        header_len, = struct.unpack('<Q', self._mmap[len(_MAGIC):len(_MAGIC) + 8])
+        header_start = len(_MAGIC) + 8
+        self._header = json.loads(self._mmap[header_start:header_start + header_len].decode())
+        if self._header['version'] > CHUNKED_FILE_VERSION:
+            raise ValueError("Board file %s has version %i, newer than this program's (%i)." %
+                             (filename, self._header['version'], CHUNKED_FILE_VERSION))
+        self.chunks = self._header['chunks']
+        self.chunk_size = self._header['chunk_size']
+        self.n_vectors = self._header['n_vectors']
+        self.journal_seq = self._header.get('journal_seq', 0)
+
+        # chunk bboxes as one array, for fast culling:  x_min, x_max, y_min, y_max
+        self._chunk_bboxes = np.array([[c['bbox']['x'][0], c['bbox']['x'][1], c['bbox']['y'][0], c['bbox']['y'][1]]
+                                       for c in self.chunks], dtype=np.float64).reshape(-1, 4)
+
+    def chunks_in(self, bbox):
+        """
+        Indices of chunks whose bboxes intersect the bbox.
+        """
+        b = self._chunk_bboxes
+        hits = (b[:, 0] <= bbox['x'][1]) & (bbox['x'][0] <= b[:, 1]) & \
+               (b[:, 2] <= bbox['y'][1]) & (bbox['y'][0] <= b[:, 3])
+        return np.nonzero(hits)[0].tolist()
+
+    def _read_columns(self, chunk):
+        start = self._header['data_start']
+        columns = {}
+        for name, (dtype, shape, offset) in chunk['columns'].items():
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape))
+            columns[name] = np.frombuffer(self._mmap, dtype=dtype, count=count,
+                                          offset=start + offset).reshape(shape)
+        return columns
+
+    def read_chunk(self, index):
+        """
+        :returns: list of Vector objects in the chunk.
+        """
+        return unpack_vectors(self._read_columns(self.chunks[index]))
+
+    def read_deleted(self):
+        return unpack_vectors(self._read_columns(self._header['deleted']))
+
+    def reopen(self):
+        """
+        :returns: a new ChunkedBoardFile on this same file (not whatever is at filename by now, e.g. after a
+            snapshot was saved over it), that stays open after this one is closed.
+        """
+        return ChunkedBoardFile(self.filename, fd=os.dup(self._file.fileno()))
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class ChunkSnapshot(object):
+    """
+    A LazyBoard's vectors at one moment, read from (its own handle on) the file when first used, e.g. by the thread
+    writing a snapshot, so taking one doesn't materialize every chunk.  Iterate it or take its len().
+    """
+
+    def __init__(self, board_file, detached, in_memory):
+        """
+        :param board_file: ChunkedBoardFile, the LazyBoard's file (a new handle on it is kept, the file may be saved
+            over or the board closed before the snapshot is used)
+        :param detached: ids of the file's vectors no longer on the board
+        :param in_memory: vectors on the board that aren't in the file, (after the file's)
+        """
+        self._file = board_file.reopen()
+        self._detached = detached
+        self._in_memory = in_memory
+        self._vectors = None
+
+    def _get_vectors(self):
+        if self._vectors is None:
+            self._vectors = [vector for index in range(len(self._file.chunks))
+                             for vector in self._file.read_chunk(index) if vector.id not in self._detached]
+            self._vectors.extend(self._in_memory)
+            self._file.close()
+        return self._vectors
+
+    def __iter__(self):
+        return iter(self._get_vectors())
+
+    def __len__(self):
+        return len(self._get_vectors())
+
+
+class LazyBoard(object):
+    """
+    Keeps the chunks the views are looking at materialized, evicting the least recently used ones
+    when over the memory budget.
+    """
+
+    def __init__(self, filename, memory_budget=256 * 2**20, prefetch_margin=0.5, keep_ticks=4):
+        """
+        :param memory_budget: bytes (estimated) of materialized vectors to keep around.
+        :param prefetch_margin: also materialize chunks within this fraction of the requested bbox's size.
+        :param keep_ticks: chunks used in the last few requests are never evicted (e.g. visible in the other window).
+        """
+        self._file = ChunkedBoardFile(filename)
+        self._budget = memory_budget
+        self._margin = prefetch_margin
+        self._keep_ticks = keep_ticks
+        self._resident = {}  # chunk index: list of vectors
+        self._last_used = {}  # chunk index: tick
+        self._tick = 0
+        self._mem_used = 0
+        self._detached = set()  # ids of vectors taken out of the chunks (deleted/moved), never re-materialized.
+
+    def _chunk_cost(self, index):
+        chunk = self._file.chunks[index]
+        return chunk['n_points'] * 16 + chunk['n_vectors'] * _VECTOR_OVERHEAD_BYTES
+
+    def _materialize(self, index):
+        vectors = self._file.read_chunk(index)
+        if self._detached:
+            vectors = [v for v in vectors if v.id not in self._detached]
+        self._resident[index] = vectors
+        self._mem_used += self._chunk_cost(index)
+
+    def _evict(self):
+        old = sorted((tick, index) for index, tick in self._last_used.items()
+                     if index in self._resident and tick < self._tick - self._keep_ticks)
+        for _, index in old:
+            if self._mem_used <= self._budget:
+                break
+            del self._resident[index]
+            self._mem_used -= self._chunk_cost(index)
+
+    def get_vectors_in(self, bbox, prefetch=True):
+        """
+        Return the materialized vectors of chunks intersecting the bbox, loading more if needed.
+        :param prefetch: also load (but don't return) the chunks in the margin around the bbox.
+        """
+        self._tick += 1
+        visible = self._file.chunks_in(bbox)
+        wanted = visible
+        if prefetch and self._margin > 0:
+            dx = (bbox['x'][1] - bbox['x'][0]) * self._margin
+            dy = (bbox['y'][1] - bbox['y'][0]) * self._margin
+            wanted = self._file.chunks_in({'x': (bbox['x'][0] - dx, bbox['x'][1] + dx),
+                                           'y': (bbox['y'][0] - dy, bbox['y'][1] + dy)})
+        for index in wanted:
+            if index not in self._resident:
+                _CHUNK_MISSES.inc()
+                self._materialize(index)
+            else:
+                _CHUNK_HITS.inc()
+            self._last_used[index] = self._tick
+        if self._mem_used > self._budget:
+            self._evict()
+
+        return [vector for index in visible for vector in self._resident[index]
+                if bboxes_intersect(vector.get_bbox(), bbox)]
+
+    def detach(self, vector_id):
+        """
+        Take the vector out of its chunk (it's being deleted or replaced by the VectorManager), it won't be
+        materialized again.
+        :returns: the vector if it was materialized, else None
+        """
+        self._detached.add(vector_id)
+        for vectors in self._resident.values():
+            for i, vector in enumerate(vectors):
+                if vector.id == vector_id:
+                    del vectors[i]
+                    return vector
+        return None
+
+    def iter_all(self):
+        """
+        All (non-detached) vectors, chunk by chunk, without keeping them resident.
+        """
+        for index in range(len(self._file.chunks)):
+            vectors = self._resident[index] if index in self._resident else self._file.read_chunk(index)
+            for vector in vectors:
+                if vector.id not in self._detached:
+                    yield vector
+
+    def read_deleted(self):
+        return self._file.read_deleted()
+
+    def snapshot(self, in_memory):
+        """
+        :param in_memory: the VectorManager's vectors that aren't in the file
+        :returns: ChunkSnapshot
+        """
+        return ChunkSnapshot(self._file, set(self._detached), list(in_memory))
+
+    def get_memory_used(self):
+        return self._mem_used
+
+    def close(self):
+        self._resident = {}
+        self._file.close()
@@ -0,0 +1,179 @@
+"""
+Display backends:  where windows are shown and where mouse/key events come from.
+
+OpenCVBackend is the real thing (cv2 HighGUI windows).  HeadlessBackend needs no display:  frames are kept in memory,
+mouse & key events are injected ahead of time, each at a time on a virtual clock, and delivered by wait_key() as
+the clock reaches them (the way cv2.waitKey() runs mouse callbacks).  The virtual clock advances by the waits, plus
+(by default) the real time spent working in between, so timings measured on it (e.g. latency) still reflect the
+cost of rendering.
+"""
+import heapq
+import itertools
+import time
+from abc import ABC, abstractmethod
+import cv2
+
+NO_KEY = -1  # (as cv2.waitKey)
+
+
+class DisplayBackend(ABC):
+    @abstractmethod
+    def create_window(self, title, size, mouse_callback, param=None):
+        """
+        :param size: (width, height)
+        :param mouse_callback: function(event, x, y, flags, param), as for cv2.setMouseCallback
+        """
+        pass
+
+    @abstractmethod
+    def show(self, title, frame):
+        pass
+
+    @abstractmethod
+    def wait_key(self, delay_ms=1):
+        """
+        Handle events (mouse callbacks are called from here) for delay_ms.
+        :returns: key code, or NO_KEY
+        """
+        pass
+
+    @abstractmethod
+    def destroy_window(self, title):
+        pass
+
+    @abstractmethod
+    def destroy_all(self):
+        pass
+
+    def time(self):
+        """
+        :returns: seconds, the clock events are timed on
+        """
+        return time.perf_counter()
+
+
+class OpenCVBackend(DisplayBackend):
+    def create_window(self, title, size, mouse_callback, param=None):
+        cv2.namedWindow(title)
+        cv2.resizeWindow(title, size[0], size[1])
+        cv2.setMouseCallback(title, mouse_callback, param=param)
+
+    def show(self, title, frame):
+        cv2.imshow(title, frame)
+
+    def wait_key(self, delay_ms=1):
+        return cv2.waitKey(delay_ms)
+
+    def destroy_window(self, title):
+        cv2.destroyWindow(title)
+
+    def destroy_all(self):
+        cv2.destroyAllWindows()
+
+
+class HeadlessBackend(DisplayBackend):
+    """
+    Inject events with inject_mouse()/inject_key(), read what was shown with get_frame().
+    """
+
+    def __init__(self, count_work_time=True, max_time=None, quit_key=27, realtime=False, skip_idle=False):
+        """
+        :param count_work_time: advance the virtual clock by the real time between calls too, (else only waits
+            move it, and everything else takes no time)
+        :param max_time: wait_key() returns quit_key once the clock gets here, (so the app's loop ends), or None
+        :param realtime: really sleep through waits, so events arrive at their times on the wall clock too
+        :param skip_idle: when wait_key() has nothing to deliver, jump the clock to the next event (flat out)
+        """
+        self._realtime = realtime
+        self._skip_idle = skip_idle
+        self._t = 0.
+        self._work_clock = time.perf_counter if count_work_time else None
+        self._t_work = self._work_clock() if count_work_time else None
+        self._max_time = max_time
+        self._quit_key = quit_key
+        self._windows = {}  # title: (size, mouse callback, param)
+        self._frames = {}  # title: last frame shown
+        self._n_shown = {}  # title: number of frames shown
+        self._show_callbacks = []
+        self._events = []  # heap of (t, seq, kind, args)
+        self._seq = itertools.count()
+
+    def time(self):
+        if self._work_clock is not None:
+            t = self._work_clock()
+            self._t += t - self._t_work
+            self._t_work = t
+        return self._t
+
+    def create_window(self, title, size, mouse_callback, param=None):
+        self._windows[title] = (size, mouse_callback, param)
+
+    def show(self, title, frame):
+        self._frames[title] = frame
+        self._n_shown[title] = self._n_shown.get(title, 0) + 1
+        for callback in self._show_callbacks:
+            callback(title, frame)
+
+    def add_show_callback(self, callback):
+        """
+        :param callback: function(title, frame) called with every frame shown, (e.g. to save or stream them)
+        """
+        self._show_callbacks.append(callback)
+
+    def get_frame(self, title):
+        """
+        :returns: the last frame shown in the window, or None
+        """
+        return self._frames.get(title)
+
+    def get_n_shown(self, title):
+        return self._n_shown.get(title, 0)
+
+    def inject_mouse(self, title, event, x, y, flags=0, t=None):
+        """
+        :param event: cv2.EVENT_...
+        :param t: virtual time to deliver it at, (default:  the next wait_key())
+        """
+        self._push(t, 'mouse', (title, event, x, y, flags))
+
+    def inject_key(self, key, t=None):
+        """
+        :param key: key code, e.g. ord('q')
+        """
+        self._push(t, 'key', key)
+
+    def _push(self, t, kind, args):
+        heapq.heappush(self._events, (self.time() if t is None else t, next(self._seq), kind, args))
+
+    def get_n_pending(self):
+        return len(self._events)
+
+    def wait_key(self, delay_ms=1):
+        """
+        Advance the clock by delay_ms, delivering the mouse events due (in order) until a key is due.
+        """
+        t_end = self.time() + max(delay_ms, 1) / 1000.
+        if self._skip_idle and self._events and self._events[0][0] > t_end:
+            t_end = self._events[0][0]
+        if self._realtime:
+            time.sleep(max(0., t_end - self.time()))
+        while self._events and self._events[0][0] <= t_end:
+            t, _, kind, args = heapq.heappop(self._events)
+            self._t = max(self._t, t)
+            if kind == 'key':
+                return args
+            title, event, x, y, flags = args
+            if title in self._windows:
+                _, mouse_callback, param = self._windows[title]
+                mouse_callback(event, x, y, flags, param)
+            self.time()  # (the callback's work)
+        self._t = max(self._t, t_end)
+        if self._max_time is not None and self._t >= self._max_time:
+            return self._quit_key
+        return NO_KEY
+
+    def destroy_window(self, title):
+        self._windows.pop(title, None)
+
+    def destroy_all(self):
+        self._windows = {}
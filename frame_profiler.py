@@ -0,0 +1,119 @@
+"""
+Time each stage of a window's refresh (and its mouse event handling), keep the last few hundred timings of each in
+ring buffers, and draw their percentiles over the frame (the HUD).
+
+A window without a profiler (the default) doesn't time anything, see UIWindow.set_profiling().
+"""
+import time
+import cv2
+import numpy as np
+
+STAGES = ('blank', 'grid', 'vectors', 'controls', 'tools', 'callbacks', 'hud', 'imshow')
+MOUSE = 'mouse'  # (mouse events are timed separately, they don't happen once per frame)
+PERCENTILES = (50, 95, 99)
+
+_HUD_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_HUD_SCALE = 0.4
+_HUD_LINE_HEIGHT = 15
+_HUD_MARGIN = 6
+
+
+class RingBuffer(object):
+    """
+    The last n values added.
+    """
+
+    def __init__(self, n):
+        self._values = np.zeros(n)
+        self._n = 0  # values added so far
+
+    def add(self, value):
+        self._values[self._n % len(self._values)] = value
+        self._n += 1
+
+    def get_values(self):
+        return self._values[:min(self._n, len(self._values))]
+
+    def __len__(self):
+        return min(self._n, len(self._values))
+
+
+class FrameProfiler(object):
+    """
+    Call start_frame(), then mark(stage) as each stage of the frame is done, then end_frame().
+    """
+
+    def __init__(self, n_frames=300, hud_update_interval=15):
+        """
+        :param n_frames: timings kept per stage
+        :param hud_update_interval: frames between updates of the HUD's numbers
+        """
+        self._rings = {stage: RingBuffer(n_frames) for stage in STAGES + (MOUSE, 'frame')}
+        self._t_frame = None
+        self._t_last = None
+        self._counts = {}  # vector counts of the last frame, see VectorManager.render
+        self._hud_update_interval = hud_update_interval
+        self._n_frames = 0
+        self._hud_lines = None
+
+    def start_frame(self):
+        self._t_frame = self._t_last = time.perf_counter()
+
+    def mark(self, stage):
+        """
+        The stage is done, (its time is since the previous mark).
+        """
+        t = time.perf_counter()
+        self._rings[stage].add((t - self._t_last) * 1000.)
+        self._t_last = t
+
+    def end_frame(self):
+        self._rings['frame'].add((time.perf_counter() - self._t_frame) * 1000.)
+        self._n_frames += 1
+
+    def add_time(self, stage, ms):
+        self._rings[stage].add(ms)
+
+    def get_counts(self):
+        """
+        :returns: dict for VectorManager.render to fill in (counts of the current frame's vectors)
+        """
+        return self._counts
+
+    def get_stats(self):
+        """
+        :returns: dict, stage name: {'n': number of timings, 'p50': ms, 'p95': ms, 'p99': ms}, for the stages
+            with any timings (and 'frame', the whole refresh)
+        """
+        stats = {}
+        for stage, ring in self._rings.items():
+            if len(ring):
+                values = np.percentile(ring.get_values(), PERCENTILES)
+                stats[stage] = dict(n=len(ring), **{'p%i' % p: float(v) for p, v in zip(PERCENTILES, values)})
+        return stats
+
+    def _get_hud_lines(self):
+        if self._hud_lines is None or self._n_frames % self._hud_update_interval == 0:
+            stats = self.get_stats()
+            lines = ["%-9s %6s %6s %6s" % (('ms',) + tuple('p%i' % p for p in PERCENTILES))]
+            for stage in STAGES + (MOUSE, 'frame'):
+                if stage in stats:
+                    lines.append("%-9s %6.2f %6.2f %6.2f" % ((stage,) + tuple(stats[stage]['p%i' % p]
+                                                                            for p in PERCENTILES)))
+            self._hud_lines = lines
+        counts = self._counts
+        return self._hud_lines + ["vectors %i:  drawn %i, culled %i, in progress %i" % (
+            counts.get('vectors', 0), counts.get('drawn', 0), counts.get('culled', 0), counts.get('in_progress', 0))]
+
+    def draw_hud(self, frame):
+        """
+        Draw the timings & vector counts in the upper left corner of the frame, (on a darkened background).
+        """
+        lines = self._get_hud_lines()
+        width = max(cv2.getTextSize(line, _HUD_FONT, _HUD_SCALE, 1)[0][0] for line in lines) + 2 * _HUD_MARGIN
+        height = len(lines) * _HUD_LINE_HEIGHT + 2 * _HUD_MARGIN
+        box = frame[:height, :width]
+        box[...] = box // 3
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (_HUD_MARGIN, _HUD_MARGIN + (i + 1) * _HUD_LINE_HEIGHT - 4), _HUD_FONT,
+                        _HUD_SCALE, (255, 255, 255), 1, cv2.LINE_AA)
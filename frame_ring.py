@@ -0,0 +1,198 @@
+"""
+Publish frames into a shared-memory ring buffer, so other processes on the host (streaming/recording software)
+can read them as numpy arrays, without copies or sockets.
+
+Layout of the shared memory block:
+    header:  magic (8 bytes), version, n_slots, height, width, channels (uint32 each), latest frame index (uint64)
+    n_slots x slot:
+        slot header:  frame index (uint64), frame index again (uint64, written last), content index (uint64),
+                      size in bytes (uint64), timestamp (float64, time.time()), dirty (uint8), padding to 64 bytes
+        frame:  height x width x channels uint8
+
+Frame i goes in slot i % n_slots.  The writer sets the slot's first index field to i, writes the frame, then the
+second index field, so a reader can tell a slot being overwritten (the two differ, or changed while reading,
+see FrameRingReader.is_valid).  A frame identical to the previous one isn't copied:  the latest slot just gets
+the new index and timestamp, with dirty = 0.  The content index is the frame the slot's pixels were written for,
+so the slot holds every frame from the content index to its frame index, and a reader that missed the dirty
+frame still sees that the content changed since the last frame it read.
+"""
+import os
+import struct
+import sys
+import time
+import cv2
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+_MAGIC = b'WBFRAMES'
+_VERSION = 2
+_HEADER = struct.Struct('<8s5IQ')
+_SLOT_HEADER = struct.Struct('<QQQQdB')
+_SLOT_HEADER_SIZE = 64
+_CREATED_HERE = set()  # shared memory names created by this process
+
+
+def _slot_offset(slot, frame_bytes):
+    return _HEADER.size + slot * (_SLOT_HEADER_SIZE + frame_bytes)
+
+
+class FrameRing(object):
+    """
+    Writer side, (e.g. add publish() as a UIWindow frame callback).
+    """
+
+    def __init__(self, name, frame_shape, n_slots=4):
+        """
+        :param name: shared memory name, for readers
+        :param frame_shape: (height, width, channels)
+        :param n_slots: frames kept, readers must keep up to within n_slots - 1 frames
+        """
+        self._shape = tuple(frame_shape)
+        self._n_slots = n_slots
+        self._frame_bytes = int(np.prod(self._shape))
+        size = _slot_offset(n_slots, self._frame_bytes)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _CREATED_HERE.add(self._shm._name)
+        self._buf = self._shm.buf
+        self._frames = [np.ndarray(self._shape, dtype=np.uint8, buffer=self._buf,
+                                   offset=_slot_offset(slot, self._frame_bytes) + _SLOT_HEADER_SIZE)
+                        for slot in range(n_slots)]
+        self._index = 0  # frames published so far
+        self._slot = None  # slot of the latest frame
+        self._content_index = 0  # frame the latest slot's pixels were written for
+        _HEADER.pack_into(self._buf, 0, _MAGIC, _VERSION, n_slots, *self._shape, 0)
+
+    def get_name(self):
+        return self._shm.name
+
+    def publish(self, frame, dirty=None):
+        """
+        :param frame: image of frame_shape
+        :param dirty: whether it changed since the last frame, None to compare
+        """
+        if dirty is None:
+            dirty = self._slot is None or not np.array_equal(self._frames[self._slot], frame)
+        self._index += 1
+        slot = self._slot if not dirty else self._index % self._n_slots
+        offset = _slot_offset(slot, self._frame_bytes)
+        if dirty:
+            struct.pack_into('<Q', self._buf, offset, self._index)  # (slot is being written)
+            self._frames[slot][...] = frame
+            self._content_index = self._index
+        _SLOT_HEADER.pack_into(self._buf, offset, self._index, self._index, self._content_index, self._frame_bytes,
+                               time.time(), 1 if dirty else 0)
+        struct.pack_into('<Q', self._buf, _HEADER.size - 8, self._index)
+        self._slot = slot
+
+    def close(self):
+        self._frames = None
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+        _CREATED_HERE.discard(self._shm._name)
+
+
+class FrameRingReader(object):
+    """
+    Reader side, frames are returned as views into the shared memory:  check is_valid() after using one (the
+    writer may have reused the slot meanwhile), or copy it.
+    """
+
+    def __init__(self, name):
+        self._shm = shared_memory.SharedMemory(name=name)
+        if sys.version_info < (3, 13) and self._shm._name not in _CREATED_HERE:
+            # (else the resource tracker unlinks it when this process exits)
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._buf = self._shm.buf
+        magic, version, self._n_slots, height, width, channels, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Shared memory %s isn't a (compatible) frame ring." % (name,))
+        self.frame_shape = (height, width, channels)
+        self._frame_bytes = height * width * channels
+
+    def get_latest_index(self):
+        return _HEADER.unpack_from(self._buf, 0)[-1]
+
+    def _find(self, index):
+        for slot in range(self._n_slots):
+            begin, end, content_index, size, timestamp, dirty = \
+                _SLOT_HEADER.unpack_from(self._buf, _slot_offset(slot, self._frame_bytes))
+            if begin == end and content_index <= index <= end:
+                # (an older frame of the slot has the same pixels, only the latest frame's timestamp is kept)
+                return slot, timestamp, index == content_index, content_index
+        return None
+
+    def read(self, index=None):
+        """
+        :param index: frame index, or None for the latest
+        :returns: (index, timestamp, dirty, frame view, content index), or None if that frame is gone (or not
+            written yet).  The content index is the frame the pixels were written for, it changes when the content
+            does, even if the dirty frame was missed.
+        """
+        index = self.get_latest_index() if index is None else index
+        found = self._find(index) if index > 0 else None
+        if found is None:
+            return None
+        slot, timestamp, dirty, content_index = found
+        frame = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self._buf,
+                           offset=_slot_offset(slot, self._frame_bytes) + _SLOT_HEADER_SIZE)
+        return index, timestamp, dirty, frame, content_index
+
+    def is_valid(self, index):
+        """
+        :returns: True if frame index is still intact, (check after reading it)
+        """
+        return self._find(index) is not None
+
+    def wait_next(self, last_index, timeout=1.0, poll_interval=0.001):
+        """
+        Wait for a frame newer than last_index.
+        :returns: as read(), or None on timeout
+        """
+        t_end = time.perf_counter() + timeout
+        while time.perf_counter() < t_end:
+            if self.get_latest_index() > last_index:
+                result = self.read()
+                if result is not None:
+                    return result
+            time.sleep(poll_interval)
+        return None
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+
+def dump_frames(name, out_dir, max_frames=None, timeout=5.0):
+    """
+    Reference consumer:  write every changed frame to out_dir/frame_<content index>.png until the writer stops.
+    :returns: number of frames written
+    """
+    reader = FrameRingReader(name)
+    os.makedirs(out_dir, exist_ok=True)
+    last_index, last_content_index, n_written = 0, 0, 0
+    try:
+        while max_frames is None or n_written < max_frames:
+            result = reader.wait_next(last_index, timeout=timeout)
+            if result is None:
+                break
+            index, _, _, frame, content_index = result
+            if index > last_index + 1:
+                print("Skipped %i frames." % (index - last_index - 1))
+            if content_index > last_content_index:  # (changed, even if the dirty frame itself was skipped)
+                image = frame.copy()
+                if reader.is_valid(index):
+                    cv2.imwrite(os.path.join(out_dir, 'frame_%08i.png' % content_index), image)
+                    n_written += 1
+                    last_content_index = content_index
+            last_index = index
+    finally:
+        reader.close()
+    return n_written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage:  python frame_ring.py <shared memory name> <output dir>")
+        sys.exit(1)
+    print("Wrote %i frames." % dump_frames(sys.argv[1], sys.argv[2]))
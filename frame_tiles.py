@@ -0,0 +1,104 @@
+"""
+Delta encoding of frames on a tile grid, so sharing costs (encoding & bandwidth) scale with what changed.
+
+Frames are compared to the previous one tile by tile, runs of changed tiles in a tile row are JPEG-encoded as
+one rectangle.  Keyframes (the whole frame) are sent periodically and whenever a viewer needs to (re)start.
+
+Message format (little-endian):
+    header:  seq (uint32), flags (uint8, 1 = keyframe), frame width, height, number of rects (uint16 each)
+    each rect:  x, y, w, h (uint16 each), JPEG length (uint32), JPEG bytes
+"""
+import struct
+import cv2
+import numpy as np
+
+_HEADER = struct.Struct('<IBHHH')
+_RECT = struct.Struct('<HHHHI')
+FLAG_KEYFRAME = 1
+
+
+def dirty_tiles(prev, frame, tile_size):
+    """
+    :param prev: previous frame (or None)
+    :param frame: HxWx3 uint8 image
+    :returns: n_tile_rows x n_tile_cols bool array, True where the tile changed (all, if the shape changed)
+    """
+    h, w = frame.shape[:2]
+    shape = (-(-h // tile_size), -(-w // tile_size))
+    if prev is None or prev.shape != frame.shape:
+        return np.ones(shape, dtype=bool)
+    changed = (prev != frame).any(axis=2)
+    padded = np.zeros((shape[0] * tile_size, shape[1] * tile_size), dtype=bool)
+    padded[:h, :w] = changed
+    return padded.reshape(shape[0], tile_size, shape[1], tile_size).any(axis=(1, 3))
+
+
+def dirty_rects(mask, tile_size, frame_shape):
+    """
+    Merge runs of dirty tiles in each tile row.
+    :returns: list of (x, y, w, h) pixel rectangles, clipped to the frame
+    """
+    h, w = frame_shape[:2]
+    rects = []
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    for row, start in zip(*np.nonzero(edges == 1)):
+        stop = start + np.argmax(edges[row, start:] == -1)
+        x, y = start * tile_size, row * tile_size
+        rects.append((int(x), int(y), int(min(stop * tile_size, w) - x), int(min(y + tile_size, h) - y)))
+    return rects
+
+
+def encode_delta(seq, frame, mask=None, tile_size=64, jpeg_quality=80):
+    """
+    :param seq: frame number
+    :param mask: from dirty_tiles, or None for a keyframe
+    :returns: message bytes
+    """
+    h, w = frame.shape[:2]
+    keyframe = mask is None
+    rects = [(0, 0, w, h)] if keyframe else dirty_rects(mask, tile_size, frame.shape)
+    parts = [_HEADER.pack(seq, FLAG_KEYFRAME if keyframe else 0, w, h, len(rects))]
+    for x, y, rect_w, rect_h in rects:
+        ok, jpeg = cv2.imencode('.jpg', frame[y:y + rect_h, x:x + rect_w], [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        parts.append(_RECT.pack(x, y, rect_w, rect_h, len(jpeg)))
+        parts.append(jpeg.tobytes())
+    return b''.join(parts)
+
+
+def read_header(msg):
+    """
+    :returns: seq, is_keyframe
+    """
+    seq, flags, _, _, _ = _HEADER.unpack_from(msg, 0)
+    return seq, bool(flags & FLAG_KEYFRAME)
+
+
+class TileDecoder(object):
+    """
+    Rebuilds frames from messages, (reference client, the share page does the same in javascript).
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.seq = None
+
+    def apply(self, msg):
+        """
+        :returns: the current frame, or None if still waiting for a keyframe
+        """
+        seq, flags, w, h, n_rects = _HEADER.unpack_from(msg, 0)
+        if flags & FLAG_KEYFRAME:
+            self.frame = np.zeros((h, w, 3), dtype=np.uint8)
+        if self.frame is None:
+            return None
+        pos = _HEADER.size
+        for _ in range(n_rects):
+            x, y, rect_w, rect_h, length = _RECT.unpack_from(msg, pos)
+            pos += _RECT.size
+            jpeg = np.frombuffer(msg, dtype=np.uint8, count=length, offset=pos)
+            self.frame[y:y + rect_h, x:x + rect_w] = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            pos += length
+        self.seq = seq
+        return self.frame
@@ -0,0 +1,254 @@
+"""
+Golden-image regression scenes:  canonical boards (saved in assets/golden/) seen through fixed BoardViews, rendered
+headlessly and compared with golden images within a tolerance.  Each view also has a frame-time budget, the median
+of repeated (warm) renders must stay under it.  A renderer change (batching, LOD, caching, tiling) is checked for
+looking the same and running fast enough in one run:
+
+    python golden_scenes.py                  # check every scene, exit status 1 on any failure
+    python golden_scenes.py --out diffs      # ... and write golden | rendered | difference images of failures
+    python golden_scenes.py --update         # re-save the boards & golden images (after a deliberate change)
+
+Boards are loaded from the saved files (not rebuilt), so a scene stays the same even if its generator changes.
+Budgets are about twice the times measured when the golden images were made, scale them for slower machines
+with --budget-scale.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from benchmark import make_board
+from board_view import BoardView
+from layout import BOARD_LAYOUT, COLORS_BGR
+from util import get_bbox
+from vector_manager import VectorManager, BoardOps
+from vectors import PencilVec, LineVec, RectangleVec, CircleVec, TextVec
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'golden')
+VIEW_SIZE = BOARD_LAYOUT['win_size']  # (as the board window)
+PIXEL_TOL = 40  # channel values differing by more than this count as a different pixel
+MAX_DIFF_FRACTION = 0.001  # of the pixels may differ
+
+
+def _finished(vec, points):
+    vec._points = np.array(points, dtype=np.float64)
+    vec._bbox = get_bbox(vec._points)
+    vec.finalize()
+    return vec
+
+
+def _make_shapes():
+    """
+    One of every kind of vector, in several colors, thicknesses & text sizes, around (0, 0).
+    """
+    vectors = []
+    colors = ['black', 'red', 'green', 'blue', 'orange', 'purple']
+    for i, color in enumerate(colors):
+        thickness = i + 1
+        x = -400 + 150 * i
+        vectors.append(_finished(LineVec(color, thickness), [(x, -200), (x + 100, -120)]))
+        vectors.append(_finished(RectangleVec(color, thickness), [(x, -90), (x + 110, -10)]))
+        vectors.append(_finished(CircleVec(color, thickness), [(x + 50, 60), (x + 50 + 6 * (i + 2), 60)]))
+        t = np.linspace(0, 2 * np.pi, 60)
+        vectors.append(_finished(PencilVec(color, thickness),
+                                 np.stack([x + 10 * t + 15 * np.sin(3 * t), 150 + 25 * np.cos(2 * t)], axis=1)))
+        text = _finished(TextVec(color, text_size=8 + 4 * i), [(x, 230)])
+        text.add_letters("p(a|b) %i" % (i,))
+        vectors.append(text)
+    return vectors
+
+
+def _make_strokes():
+    return make_board(20000, 'lognormal', seed=1).get_all_vectors()
+
+
+def _make_long_strokes():
+    return make_board(50000, 'long', seed=2).get_all_vectors()
+
+
+class Scene(object):
+    """
+    A saved board and the views to render it in.
+    """
+
+    def __init__(self, name, make_vectors, views, board_ext='.npz', show_grid=False):
+        """
+        :param make_vectors: function() returning the board's vectors, (only used to save the board, see update)
+        :param views: dict, view name: (zoom, (x, y) board coords at the center or None, budget (ms)), a zoom of
+            None fits the whole board in the view
+        :param board_ext: format of the saved board (see vector_manager.write_board), '.wbc' is loaded lazily
+        :param show_grid: render the grid under the vectors
+        """
+        self.name = name
+        self.views = views
+        self.show_grid = show_grid
+        self._make_vectors = make_vectors
+        self._board_ext = board_ext
+
+    def get_board_file(self, golden_dir=GOLDEN_DIR):
+        return os.path.join(golden_dir, self.name + self._board_ext)
+
+    def get_image_file(self, view_name, golden_dir=GOLDEN_DIR):
+        return os.path.join(golden_dir, "%s_%s.png" % (self.name, view_name))
+
+    def save_board(self, golden_dir=GOLDEN_DIR):
+        vm = VectorManager()
+        vm.apply_op(BoardOps.add, self._make_vectors())
+        vm.save(self.get_board_file(golden_dir))
+
+    def load_board(self, golden_dir=GOLDEN_DIR):
+        return VectorManager(self.get_board_file(golden_dir))
+
+    def get_view(self, vm, view_name):
+        zoom, center, _ = self.views[view_name]
+        if zoom is None:
+            bboxes = [vec.get_bbox() for vec in vm.get_all_vectors()]
+            x_min, x_max = min(b['x'][0] for b in bboxes), max(b['x'][1] for b in bboxes)
+            y_min, y_max = min(b['y'][0] for b in bboxes), max(b['y'][1] for b in bboxes)
+            zoom = 0.95 * min(VIEW_SIZE[0] / (x_max - x_min), VIEW_SIZE[1] / (y_max - y_min))
+            center = ((x_max + x_min) / 2, (y_max + y_min) / 2)
+        center = np.zeros(2) if center is None else np.array(center, dtype=np.float64)
+        return BoardView(BOARD_LAYOUT['win_name'], VIEW_SIZE, center - np.array(VIEW_SIZE) / 2. / zoom, zoom)
+
+
+SCENES = {scene.name: scene for scene in [
+    Scene('shapes', _make_shapes, {'1x': (1.0, None, 25.),
+                                   '4x': (4.0, (-340, -50), 15.),
+                                   'zoomed_out': (0.25, None, 20.)}, show_grid=True),
+    Scene('strokes', _make_strokes, {'fit': (None, None, 100.),
+                                     '1x': (1.0, None, 20.),
+                                     '4x': (4.0, (100, 50), 15.)}),
+    Scene('long_strokes_chunked', _make_long_strokes, {'fit': (None, None, 200.),
+                                                       '2x': (2.0, (-300, 200), 15.)}, board_ext='.wbc')]}
+
+
+def render(vm, view, show_grid=False):
+    """
+    Draw the board as the board window does, (background, grid, vectors).
+    """
+    bkg_color_v = COLORS_BGR[BOARD_LAYOUT['bkg_color']]
+    frame = np.zeros((view.size[1], view.size[0], 3), dtype=np.uint8) + np.array(bkg_color_v, dtype=np.uint8)
+    if show_grid:
+        view.render_grid(frame, line_color_v=COLORS_BGR[BOARD_LAYOUT['obj_color']], bkg_color_v=bkg_color_v)
+    vm.render(frame, view)
+    return frame
+
+
+def compare_images(image, golden, pixel_tol=PIXEL_TOL, max_diff_fraction=MAX_DIFF_FRACTION):
+    """
+    :returns: dict(ok, diff_fraction (of pixels differing by more than pixel_tol in any channel), max_abs_diff,
+        mean_abs_diff, diff (image of the absolute differences))
+    """
+    if golden is None or image.shape != golden.shape:
+        return {'ok': False, 'diff_fraction': 1., 'max_abs_diff': None, 'mean_abs_diff': None, 'diff': None}
+    diff = cv2.absdiff(image, golden)
+    diff_fraction = float(np.mean(diff.max(axis=2) > pixel_tol))
+    return {'ok': diff_fraction <= max_diff_fraction, 'diff_fraction': diff_fraction,
+            'max_abs_diff': int(diff.max()), 'mean_abs_diff': float(diff.mean()), 'diff': diff}
+
+
+def time_render(vm, view, show_grid=False, repeat=10):
+    """
+    :returns: dict, 'first_ms' (cold, e.g. filling caches, loading chunks), then the 'median_ms', 'p95_ms' and
+        'max_ms' of repeat more
+    """
+    t_start = time.perf_counter()
+    render(vm, view, show_grid)
+    first_ms = (time.perf_counter() - t_start) * 1000.
+    times = []
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        render(vm, view, show_grid)
+        times.append((time.perf_counter() - t_start) * 1000.)
+    return {'first_ms': first_ms, 'median_ms': float(np.median(times)), 'p95_ms': float(np.percentile(times, 95)),
+            'max_ms': float(np.max(times))}
+
+
+def _write_failure(out_dir, scene, view_name, image, golden, diff):
+    os.makedirs(out_dir, exist_ok=True)
+    panels = [image] if golden is None or golden.shape != image.shape else [golden, image, 255 - diff]
+    filename = os.path.join(out_dir, "%s_%s_failed.png" % (scene.name, view_name))
+    cv2.imwrite(filename, np.hstack(panels))
+    return filename
+
+
+def check_scenes(names=None, golden_dir=GOLDEN_DIR, repeat=10, budget_scale=1., out_dir=None, check_time=True):
+    """
+    Render every view of the scenes, compare with the golden images and time them.
+    :param names: scenes to check, (default all)
+    :param budget_scale: multiply the frame-time budgets by this
+    :param out_dir: write golden | rendered | difference images of views that don't match here, or None
+    :param check_time: fail views over budget, (else only report the times)
+    :returns: list of dicts, one per view:  scene, view, ok, image_ok, diff_fraction, max_abs_diff, mean_abs_diff,
+        time_ok, budget_ms, and the times (see time_render)
+    """
+    results = []
+    for name in names if names is not None else SCENES:
+        scene = SCENES[name]
+        vm = scene.load_board(golden_dir)
+        for view_name in scene.views:
+            view = scene.get_view(vm, view_name)
+            times = time_render(vm, view, scene.show_grid, repeat)
+            image = render(vm, view, scene.show_grid)
+            golden = cv2.imread(scene.get_image_file(view_name, golden_dir))
+            comparison = compare_images(image, golden)
+            budget_ms = scene.views[view_name][2] * budget_scale
+            result = {'scene': name, 'view': view_name, 'image_ok': comparison['ok'],
+                      'time_ok': times['median_ms'] <= budget_ms or not check_time, 'budget_ms': budget_ms}
+            result['ok'] = result['image_ok'] and result['time_ok']
+            result.update({key: comparison[key] for key in ('diff_fraction', 'max_abs_diff', 'mean_abs_diff')})
+            result.update(times)
+            if not comparison['ok'] and out_dir is not None:
+                result['failure_image'] = _write_failure(out_dir, scene, view_name, image, golden,
+                                                         comparison['diff'])
+            results.append(result)
+    return results
+
+
+def update_goldens(names=None, golden_dir=GOLDEN_DIR):
+    """
+    Save the scenes' boards and render their golden images (from the saved boards, as they're checked).
+    """
+    os.makedirs(golden_dir, exist_ok=True)
+    for name in names if names is not None else SCENES:
+        scene = SCENES[name]
+        scene.save_board(golden_dir)
+        vm = scene.load_board(golden_dir)
+        for view_name in scene.views:
+            cv2.imwrite(scene.get_image_file(view_name, golden_dir),
+                        render(vm, scene.get_view(vm, view_name), scene.show_grid))
+        logging.info("Saved golden scene %s (%i views)." % (name, len(scene.views)))
+
+
+def print_results(results):
+    print("%-22s %-11s %-6s %9s %9s %9s %9s" % ('scene', 'view', 'image', 'diff %', 'median', 'budget', 'time'))
+    for r in results:
+        print("%-22s %-11s %-6s %9.4f %9.2f %9.2f %9s" % (r['scene'], r['view'], 'ok' if r['image_ok'] else 'FAIL',
+                                                          100. * r['diff_fraction'], r['median_ms'], r['budget_ms'],
+                                                          'ok' if r['time_ok'] else 'OVER'))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Check rendering against golden images & frame-time budgets.")
+    parser.add_argument('--scenes', default=None, help="comma-separated scene names (default all)")
+    parser.add_argument('--update', action='store_true', help="re-save the boards & golden images")
+    parser.add_argument('--repeat', type=int, default=20, help="timed renders per view")
+    parser.add_argument('--budget-scale', type=float, default=1., help="multiply the budgets by this")
+    parser.add_argument('--out', default=None, help="write images of failed views to this directory")
+    parser.add_argument('--golden-dir', default=GOLDEN_DIR)
+    parsed = parser.parse_args(args)
+    names = parsed.scenes.split(',') if parsed.scenes else None
+
+    if parsed.update:
+        update_goldens(names, parsed.golden_dir)
+        return 0
+    results = check_scenes(names, parsed.golden_dir, parsed.repeat, parsed.budget_scale, parsed.out)
+    print_results(results)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Undo/redo.  Changes to the board are recorded as reversible commands holding just the vectors involved
+(finished vectors are never changed in place, so old versions can be shared, not copied).
+"""
+import logging
+import time
+from abc import ABC, abstractmethod
+from vector_manager import BoardOps
+
+# Rough cost of keeping a vector around, in addition to its points.
+_VECTOR_OVERHEAD_BYTES = 500
+
+
+def _vectors_bytes(vectors):
+    return sum(len(vector._points) * 16 + _VECTOR_OVERHEAD_BYTES for vector in vectors)
+
+
+class Command(ABC):
+    """
+    A reversible change to the board.
+    """
+
+    def __init__(self, vectors, old_vectors=None):
+        """
+        :param vectors: vectors added/deleted/cleared, or the new versions of moved/restyled vectors
+        :param old_vectors: the versions the new ones replaced
+        """
+        self.t = time.perf_counter()
+        self._vectors = vectors
+        self._old_vectors = old_vectors
+
+    @abstractmethod
+    def undo(self, vector_manager):
+        pass
+
+    @abstractmethod
+    def redo(self, vector_manager):
+        pass
+
+    def n_bytes(self):
+        """
+        Estimated memory held by the command.
+        """
+        return _vectors_bytes(self._vectors) + _vectors_bytes(self._old_vectors or [])
+
+    def applied(self, op, vectors):
+        """
+        An op from this command's undo/redo was applied.
+        :param vectors: as passed to the op callbacks
+        """
+        pass
+
+    def coalesce(self, other):
+        """
+        Absorb a command that happened right after this one, if it makes sense to undo them together.
+        :returns: True if other was absorbed
+        """
+        return False
+
+
+class AddCommand(Command):
+    def undo(self, vector_manager):
+        vector_manager.apply_op(BoardOps.delete, ids=[vector.id for vector in self._vectors])
+
+    def redo(self, vector_manager):
+        vector_manager.apply_op(BoardOps.add, vectors=list(self._vectors))
+
+
+class DeleteCommand(AddCommand):
+    def undo(self, vector_manager):
+        super().redo(vector_manager)
+
+    def redo(self, vector_manager):
+        super().undo(vector_manager)
+
+
+class MoveCommand(Command):
+    _OP = BoardOps.move
+
+    def undo(self, vector_manager):
+        vector_manager.apply_op(self._OP, vectors=self._old_vectors)
+
+    def redo(self, vector_manager):
+        vector_manager.apply_op(self._OP, vectors=self._vectors)
+
+    def coalesce(self, other):
+        # e.g. dragging a selection or a thickness dial:  same vectors changed again.
+        if type(other) != type(self) or {v.id for v in other._vectors} != {v.id for v in self._vectors}:
+            return False
+        self._vectors = other._vectors
+        return True
+
+
+class RestyleCommand(MoveCommand):
+    _OP = BoardOps.restyle
+
+
+class ClearCommand(Command):
+    """
+    Holds the cleared vectors themselves (not copies), undo puts them back, redo clears whatever is there then.
+    Undoing is an ordinary add op of the whole board, so it costs as much as adding the vectors:  O(N) for the
+    list copy and for every op callback (a full-board journal record, sync op, ...).
+    """
+
+    def undo(self, vector_manager):
+        vector_manager.apply_op(BoardOps.add, vectors=self._vectors)
+
+    def redo(self, vector_manager):
+        vector_manager.apply_op(BoardOps.clear)
+
+    def applied(self, op, vectors):
+        if op == BoardOps.clear:
+            self._vectors = vectors
+
+
+_COMMANDS = {BoardOps.add: AddCommand,
+             BoardOps.delete: DeleteCommand,
+             BoardOps.move: MoveCommand,
+             BoardOps.restyle: RestyleCommand,
+             BoardOps.clear: ClearCommand}
+
+
+class History(object):
+    """
+    Records the VectorManager's ops as commands on an undo stack.
+    """
+
+    def __init__(self, vector_manager, max_bytes=64 * 2**20, max_commands=1000, coalesce_window=0.5):
+        """
+        :param max_bytes: (estimated) memory limit, oldest commands are forgotten first.
+        :param max_commands: limit on the number of undo steps.
+        :param coalesce_window: ops of the same kind less than this many seconds apart are undone together.
+        """
+        self._vm = vector_manager
+        self._max_bytes = max_bytes
+        self._max_commands = max_commands
+        self._coalesce_window = coalesce_window
+        self._undo_stack = []
+        self._redo_stack = []
+        self._n_bytes = 0
+        self._applying = None  # command being undone/redone, (its ops aren't recorded)
+        self._vm.add_op_callback(self._on_op)
+
+    def _on_op(self, op, vectors, old_vectors):
+        if self._applying is not None:
+            self._applying.applied(op, vectors)
+            return
+        if self._vm.is_applying_remote() or self._vm.is_applying_loaded():
+            return  # (only undo changes made here)
+        self._redo_stack = []
+        command = _COMMANDS[op](vectors, old_vectors)
+        if self._undo_stack:
+            last = self._undo_stack[-1]
+            if command.t - last.t < self._coalesce_window:
+                self._n_bytes -= last.n_bytes()
+                coalesced = last.coalesce(command)
+                last.t = command.t
+                self._n_bytes += last.n_bytes()
+                if coalesced:
+                    return
+        self._undo_stack.append(command)
+        self._n_bytes += command.n_bytes()
+        self._enforce_limits()
+
+    def _enforce_limits(self):
+        n_dropped = 0
+        while len(self._undo_stack) > 1 and (self._n_bytes > self._max_bytes or
+                                             len(self._undo_stack) > self._max_commands):
+            self._n_bytes -= self._undo_stack.pop(0).n_bytes()
+            n_dropped += 1
+        if n_dropped:
+            logging.info("Undo history full, forgot the oldest %i change(s)." % n_dropped)
+
+    def _apply(self, command, undo):
+        self._applying = command
+        try:
+            command.undo(self._vm) if undo else command.redo(self._vm)
+        finally:
+            self._applying = None
+
+    def undo(self, *_):
+        """
+        :returns: True if something was undone.
+        """
+        if not self._undo_stack:
+            return False
+        command = self._undo_stack.pop()
+        self._n_bytes -= command.n_bytes()
+        self._apply(command, undo=True)
+        self._redo_stack.append(command)
+        return True
+
+    def redo(self, *_):
+        if not self._redo_stack:
+            return False
+        command = self._redo_stack.pop()
+        self._apply(command, undo=False)
+        command.t = 0.  # never coalesce with what comes next
+        self._undo_stack.append(command)
+        self._n_bytes += command.n_bytes()
+        self._enforce_limits()
+        return True
+
+    def can_undo(self):
+        return len(self._undo_stack) > 0
+
+    def can_redo(self):
+        return len(self._redo_stack) > 0
+
+    def get_memory_used(self):
+        return self._n_bytes
@@ -7,18 +7,26 @@ from util import (in_bbox, get_circle_points, floats_to_fixed, PREC_BITS, transl
                   scale_points_to_bbox, PREC_SCALE, get_text_cursor_points)
 from abc import ABC, abstractmethod
 import json
+import os
+
+_SCRIBBLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'unit_scribble.json')
+_unit_scribble = None
 
 
 def load_scribble():
-    with open('assets/unit_scribble.json', 'r') as infile:
-        return np.array(json.load(infile))
+    """
+    The pencil icon's scribble, read the first time it's needed (next to this file, wherever the app is run from).
+    """
+    global _unit_scribble
+    if _unit_scribble is None:
+        with open(_SCRIBBLE_FILE, 'r') as infile:
+            _unit_scribble = np.array(json.load(infile))
+    return _unit_scribble
 
 
 CTRL_PT_COLORS_BGR = {'outer': COLORS_BGR['black'],
                       'inner': COLORS_BGR['white']}
 
-UNIT_SCRIBBLE_COORDS = load_scribble()
-
 
 class IconArtist(Renderable, ABC):
     """
@@ -297,7 +305,7 @@ class PencilToolIcon(CircleToolIcon):
     def _set_geom(self):
         # scale to unit square
 
-        points = UNIT_SCRIBBLE_COORDS
+        points = load_scribble()
         points = scale_points_to_bbox(points, self._bbox, margin_frac=self._margin_frac)
         self._lines = [floats_to_fixed(points)]
         self._ctrl_point1 = points[0]
@@ -0,0 +1,305 @@
+"""
+Write-ahead journal, so the board survives crashes without rewriting the whole board on every change.
+
+Every op the VectorManager reports (see BoardOps) is appended to <state_file>.journal as a binary record:
+
+    header:  payload length (uint32), crc32 of payload (uint32), op (uint8), time (float64), seq (uint64)
+    payload:
+        add, move, restyle:  board_file.encode_vectors(vectors)
+        delete:  int64 vector ids
+        clear:  (empty)
+
+(Undoing a delete is journaled as an add, etc., records describe the resulting change, not the user action.)
+Records are fsync-ed in batches.  When the journal gets big, a snapshot of the board is written to the state file
+on a background thread (with the seq of the last record it includes) and the old records are dropped.
+
+On startup, the snapshot is loaded and every record after its seq is replayed (or, if streaming, the records are
+folded into the snapshot as it loads in the background, see StreamingLoader).  A torn record at the end of the
+journal (crash mid-write) fails its crc check and is ignored along with anything after it.
+
+JSON board files can't record a journal position, so a JSON state file (board.json) is journaled as a binary one
+next to it (board.npz), converted from the JSON when that doesn't exist yet.  The JSON file is never written.
+"""
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from board_file import encode_vectors, decode_vectors, read_board_info, load_board
+from chunked_board import is_chunked_board
+from metrics import REGISTRY
+from streaming_load import StreamingLoader
+from vector_manager import BoardOps, write_board
+
+_RECORD_HEADER = struct.Struct('<IIBdQ')
+_SNAPSHOT_MS = REGISTRY.histogram('journal.snapshot_ms', "time to write a snapshot when compacting")
+
+
+def encode_op(op, vectors):
+    """
+    :returns: the record payload for the op
+    """
+    if op in (BoardOps.add, BoardOps.move, BoardOps.restyle):
+        return encode_vectors(vectors)
+    if op == BoardOps.delete:
+        return np.array([vector.id for vector in vectors], dtype=np.int64).tobytes()
+    return b''
+
+
+def decode_op(op, payload):
+    """
+    :returns: kwargs for VectorManager.apply_op
+    """
+    if op in (BoardOps.add, BoardOps.move, BoardOps.restyle):
+        return {'vectors': decode_vectors(payload)}
+    if op == BoardOps.delete:
+        return {'ids': np.frombuffer(payload, dtype=np.int64).tolist()}
+    return {}
+
+
+def _save_snapshot(state_file, vectors, deleted, seq):
+    """
+    Write the state file through a temporary file, so a crash leaves either the old or the new one.
+    """
+    root, ext = os.path.splitext(state_file)
+    temp_filename = root + '.snapshot_tmp' + ext  # keep the extension, it picks the format (see write_board)
+    write_board(temp_filename, vectors, deleted, journal_seq=seq)
+    with open(temp_filename, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_filename, state_file)
+
+
+def read_records(filename):
+    """
+    Iterate over the intact records in a journal file.
+    :returns: generator of (seq, t, op, payload)
+    """
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb') as f:
+        data = f.read()
+    pos = 0
+    while pos + _RECORD_HEADER.size <= len(data):
+        length, crc, op, t, seq = _RECORD_HEADER.unpack_from(data, pos)
+        start = pos + _RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logging.warning("Journal %s has a damaged record at byte %i, ignoring the rest." % (filename, pos))
+            return
+        yield seq, t, BoardOps(op), payload
+        pos = start + length
+
+
+class Journal(object):
+    """
+    Loads the board from the state file + journal, then journals every change to it.
+    """
+
+    def __init__(self, vector_manager, state_file, sync_every=64, sync_interval=1.0, compact_bytes=16 * 2**20,
+                 stream=False, view=None):
+        """
+        :param vector_manager: VectorManager (should be empty, the board is loaded from the state file & journal)
+        :param state_file: board snapshot filename (format by extension, see write_board, a .json file is converted
+            to .npz, see above), the journal is next to it
+        :param sync_every: fsync after this many records ...
+        :param sync_interval: ... or if this many seconds have passed since the first unsynced one.
+        :param compact_bytes: write a new snapshot when the journal gets bigger than this.
+        :param stream: load (binary) snapshots in the background, (tick() adds what's been loaded to the board).
+        :param view: BoardView, if streaming, load the vectors it sees first.
+        """
+        self._vm = vector_manager
+        if state_file.lower().endswith('.json'):
+            state_file = self._convert_json(state_file)
+        self._state_file = state_file
+        self._filename = state_file + '.journal'
+        self._old_filename = state_file + '.journal.old'  # being compacted
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._compact_bytes = compact_bytes
+
+        self._lock = threading.Lock()
+        self._compactor = None  # thread
+        self._n_unsynced = 0
+        self._t_first_unsynced = None
+        self._size = 0
+        self._loader = None  # StreamingLoader
+        self._load_error = None  # exception, if streaming the state file failed (then it's never compacted over)
+
+        self._seq = self._recover_streaming(view) if stream and os.path.exists(state_file) and \
+            read_board_info(state_file) is not None else self._recover()
+        self._file = open(self._filename, 'ab')
+        self._size = self._file.tell()
+        self._vm.add_op_callback(self._on_op)
+
+    def _convert_json(self, json_file):
+        """
+        :returns: the binary state file to journal a JSON one as, (written from the JSON if it doesn't exist)
+        """
+        state_file = os.path.splitext(json_file)[0] + '.npz'
+        if os.path.exists(json_file) and not os.path.exists(state_file):
+            vectors, deleted = load_board(json_file, self._vm._types)
+            _save_snapshot(state_file, vectors, deleted, 0)
+            logging.info("Converted %s to %s (%i vectors), journaling that." % (json_file, state_file, len(vectors)))
+        elif os.path.exists(json_file):
+            logging.info("Journaling %s as %s." % (json_file, state_file))
+        return state_file
+
+    def _recover(self):
+        """
+        Load the snapshot and replay the journal(s) on top of it.
+        :returns: seq of the last record
+        """
+        snapshot_seq = 0
+        if os.path.exists(self._state_file):
+            self._vm.load(self._state_file)
+            if is_chunked_board(self._state_file):
+                snapshot_seq = self._vm._lazy._file.journal_seq
+            else:
+                info = read_board_info(self._state_file)
+                snapshot_seq = info['journal_seq'] if info is not None else 0
+
+        last_seq, n_replayed = snapshot_seq, 0
+        for filename in [self._old_filename, self._filename]:
+            for seq, _, op, payload in read_records(filename):
+                if seq <= last_seq:
+                    continue
+                self._vm.apply_op(op, notify=False, **decode_op(op, payload))
+                last_seq = seq
+                n_replayed += 1
+        if n_replayed:
+            logging.info("Replayed %i journal records on top of %s." % (n_replayed, self._state_file))
+        return last_seq
+
+    def _recover_streaming(self, view):
+        """
+        Start loading the snapshot with the newer journal records in the background.
+        :returns: seq of the last record
+        """
+        last_seq = read_board_info(self._state_file)['journal_seq']
+        records = []
+        for filename in [self._old_filename, self._filename]:
+            for seq, _, op, payload in read_records(filename):
+                if seq > last_seq:
+                    records.append((op, payload))
+                    last_seq = seq
+
+        def _decode():
+            return [(op, decode_op(op, payload)) for op, payload in records]
+
+        self._loader = StreamingLoader(self._vm, self._state_file, view=view, records=_decode)
+        return last_seq
+
+    def is_loading(self):
+        return self._loader is not None
+
+    def _on_op(self, op, vectors, old_vectors):
+        if self._vm.is_applying_loaded():  # (the state file & journal being loaded have it already)
+            return
+        self.append(op, vectors)
+
+    def _finish_loading(self, wait=False):
+        """
+        Add what the StreamingLoader has loaded to the board, or everything if waiting.
+        :raises: its exception if loading failed, (the records keep being journaled, the state file is left alone)
+        """
+        try:
+            if wait:
+                self._loader.wait()
+            elif not self._loader.tick():
+                return
+        except Exception as e:
+            self._loader, self._load_error = None, e
+            raise
+        self._loader = None
+
+    def append(self, op, vectors):
+        payload = encode_op(op, vectors)
+        with self._lock:
+            self._seq += 1
+            self._file.write(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload), int(op), time.time(), self._seq))
+            self._file.write(payload)
+            self._size += _RECORD_HEADER.size + len(payload)
+            self._n_unsynced += 1
+            if self._t_first_unsynced is None:
+                self._t_first_unsynced = time.perf_counter()
+        self._sync_if_due()
+
+    def tick(self):
+        """
+        Call regularly (e.g. every frame), syncs/compacts if it's time.
+        :raises: the StreamingLoader's exception if loading the state file failed
+        """
+        if self._loader is not None:
+            self._finish_loading()
+        self._sync_if_due()
+
+    def _sync_if_due(self):
+        if self._n_unsynced > 0 and (self._n_unsynced >= self._sync_every or
+                                     time.perf_counter() - self._t_first_unsynced > self._sync_interval):
+            self.sync()
+        if self._size > self._compact_bytes and not self.is_compacting() and not self._vm.is_loading() and \
+                self._load_error is None:
+            self.compact()
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._n_unsynced = 0
+            self._t_first_unsynced = None
+
+    def is_compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def compact(self, wait=False):
+        """
+        Start writing a snapshot of the board on a background thread, then drop the journal records it includes.
+        The journal is rotated now, so new records go to a fresh file while the snapshot is written.
+        """
+        if self.is_compacting():
+            self._compactor.join()
+        if self._loader is not None:
+            self._finish_loading(wait=True)
+        if self._load_error is not None:
+            raise RuntimeError("Loading %s failed (%s), not compacting the partly loaded board over it."
+                               % (self._state_file, self._load_error))
+        self.sync()
+        with self._lock:
+            _, vectors, deleted = self._vm.get_snapshot()
+            seq = self._seq
+            self._file.close()
+            if os.path.exists(self._old_filename):  # (previous compaction didn't finish)
+                with open(self._old_filename, 'ab') as old, open(self._filename, 'rb') as new:
+                    old.write(new.read())
+                os.remove(self._filename)
+            else:
+                os.replace(self._filename, self._old_filename)
+            self._file = open(self._filename, 'ab')
+            self._size = 0
+
+        self._compactor = threading.Thread(target=self._write_snapshot, args=(vectors, deleted, seq), daemon=True)
+        self._compactor.start()
+        if wait:
+            self._compactor.join()
+
+    def _write_snapshot(self, vectors, deleted, seq):
+        t_start = time.perf_counter()
+        _save_snapshot(self._state_file, vectors, deleted, seq)
+        os.remove(self._old_filename)
+        _SNAPSHOT_MS.observe((time.perf_counter() - t_start) * 1000.)
+        logging.info("Compacted journal into %s (%i vectors) in %.3f sec." %
+                     (self._state_file, len(vectors), time.perf_counter() - t_start))
+
+    def close(self):
+        if self._loader is not None:
+            try:
+                self._finish_loading(wait=True)
+            except Exception:
+                pass  # (logged by the loader, the journal still has every record)
+        if self.is_compacting():
+            self._compactor.join()
+        self._vm.remove_op_callback(self._on_op)
+        self.sync()
+        self._file.close()
@@ -0,0 +1,75 @@
+"""
+Input-to-photon latency:  time from a mouse event's arrival (in UIWindow.cv2_mouse_event) to the first frame showing
+what it changed being handed to imshow (and to the frame callbacks, e.g. the share encoder).
+
+Each event a tool or control handled is tagged with the tool (or 'controls') and kept pending for its window.  The
+next refresh of that window includes everything the event changed (mouse callbacks run in cv2.waitKey(), between
+frames), so when that frame is presented every pending event's latency is recorded, per tool and per sink.
+"""
+import time
+import numpy as np
+from frame_profiler import RingBuffer, PERCENTILES
+from metrics import REGISTRY
+
+SINKS = ('imshow', 'callbacks')
+
+
+class LatencyTracker(object):
+    """
+    Shared by the windows, see UIWindow.set_latency_tracker().
+    """
+
+    def __init__(self, n_events=1000, registry=REGISTRY, time_fn=time.perf_counter):
+        """
+        :param n_events: latencies kept per tool & sink
+        :param registry: add a 'latency' gauge (get_stats()) to this metrics registry, or None
+        :param time_fn: clock, (inject a virtual one for tests)
+        """
+        self._n_events = n_events
+        self._time_fn = time_fn
+        self._pending = {}  # window name: list of (arrival time, tool name), not drawn yet
+        self._in_frame = {}  # window name: pending events included in the frame being drawn
+        self._rings = {}  # (tool name, sink): RingBuffer of latencies (ms)
+        if registry is not None:
+            registry.gauge('latency', "input-to-photon latency (ms) by tool & sink", fn=self.get_stats)
+
+    def now(self):
+        return self._time_fn()
+
+    def event_handled(self, win_name, t_arrival, tool_name):
+        """
+        A mouse event arriving at t_arrival changed something (tool_name's state, or a control's).
+        """
+        self._pending.setdefault(win_name, []).append((t_arrival, tool_name))
+
+    def start_frame(self, win_name):
+        """
+        The window is about to draw a frame, (it'll show the pending events).
+        """
+        self._in_frame[win_name] = self._pending.pop(win_name, [])
+
+    def frame_presented(self, win_name, sink='imshow'):
+        """
+        The frame was handed to the sink, record the latencies of the events it shows.
+        """
+        events = self._in_frame.get(win_name)
+        if not events:
+            return
+        t = self._time_fn()
+        for t_arrival, tool_name in events:
+            key = (tool_name, sink)
+            if key not in self._rings:
+                self._rings[key] = RingBuffer(self._n_events)
+            self._rings[key].add((t - t_arrival) * 1000.)
+
+    def get_stats(self):
+        """
+        :returns: dict, tool name: {sink: {'n': number of events, 'p50': ms, 'p95': ms, 'p99': ms, 'max': ms}}
+        """
+        stats = {}
+        for (tool_name, sink), ring in sorted(self._rings.items()):
+            values = ring.get_values()
+            percentiles = np.percentile(values, PERCENTILES)
+            stats.setdefault(tool_name, {})[sink] = dict(
+                n=len(ring), max=float(values.max()), **{'p%i' % p: float(v) for p, v in zip(PERCENTILES, percentiles)})
+        return stats
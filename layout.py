@@ -31,6 +31,7 @@ DEFAULT_ICON_MARGIN_FRAC = 0.35
 UI_LINE_THICKNESS = 2
 INIT_OPTIONS = {'show_grid': True,
                 'snap_to_grid': False,
+                'show_hud': False,  # profiler timings over the board, (toggle with 'p')
                 'color': 'black',
                 'thickness': 1,
                 'font_size': 12,}
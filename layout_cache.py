@@ -0,0 +1,102 @@
+"""
+Geometry computed at startup that only depends on layout.py (e.g. the sizes of slider labels), cached in a file so
+later starts skip computing it.
+
+Entries are JSON-able values computed on first use (see LayoutCache.get) and written by save().  The file is keyed by
+a hash of layout.py and the modules computing entries (_KEY_FILES), the window sizes and the OpenCV version (text
+metrics), a change to any of them starts it over.
+Without a file (load() not called, or given None) values are still only computed once per run.
+"""
+import hashlib
+import json
+import logging
+import os
+import cv2
+from metrics import REGISTRY
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'whiteboard', 'layout_cache.json')
+_KEY_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in ['layout.py', 'slider.py']]
+
+_HITS, _MISSES = REGISTRY.hit_rate('layout_cache', "startup geometry found in the layout cache")
+
+
+def get_layout_key(window_sizes):
+    """
+    :param window_sizes: dict, window name: (width, height)
+    :returns: dict identifying the layout, (JSON-able)
+    """
+    sources_hash = hashlib.sha1()
+    for filename in _KEY_FILES:
+        with open(filename, 'rb') as f:
+            sources_hash.update(f.read())
+    return {'sources_sha1': sources_hash.hexdigest(), 'opencv': cv2.__version__,
+            'window_sizes': {name: list(size) for name, size in sorted(window_sizes.items())}}
+
+
+class LayoutCache(object):
+    def __init__(self):
+        self._filename = None
+        self._key = None
+        self._entries = {}  # "kind:params" (JSON): value
+        self._dirty = False
+
+    def load(self, filename, window_sizes):
+        """
+        Start using the cache file (its entries, if it's for this layout), entries computed from now on are saved to it.
+        :param filename: cache file, or None to not persist anything
+        :param window_sizes: dict, window name: (width, height)
+        """
+        self._filename = filename
+        self._key = get_layout_key(window_sizes)
+        self._entries, self._dirty = {}, False
+        if filename is None or not os.path.exists(filename):
+            return
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Couldn't read layout cache %s, ignoring it:  %s" % (filename, e))
+            return
+        if data.get('key') != self._key:
+            logging.info("Layout cache %s is for a different layout, starting over." % (filename,))
+            return
+        self._entries = data['entries']
+        logging.info("Loaded %i entries from layout cache %s." % (len(self._entries), filename))
+
+    def get(self, kind, params, compute):
+        """
+        :param kind: what's being cached, e.g. 'slider_label_dims'
+        :param params: what the value depends on besides the layout, (JSON-able)
+        :param compute: function() returning the value, (JSON-able) on a miss
+        :returns: the value, (as it comes back from JSON, e.g. tuples are lists)
+        """
+        name = "%s:%s" % (kind, json.dumps(params, sort_keys=True, default=str))
+        if name in self._entries:
+            _HITS.inc()
+            return self._entries[name]
+        _MISSES.inc()
+        value = json.loads(json.dumps(compute()))
+        self._entries[name] = value
+        self._dirty = True
+        return value
+
+    def save(self):
+        """
+        Write the cache file, if anything new was computed.
+        """
+        if self._filename is None or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self._filename)), exist_ok=True)
+            temp_file = self._filename + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump({'key': self._key, 'entries': self._entries}, f)
+            os.replace(temp_file, self._filename)
+        except OSError as e:
+            logging.warning("Couldn't write layout cache %s:  %s" % (self._filename, e))
+            return
+        self._dirty = False
+        logging.info("Wrote %i entries to layout cache %s." % (len(self._entries), self._filename))
+
+
+LAYOUT_CACHE = LayoutCache()
@@ -0,0 +1,311 @@
+"""
+Load generator:  K simulated users take turns on one board (one WhiteboardApp on a HeadlessBackend, so one
+ToolManager & VectorManager), running scripted gestures through the board window's mouse handling as fast as the
+app takes them.  Every report_interval seconds it reports the sustained rate of board ops, the frame times, and the
+process's memory, to find slowdowns & leaks that only show up in long sessions.
+
+Users take turns a gesture at a time:  the tools keep one gesture's state (the vector being drawn, the pan start),
+and VectorManager.finish_vectors() finishes everything in progress, so interleaving gestures on one ToolManager
+would tangle them.
+
+    python load_generator.py --users 4 --duration 7200 --report-interval 60 --out load_report.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from display import HeadlessBackend
+from layout import COLORS_BGR
+from vector_manager import BoardOps
+from whiteboard import WhiteboardApp
+
+# behavior: relative frequency, (each is a function(rng, window size) -> tool name, points of the drag)
+DEFAULT_MIX = {'pencil': 5, 'line': 1, 'rectangle': 1, 'circle': 1, 'select': 1, 'pan': 1}
+COLORS = [name for name in ('black', 'red', 'green', 'blue') if name in COLORS_BGR]
+MOUSE_DT = 1. / 120  # seconds between mouse events of a drag, (virtual clock)
+_MARGIN = 20  # keep drags this far (pixels) from the window's edges
+
+
+def _clip(points, size):
+    return np.clip(points, _MARGIN, np.array(size) - _MARGIN).astype(int)
+
+
+def _scribble(rng, size):
+    """
+    A random walk with momentum, 20 to 80 points.
+    """
+    n = rng.integers(20, 81)
+    steps = np.cumsum(rng.normal(0, 3, (n, 2)), axis=0)  # (the velocity wanders)
+    start = rng.uniform(_MARGIN, np.array(size) - _MARGIN)
+    return 'pencil', _clip(start + np.cumsum(steps, axis=0), size)
+
+
+def _straight_drag(rng, size, min_len=20, max_len=300):
+    """
+    From a random point, in a random direction, 5 to 15 points.
+    """
+    start = rng.uniform(_MARGIN, np.array(size) - _MARGIN)
+    angle, length = rng.uniform(0, 2 * np.pi), rng.uniform(min_len, max_len)
+    end = start + length * np.array([np.cos(angle), np.sin(angle)])
+    return _clip(np.linspace(start, end, rng.integers(5, 16)), size)
+
+
+def _line(rng, size):
+    return 'line', _straight_drag(rng, size)
+
+
+def _rectangle(rng, size):
+    return 'rectangle', _straight_drag(rng, size)
+
+
+def _circle(rng, size):
+    return 'circle', _straight_drag(rng, size, max_len=150)
+
+
+def _select(rng, size):
+    """
+    Drag a selection box, (the load generator moves what it selected, see LoadGenerator._move_selection).
+    """
+    return 'select', _straight_drag(rng, size, min_len=100)
+
+
+def _pan(rng, size):
+    return 'pan', _straight_drag(rng, size, max_len=100)
+
+
+BEHAVIORS = {'pencil': _scribble, 'line': _line, 'rectangle': _rectangle, 'circle': _circle, 'select': _select,
+             'pan': _pan}
+
+
+def get_rss_bytes():
+    """
+    :returns: resident set size of this process, (the peak instead, where /proc isn't available)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource  # (not on Windows, which has /proc neither)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024  # (bytes on macOS, kilobytes elsewhere)
+
+
+class SimulatedUser(object):
+    """
+    Picks gestures from its own mix of behaviors, with its own color and random stream.
+    """
+
+    def __init__(self, user_id, mix=None, seed=None):
+        """
+        :param mix: dict, behavior name: relative frequency (default DEFAULT_MIX)
+        """
+        mix = mix if mix is not None else DEFAULT_MIX
+        unknown = set(mix) - set(BEHAVIORS)
+        if unknown:
+            raise ValueError("Unknown behaviors: %s" % (sorted(unknown),))
+        self.user_id = user_id
+        self._rng = np.random.default_rng(seed)
+        self._behaviors = list(mix)
+        self._p = np.array([mix[name] for name in self._behaviors], dtype=float)
+        self._p /= self._p.sum()
+        self.color = COLORS[user_id % len(COLORS)]
+        self.thickness = int(self._rng.integers(1, 4))
+        self.n_gestures = 0
+
+    def next_gesture(self, size):
+        """
+        :param size: (width, height) of the window
+        :returns: behavior name, tool name, array of (x, y) pixels (mouse down at the first, up at the last)
+        """
+        behavior = self._behaviors[self._rng.choice(len(self._behaviors), p=self._p)]
+        tool_name, points = BEHAVIORS[behavior](self._rng, size)
+        self.n_gestures += 1
+        return behavior, tool_name, points
+
+    def get_move_offset(self):
+        return self._rng.normal(0, 30, 2)
+
+
+class LoadGenerator(object):
+    """
+    Run the simulated users against a headless app and collect a report every report_interval seconds.
+    """
+
+    def __init__(self, n_users=4, mix=None, seed=0, report_interval=10., mouse_dt=MOUSE_DT, **app_kwargs):
+        """
+        :param n_users: simulated users, (taking turns a gesture at a time)
+        :param mix: dict, behavior name: relative frequency, for every user (default DEFAULT_MIX)
+        :param seed: users' random streams are seeded from this, (None for different runs every time)
+        :param report_interval: seconds (wall clock) between reports
+        :param mouse_dt: seconds between a drag's mouse events on the display's virtual clock, (the app isn't
+            left idle in between, the clock skips ahead)
+        :param app_kwargs: for WhiteboardApp (e.g. state_file, autosave_file, sync_port, to load those too)
+        """
+        seeds = np.random.SeedSequence(seed).spawn(n_users)
+        self._users = [SimulatedUser(i, mix, seeds[i]) for i in range(n_users)]
+        self._report_interval = report_interval
+        self._mouse_dt = mouse_dt
+        self._display = HeadlessBackend(skip_idle=True)
+        self.app = WhiteboardApp(display=self._display, **app_kwargs)
+        self._board = self.app._windows['board']
+        self._title = self._board.get_name_and_title()[1]
+        self._vm = self.app._vector_manager
+        self._vm.add_op_callback(self._on_op)
+        self._display.add_show_callback(self._on_show)
+
+        self._n_ops = {op.name: 0 for op in BoardOps}
+        self._n_gestures = {name: 0 for name in BEHAVIORS}
+        self._turn = 0
+        self._selecting_user = None  # moves its selection when its gesture is done
+        self._duration = None
+        self._on_report = None
+        self._reports = []
+        self._frame_ms = []  # since the last report
+        self._t_start = self._t_frame = self._t_report = None
+        self._n_ops_report = 0
+
+    def _on_op(self, op, vectors, old_vectors):
+        self._n_ops[op.name] += 1
+
+    def get_n_ops(self):
+        return sum(self._n_ops.values())
+
+    def _move_selection(self, user):
+        """
+        Finish a select-and-move:  move what was selected & commit it, (as the Select tool's move mode would).
+        """
+        selected = self._vm.get_selected()
+        if not selected:
+            return
+        offset = user.get_move_offset()
+        for vec in selected:
+            if hasattr(vec, '_centroid'):
+                vec.move_to(vec.get_centroid() + offset)
+        self._vm.deselect_vectors_commit()
+
+    def _start_gesture(self):
+        """
+        Next user's turn:  switch to its tool, inject its drag starting now.
+        """
+        if self._selecting_user is not None:
+            self._move_selection(self._selecting_user)
+            self._selecting_user = None
+        user = self._users[self._turn % len(self._users)]
+        self._turn += 1
+        behavior, tool_name, points = user.next_gesture(self._board.get_size())
+        self._n_gestures[behavior] += 1
+        tools = self.app._tool_manager
+        tools.switch_tool(tool_name)
+        tools.set_color_thickness(user.color, user.thickness)
+        if behavior == 'select':
+            self._selecting_user = user
+
+        t = self._display.time() + self._mouse_dt
+        (x, y), flags = points[0], cv2.EVENT_FLAG_LBUTTON
+        self._display.inject_mouse(self._title, cv2.EVENT_LBUTTONDOWN, int(x), int(y), flags=flags, t=t)
+        for x, y in points[1:]:
+            t += self._mouse_dt
+            self._display.inject_mouse(self._title, cv2.EVENT_MOUSEMOVE, int(x), int(y), flags=flags, t=t)
+        self._display.inject_mouse(self._title, cv2.EVENT_LBUTTONUP, int(x), int(y), t=t + self._mouse_dt)
+
+    def _on_show(self, title, frame):
+        if title != self._title:
+            return
+        t = time.perf_counter()
+        self._frame_ms.append((t - self._t_frame) * 1000.)
+        self._t_frame = t
+        if t - self._t_report >= self._report_interval:
+            self._add_report(t)
+        if t - self._t_start >= self._duration:
+            self._display.inject_key(ord('q'))
+        elif self._display.get_n_pending() == 0:
+            self._start_gesture()
+
+    def _add_report(self, t):
+        frame_ms = np.array(self._frame_ms) if self._frame_ms else np.zeros(1)
+        n_ops = self.get_n_ops()
+        vectors = self._vm.get_all_vectors()
+        rss = get_rss_bytes()
+        report = {'t': t - self._t_start,
+                  'ops': n_ops,
+                  'ops_per_sec': (n_ops - self._n_ops_report) / (t - self._t_report),
+                  'gestures': sum(self._n_gestures.values()),
+                  'frames': len(self._frame_ms),
+                  'fps': len(self._frame_ms) / (t - self._t_report),
+                  'frame_ms': {'p50': float(np.percentile(frame_ms, 50)), 'p95': float(np.percentile(frame_ms, 95)),
+                               'p99': float(np.percentile(frame_ms, 99)), 'max': float(frame_ms.max())},
+                  'vectors': len(vectors),
+                  'points': int(sum(len(vec._points) for vec in vectors)),
+                  'history_bytes': self.app._history.get_memory_used(),
+                  'memory': self.app._memory.update(),
+                  'rss_bytes': rss,
+                  'rss_growth_bytes': rss - self._reports[0]['rss_bytes'] if self._reports else 0}
+        self._reports.append(report)
+        self._frame_ms, self._t_report, self._n_ops_report = [], t, n_ops
+        logging.info("Load:  %.0f s, %.1f ops/s, %.1f fps (p95 %.1f ms), %i vectors, RSS %.1f MB (%+.1f MB)" % (
+            report['t'], report['ops_per_sec'], report['fps'], report['frame_ms']['p95'], report['vectors'],
+            rss / 2.**20, report['rss_growth_bytes'] / 2.**20))
+        if self._on_report is not None:
+            self._on_report(report)
+
+    def run(self, duration, on_report=None):
+        """
+        Run the app under load for duration seconds (wall clock).
+        :param on_report: function(report) called with each report as it's made
+        :returns: dict(reports=[report dicts], ops={op name: count}, gestures={behavior: count}, summary={...})
+        """
+        self._duration = duration
+        self._on_report = on_report
+        self._reports = []
+        self._t_start = self._t_frame = self._t_report = time.perf_counter()
+        self._n_ops_report = self.get_n_ops()
+        self.app.run()
+        self._add_report(time.perf_counter())  # (the last, partial interval)
+        return {'reports': self._reports, 'ops': dict(self._n_ops), 'gestures': dict(self._n_gestures),
+                'summary': self._summarize()}
+
+    def _summarize(self):
+        """
+        Compare the first & last reports, (slowdowns and memory growth).
+        """
+        first, last = self._reports[0], self._reports[-1]
+        elapsed = last['t']
+        return {'duration': elapsed,
+                'ops_per_sec': self.get_n_ops() / elapsed if elapsed > 0 else None,
+                'ops_per_sec_first': first['ops_per_sec'], 'ops_per_sec_last': last['ops_per_sec'],
+                'frame_ms_p95_first': first['frame_ms']['p95'], 'frame_ms_p95_last': last['frame_ms']['p95'],
+                'rss_growth_bytes': last['rss_bytes'] - first['rss_bytes'],
+                'rss_growth_bytes_per_hour': (last['rss_bytes'] - first['rss_bytes']) * 3600. / elapsed
+                if elapsed > 0 else None}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Simulated users drawing on a headless whiteboard, for hours.")
+    parser.add_argument('--users', type=int, default=4, help="number of simulated users")
+    parser.add_argument('--duration', type=float, default=60., help="seconds to run")
+    parser.add_argument('--report-interval', type=float, default=10., help="seconds between reports")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', type=json.loads, default=None,
+                        help="behavior frequencies as JSON, e.g. '{\"pencil\": 3, \"pan\": 1}'")
+    parser.add_argument('--state-file', default=None, help="journal the board here too")
+    parser.add_argument('--out', default=None, help="write the reports here (JSON)")
+    parsed = parser.parse_args(args)
+
+    generator = LoadGenerator(n_users=parsed.users, mix=parsed.mix, seed=parsed.seed,
+                              report_interval=parsed.report_interval, state_file=parsed.state_file)
+    results = generator.run(parsed.duration)
+    print(json.dumps(results['summary'], indent=2))
+    if parsed.out is not None:
+        with open(parsed.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        logging.info("Wrote load report to %s." % (parsed.out,))
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
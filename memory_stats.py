@@ -0,0 +1,228 @@
+"""
+Memory accounting, to tell a long session's growth in strokes from growth in caches or leaks:
+
+    MemoryAccounting:  bytes held by the board's points, in-progress vectors, render caches, selection copies, undo
+        history, the timeline and the deleted-vector list, measured by walking the objects (only when asked).
+    AllocationSnapshots:  tracemalloc snapshots taken on demand, and what was allocated (and not freed) between any
+        two of them, by source line.
+
+Vectors are shared (the undo history and timeline keep references to vectors that may still be on the board), so
+each part reports the bytes it holds and the 'exclusive_bytes' only it keeps alive, and the total counts every
+vector once.
+"""
+import logging
+import sys
+import time
+import tracemalloc
+import numpy as np
+from metrics import REGISTRY
+
+
+def points_bytes(vector):
+    """
+    :returns: bytes of the vector's points, (a list while it's being drawn, an array once it's finalized)
+    """
+    points = vector._points
+    if isinstance(points, np.ndarray):
+        return points.nbytes
+    return sys.getsizeof(points) + sum(point.nbytes if isinstance(point, np.ndarray) else sys.getsizeof(point)
+                                       for point in points)
+
+
+def cache_bytes(vector):
+    """
+    :returns: bytes of the vector's render caches, (the pixel points of circles & rectangles, per window)
+    """
+    view_cache = getattr(vector, '_view_cache', None)
+    if not view_cache:
+        return 0
+    return sum(sum(pts.nbytes for pts in draw_pts) for _, draw_pts in view_cache.values() if draw_pts is not None)
+
+
+class MemoryAccounting(object):
+    """
+    Publishes get_stats() as the 'memory' gauge, so it's in metrics snapshots ('m' key, metrics server).  Measuring
+    walks the board, so it's only done by update() (call it on the UI thread, e.g. tick() every frame), never by the
+    thread reading the gauge.
+    """
+
+    def __init__(self, vector_manager, history=None, timeline=None, registry=REGISTRY, interval=30.0):
+        """
+        :param history: History, to count the undo/redo stacks, or None
+        :param timeline: Timeline, to count its deltas & checkpoints, or None
+        :param registry: add a 'memory' gauge (the last update()) to this metrics registry, or None
+        :param interval: seconds between updates from tick()
+        """
+        self._vm = vector_manager
+        self._history = history
+        self._timeline = timeline
+        self._registry = registry
+        self._interval = interval
+        self._t_last = None
+        self._gauge = registry.gauge('memory', "bytes held by board state, caches & history, by part") \
+            if registry is not None else None
+
+    def tick(self):
+        t = time.perf_counter()
+        if self._t_last is None or t - self._t_last >= self._interval:
+            self.update()
+
+    def update(self):
+        """
+        Measure now, and publish it to the gauge.
+        :returns: the stats (see get_stats)
+        """
+        self._t_last = time.perf_counter()
+        stats = self.get_stats()
+        if self._gauge is not None:
+            self._gauge.set(stats)
+        return stats
+
+    def close(self):
+        if self._registry is not None:
+            self._registry.remove('memory')
+
+    def _get_history_vectors(self):
+        vectors = []
+        for command in self._history._undo_stack + self._history._redo_stack:
+            vectors.extend(command._vectors)
+            vectors.extend(command._old_vectors or [])
+        return vectors
+
+    def _get_timeline_vectors(self):
+        vectors = []
+        for _, op_vectors, _ in self._timeline._deltas:
+            vectors.extend(op_vectors or [])
+        for _, checkpoint in self._timeline._checkpoints:
+            vectors.extend(checkpoint)
+        return vectors
+
+    def get_stats(self):
+        """
+        :returns: dict, part: {'vectors': number of (distinct) vectors, 'bytes': of their points, 'exclusive_bytes',
+            ...}, for 'board', 'in_progress', 'selected', 'deleted', 'history' and 'timeline', plus
+            'render_caches' {'vectors', 'bytes'}, 'lazy_chunks' {'resident', 'estimated_bytes'}, 'total_bytes' (points &
+            caches of every vector held anywhere, once) and 'seconds' (time taken to measure)
+        """
+        t_start = time.perf_counter()
+        vm = self._vm
+        parts = {'board': vm._vectors,
+                 'in_progress': vm.get_vectors_in_progress(),
+                 'selected': vm.get_selected(),
+                 'deleted': vm._deleted}
+        if self._history is not None:
+            parts['history'] = self._get_history_vectors()
+        if self._timeline is not None:
+            parts['timeline'] = self._get_timeline_vectors()
+
+        owners = {}  # id(vector): number of parts holding it
+        distinct = {}  # part: {id(vector): vector}
+        for part, vectors in parts.items():
+            distinct[part] = {id(vector): vector for vector in vectors}
+            for key in distinct[part]:
+                owners[key] = owners.get(key, 0) + 1
+        everything = {key: vector for vectors in distinct.values() for key, vector in vectors.items()}
+        sizes = {key: points_bytes(vector) for key, vector in everything.items()}
+
+        stats = {}
+        for part, vectors in distinct.items():
+            stats[part] = {'vectors': len(vectors),
+                           'bytes': sum(sizes[key] for key in vectors),
+                           'exclusive_bytes': sum(sizes[key] for key in vectors if owners[key] == 1)}
+        if self._history is not None:
+            stats['history'].update(commands=len(self._history._undo_stack) + len(self._history._redo_stack),
+                                    estimated_bytes=self._history.get_memory_used())
+        if self._timeline is not None:
+            stats['timeline'].update(deltas=len(self._timeline._deltas),
+                                     checkpoint_refs_bytes=8 * sum(len(checkpoint) for _, checkpoint in
+                                                                   self._timeline._checkpoints))
+        caches = {key: cache_bytes(vector) for key, vector in everything.items()}
+        stats['render_caches'] = {'vectors': sum(1 for n_bytes in caches.values() if n_bytes),
+                                  'bytes': sum(caches.values())}
+        lazy = vm._lazy
+        stats['lazy_chunks'] = {'resident': len(lazy._resident) if lazy is not None else 0,
+                                'estimated_bytes': lazy.get_memory_used() if lazy is not None else 0}
+        stats['total_bytes'] = sum(sizes.values()) + stats['render_caches']['bytes'] + \
+            stats['lazy_chunks']['estimated_bytes']
+        stats['seconds'] = time.perf_counter() - t_start
+        return stats
+
+
+class AllocationSnapshots(object):
+    """
+    Take tracemalloc snapshots at moments of a session, then diff any two:
+
+        snapshots = AllocationSnapshots()
+        snapshots.take('before lecture')
+        ...
+        snapshots.take('after lecture')
+        for line in snapshots.diff('before lecture', 'after lecture'):
+            print(line['where'], line['size_diff'])
+
+    Tracing starts with the first snapshot (and slows allocations down until stop()).
+    """
+
+    def __init__(self, n_frames=1):
+        """
+        :param n_frames: frames of traceback kept per allocation, (more is slower, but diff(key_type='traceback')
+            can show who called)
+        """
+        self._n_frames = n_frames
+        self._snapshots = {}  # label: snapshot, in the order taken
+        self._started_tracing = False
+
+    def take(self, label=None):
+        """
+        :param label: name for the snapshot, (default:  its number)
+        :returns: the label
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._n_frames)
+            self._started_tracing = True
+            logging.info("Tracing allocations (%i frame(s) per allocation)." % (self._n_frames,))
+        label = label if label is not None else str(len(self._snapshots))
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>")])
+        self._snapshots.pop(label, None)
+        self._snapshots[label] = snapshot
+        return label
+
+    def get_labels(self):
+        return list(self._snapshots)
+
+    def diff(self, label_a=None, label_b=None, key_type='lineno', limit=20):
+        """
+        What was allocated and not freed between two snapshots, biggest growth first.
+        :param label_a: the earlier snapshot, (default:  the next to last taken)
+        :param label_b: the later one, (default:  the last taken)
+        :param key_type: 'lineno', 'filename' or 'traceback' (see tracemalloc.Snapshot.statistics)
+        :param limit: lines returned, (None for all)
+        :returns: list of dicts:  'where' (file:line, or the traceback), 'size_diff' and 'size' (bytes),
+            'count_diff' and 'count' (allocations)
+        """
+        labels = self.get_labels()
+        if len(labels) < 2 and (label_a is None or label_b is None):
+            raise ValueError("Need two snapshots to diff, have %i." % (len(labels),))
+        label_a = label_a if label_a is not None else labels[-2]
+        label_b = label_b if label_b is not None else labels[-1]
+        stats = self._snapshots[label_b].compare_to(self._snapshots[label_a], key_type)
+        return [{'where': ' <- '.join("%s:%i" % (frame.filename, frame.lineno) for frame in stat.traceback),
+                 'size_diff': stat.size_diff, 'size': stat.size, 'count_diff': stat.count_diff, 'count': stat.count}
+                for stat in stats[:limit]]
+
+    def get_traced_memory(self):
+        """
+        :returns: bytes allocated (and not freed) since tracing started, now and at the peak
+        """
+        return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+
+    def stop(self):
+        """
+        Forget the snapshots, and stop tracing if this started it.
+        """
+        self._snapshots = {}
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
@@ -0,0 +1,211 @@
+"""
+Metrics:  counters, gauges and histograms that are cheap to update every frame, and only read when a snapshot is
+asked for (written to a JSON file, or served on a local port).
+
+Modules get their metrics from the shared registry when they're imported, e.g.:
+
+    _SAVE_MS = REGISTRY.histogram('autosave.save_ms', "time to write the board")
+    ...
+    _SAVE_MS.observe(duration * 1000.)
+
+Names are dotted, <module/component>.<metric>, units go at the end (_ms, _bytes).
+"""
+import json
+import logging
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+# Histogram bucket upper bounds (ms), the last bucket is everything bigger.
+DEFAULT_BUCKETS_MS = (0.5, 1, 2, 4, 8, 16, 33, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Counter(object):
+    def __init__(self, description=""):
+        self.description = description
+        self._value = 0
+
+    def inc(self, n=1):
+        self._value += n
+
+    def get(self):
+        return self._value
+
+
+class Gauge(object):
+    """
+    A value that's set, or a function called only when it's read (for anything costly to keep up to date).
+    """
+
+    def __init__(self, description="", fn=None):
+        self.description = description
+        self._fn = fn
+        self._value = None
+
+    def set(self, value):
+        self._value = value
+
+    def get(self):
+        return self._fn() if self._fn is not None else self._value
+
+
+class Histogram(object):
+    """
+    Counts of values in buckets, with their sum & max.  Percentiles are estimated (bucket upper bounds).
+    """
+
+    def __init__(self, description="", buckets=DEFAULT_BUCKETS_MS):
+        self.description = description
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._n = 0
+        self._sum = 0.
+        self._max = None
+        self._lock = threading.Lock()  # (observed from worker threads too)
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect_left(self._bounds, value)] += 1
+            self._n += 1
+            self._sum += value
+            self._max = value if self._max is None else max(self._max, value)
+
+    def _percentile(self, cumulative, p):
+        i = int(np.searchsorted(cumulative, self._n * p / 100.))
+        return self._bounds[i] if i < len(self._bounds) else self._max
+
+    def get(self):
+        """
+        :returns: dict(n, sum, mean, max, p50, p95, p99, buckets=[[upper bound or None, count], ...])
+        """
+        with self._lock:
+            counts, n, total, max_value = list(self._counts), self._n, self._sum, self._max
+        result = {'n': n, 'sum': total, 'mean': total / n if n else None, 'max': max_value,
+                  'buckets': [[bound, count] for bound, count in zip(self._bounds + (None,), counts)]}
+        cumulative = np.cumsum(counts)
+        for p in (50, 95, 99):
+            result['p%i' % p] = self._percentile(cumulative, p) if n else None
+        return result
+
+
+class MetricsRegistry(object):
+    """
+    Named metrics, made on first use (asking for an existing name returns it).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_make(self, name, cls, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(*args, **kwargs)
+            elif not isinstance(self._metrics[name], cls):
+                raise ValueError("Metric %s is a %s, not a %s." % (name, type(self._metrics[name]).__name__,
+                                                                   cls.__name__))
+            return self._metrics[name]
+
+    def counter(self, name, description=""):
+        return self._get_or_make(name, Counter, description)
+
+    def gauge(self, name, description="", fn=None):
+        """
+        :param fn: function() returning the value when it's read, (replaces that of an existing gauge)
+        """
+        gauge = self._get_or_make(name, Gauge, description, fn)
+        if fn is not None:
+            gauge._fn = fn
+        return gauge
+
+    def histogram(self, name, description="", buckets=DEFAULT_BUCKETS_MS):
+        return self._get_or_make(name, Histogram, description, buckets)
+
+    def hit_rate(self, name, description=""):
+        """
+        Counters <name>.hits and <name>.misses, and a gauge <name>.hit_rate computed from them.
+        :returns: hits, misses (Counters)
+        """
+        hits = self.counter(name + '.hits', description)
+        misses = self.counter(name + '.misses', description)
+        self.gauge(name + '.hit_rate', description,
+                   fn=lambda: hits.get() / (hits.get() + misses.get()) if hits.get() + misses.get() else None)
+        return hits, misses
+
+    def remove(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def snapshot(self):
+        """
+        :returns: dict, name: value, (JSON-able)
+        """
+        with self._lock:
+            metrics = list(self._metrics.items())
+        snapshot = {}
+        for name, metric in sorted(metrics):
+            try:
+                snapshot[name] = metric.get()
+            except Exception as e:  # (a gauge's function failing shouldn't lose the rest)
+                snapshot[name] = "error:  %s" % (e,)
+        return snapshot
+
+    def describe(self):
+        """
+        :returns: dict, name: (kind, description)
+        """
+        with self._lock:
+            return {name: (type(metric).__name__.lower(), metric.description)
+                    for name, metric in self._metrics.items()}
+
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, default=_to_json)
+        logging.info("Wrote metrics to %s." % (filename,))
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics', '/metrics.json'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.registry.snapshot(), indent=2, default=_to_json).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(object):
+    """
+    Serve snapshots as JSON at http://<host>:<port>/metrics, (local only by default).
+    """
+
+    def __init__(self, registry=REGISTRY, port=0, host='127.0.0.1'):
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.registry = registry
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info("Metrics at http://%s:%i/metrics" % self.get_address())
+
+    def get_address(self):
+        return self._httpd.server_address[:2]
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -1,9 +1,33 @@
+"""
+Record mouse input.
+
+    _record_points():  click & drag in a plain window, each stroke's points are saved to points<n>.json.
+
+    Input traces:  every mouse event (event, x, y, flags, window, time) and key of a whiteboard session, recorded
+    through a RecordingBackend wrapped around the app's display backend.  replay_trace() feeds a trace back through
+    the windows' cv2_mouse_event on a HeadlessBackend, at the original cadence or flat out, checks the final board
+    against the one recorded, and collects frame & latency stats, so real drawing sessions become repeatable
+    performance tests.
+
+Trace file, JSON lines:
+    {"kind": "header", "version": 1, "windows": {title: [width, height], ...}}
+    {"kind": "mouse", "t": seconds since the start, "window": title, "event": cv2.EVENT_..., "x", "y", "flags"}
+    {"kind": "key", "t": ..., "key": key code}
+    {"kind": "end", "t": ..., "board": board signature (see board_signature), if known}
+
+    python record_points.py record <trace file> [board file]
+    python record_points.py replay <trace file> [--realtime]
+"""
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import json
 import os
 import sys
+import time
+from display import DisplayBackend, HeadlessBackend, OpenCVBackend, NO_KEY
+from whiteboard import WhiteboardApp
+
+TRACE_VERSION = 1
 
 def _record_points(win_size):
     """
@@ -54,5 +78,159 @@ def _record_points(win_size):
     return points
 
 
+def board_signature(vector_manager, decimals=2):
+    """
+    Everything visible about the board (vector ids are random, so not those).
+    :returns: JSON-able list of [type, color, thickness, text, points (rounded)] in drawing order
+    """
+    return [[v.name, [int(c) for c in v._color], int(v._thickness), getattr(v, '_text', None),
+             np.round(np.array(v._points, dtype=np.float64).reshape(-1, 2), decimals).tolist()]
+            for v in vector_manager.get_all_vectors()]
+
+
+class RecordingBackend(DisplayBackend):
+    """
+    Wraps another display backend, writing every mouse event & key it delivers to a trace file.
+    """
+
+    def __init__(self, backend, filename):
+        self._backend = backend
+        self._file = open(filename, 'w')
+        self._t_start = backend.time()
+        self._windows = {}
+        self._header_written = False
+
+    def _write(self, record):
+        if not self._header_written:  # (windows are all made before the first event)
+            self._file.write(json.dumps({'kind': 'header', 'version': TRACE_VERSION, 'windows': self._windows}) + '\n')
+            self._header_written = True
+        self._file.write(json.dumps(record) + '\n')
+
+    def time(self):
+        return self._backend.time()
+
+    def create_window(self, title, size, mouse_callback, param=None):
+        self._windows[title] = [int(size[0]), int(size[1])]
+
+        def _record_mouse(event, x, y, flags, param):
+            self._write({'kind': 'mouse', 't': self.time() - self._t_start, 'window': title, 'event': int(event),
+                         'x': int(x), 'y': int(y), 'flags': int(flags)})
+            mouse_callback(event, x, y, flags, param)
+
+        self._backend.create_window(title, size, _record_mouse, param)
+
+    def show(self, title, frame):
+        self._backend.show(title, frame)
+
+    def wait_key(self, delay_ms=1):
+        key = self._backend.wait_key(delay_ms)
+        if key != NO_KEY and key & 0xFF != 255:
+            self._write({'kind': 'key', 't': self.time() - self._t_start, 'key': int(key)})
+        return key
+
+    def destroy_window(self, title):
+        self._backend.destroy_window(title)
+
+    def destroy_all(self):
+        self._backend.destroy_all()
+
+    def close(self, vector_manager=None):
+        """
+        :param vector_manager: the board at the end, recorded so replays can check they end up the same, or None
+        """
+        self._write({'kind': 'end', 't': self.time() - self._t_start,
+                     'board': board_signature(vector_manager) if vector_manager is not None else None})
+        self._file.close()
+
+
+def load_trace(filename):
+    """
+    :returns: header, list of event records (mouse & key), end record (or None if the recording was cut off)
+    """
+    header, events, end = None, [], None
+    with open(filename) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['kind'] == 'header':
+                if record['version'] > TRACE_VERSION:
+                    raise ValueError("Trace %s is from a newer version (%i)." % (filename, record['version']))
+                header = record
+            elif record['kind'] == 'end':
+                end = record
+            else:
+                events.append(record)
+    if header is None:
+        raise ValueError("%s isn't an input trace." % (filename,))
+    return header, events, end
+
+
+def record_trace(filename, **app_kwargs):
+    """
+    Run the whiteboard, recording its input to a trace file until the user quits.
+    """
+    display = RecordingBackend(OpenCVBackend(), filename)
+    app = WhiteboardApp(display=display, **app_kwargs)
+    app.run()
+    display.close(app._vector_manager)
+
+
+def replay_trace(filename, realtime=False, start_delay=0.05, **app_kwargs):
+    """
+    Run the whiteboard headless, with the trace's input.
+    :param realtime: deliver events at their original times (on the wall clock), else flat out (idle time skipped)
+    :param start_delay: seconds of frames before the first event
+    :returns: dict with
+        'app':  the WhiteboardApp, after it quit
+        'n_events':  events replayed
+        'duration':  seconds (virtual clock) of the replay
+        'frames':  {window title: {'n', 'p50', 'p95', 'p99' (ms between frames)}}
+        'latency':  see LatencyTracker.get_stats
+        'board_matches':  True/False if the final board is the one recorded, None if it wasn't recorded
+    """
+    header, events, end = load_trace(filename)
+    display = HeadlessBackend(realtime=realtime, skip_idle=not realtime)
+    app = WhiteboardApp(display=display, **app_kwargs)
+
+    shown = {}  # title: list of times
+    display.add_show_callback(lambda title, frame: shown.setdefault(title, []).append(display.time()))
+    t_start = display.time() + start_delay
+    quits = False
+    for record in events:
+        if record['kind'] == 'mouse':
+            display.inject_mouse(record['window'], record['event'], record['x'], record['y'], record['flags'],
+                                 t=t_start + record['t'])
+        else:
+            display.inject_key(record['key'], t=t_start + record['t'])
+            quits = quits or record['key'] & 0xFF in (27, ord('q'))
+    if not quits:
+        display.inject_key(ord('q'), t=t_start + (end['t'] if end is not None else events[-1]['t'] if events else 0.))
+    t_run = display.time()
+    app.run()
+
+    frames = {}
+    for title, times in shown.items():
+        intervals = np.diff(times) * 1000.
+        if len(intervals):
+            frames[title] = dict(n=len(times), **{'p%i' % p: float(v) for p, v in
+                                                  zip((50, 95, 99), np.percentile(intervals, (50, 95, 99)))})
+    board_matches = None
+    if end is not None and end.get('board') is not None:
+        board_matches = board_signature(app._vector_manager) == end['board']
+    return {'app': app, 'n_events': len(events), 'duration': display.time() - t_run, 'frames': frames,
+            'latency': app._latency.get_stats(), 'board_matches': board_matches}
+
+
 if __name__=="__main__":
-    _record_points(512)
\ No newline at end of file
+    if len(sys.argv) > 2 and sys.argv[1] == 'record':
+        record_trace(sys.argv[2], state_file=sys.argv[3] if len(sys.argv) > 3 else None)
+    elif len(sys.argv) > 2 and sys.argv[1] == 'replay':
+        result = replay_trace(sys.argv[2], realtime='--realtime' in sys.argv)
+        print("Replayed %i events in %.2f sec, final board %s." % (
+            result['n_events'], result['duration'],
+            {True: "matches", False: "DIFFERS", None: "not recorded"}[result['board_matches']]))
+        print(json.dumps({'frames': result['frames'], 'latency': result['latency']}, indent=2))
+        sys.exit(1 if result['board_matches'] is False else 0)
+    else:
+        _record_points(512)
\ No newline at end of file
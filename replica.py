@@ -0,0 +1,272 @@
+"""
+Several presenters drawing on the same board:  every VectorManager is a replica, local ops are applied right away
+(nothing waits on the network) and sent to the other replicas, remote ops are merged as they arrive.
+
+Merging is conflict-free, every replica ends up with the same board whatever order the ops arrive in:
+    - Ops are stamped with hybrid logical clock timestamps (physical ms, counter, replica id), totally ordered,
+      and later than anything the replica has seen.
+    - Each vector id is a last-writer-wins register:  add/move/restyle write a version of the vector, delete
+      writes a tombstone, an op older than the id's last write is ignored.  (So delete beats a concurrent older
+      move, a move that arrives before the add just adds the moved version, etc.)
+    - Clear is sent as a delete of the vectors the replica had, vectors added concurrently elsewhere survive it.
+    - Drawing order is by the timestamp of each vector's (latest) add, carried along with every version.
+
+Message format:  op (uint8), timestamp (uint64 ms, uint32 counter, uint32 replica id), then
+    add, move, restyle:  number of vectors (uint32), their add timestamps (16 bytes each), journal.encode_op payload
+    delete:  int64 vector ids
+"""
+import logging
+import queue
+import struct
+import threading
+import time
+from bisect import bisect_right
+import numpy as np
+from journal import encode_op, decode_op
+from vector_manager import BoardOps
+
+_MSG_HEADER = struct.Struct('<BQII')
+_COUNT = struct.Struct('<I')
+_LENGTH = struct.Struct('<I')
+_TIMESTAMP_DTYPE = np.dtype([('ms', '<u8'), ('counter', '<u4'), ('replica', '<u4')])
+
+
+class HybridClock(object):
+    """
+    Hybrid logical clock:  close to wall-clock time, but never goes backwards and always ahead of every timestamp
+    received.
+    """
+
+    def __init__(self, replica_id, time_fn=None):
+        """
+        :param time_fn: returns the current time in ms (for simulations), default:  time.time()
+        """
+        self._replica_id = replica_id
+        self._time_fn = time_fn if time_fn is not None else (lambda: int(time.time() * 1000))
+        self._ms = 0
+        self._counter = 0
+
+    def now(self):
+        """
+        :returns: a new timestamp, (ms, counter, replica id)
+        """
+        ms = self._time_fn()
+        if ms > self._ms:
+            self._ms, self._counter = ms, 0
+        else:
+            self._counter += 1
+        return self._ms, self._counter, self._replica_id
+
+    def update(self, timestamp):
+        """
+        Account for a timestamp received from another replica.
+        """
+        ms = max(self._time_fn(), self._ms, timestamp[0])
+        if ms == self._ms and ms == timestamp[0]:
+            self._counter = max(self._counter, timestamp[1]) + 1
+        elif ms == self._ms:
+            self._counter += 1
+        elif ms == timestamp[0]:
+            self._counter = timestamp[1] + 1
+        else:
+            self._counter = 0
+        self._ms = ms
+
+
+class Replica(object):
+    """
+    Makes a VectorManager a replica of a shared board.  Local ops queue messages (get_outgoing()), call receive()
+    with the messages from other replicas.
+    """
+
+    def __init__(self, vector_manager, replica_id, time_fn=None):
+        """
+        :param replica_id: unique among the replicas (uint32)
+        :param time_fn: see HybridClock
+        """
+        self._vm = vector_manager
+        self._replica_id = replica_id
+        self._clock = HybridClock(replica_id, time_fn)
+        self._writes = {}  # vector id: timestamp of the last write (add/move/restyle/delete)
+        self._births = {}  # vector id: timestamp of its latest add, for drawing order
+        self._on_board = set()  # vector ids
+        self._outgoing = []
+        self._lock = threading.Lock()
+        for i, vector in enumerate(self._vm.get_all_vectors()):  # (replicas should start from the same board)
+            self._births[vector.id] = self._writes[vector.id] = (0, i, 0)
+            self._on_board.add(vector.id)
+        self._vm.add_op_callback(self._on_op)
+
+    def get_outgoing(self):
+        """
+        :returns: list of messages (bytes) for the other replicas, since the last call
+        """
+        with self._lock:
+            outgoing, self._outgoing = self._outgoing, []
+        return outgoing
+
+    def _send(self, op, timestamp, vectors=(), births=None):
+        msg = _MSG_HEADER.pack(int(op), *timestamp)
+        if op == BoardOps.delete:
+            msg += encode_op(op, vectors)
+        else:
+            msg += _COUNT.pack(len(vectors)) + np.array(births, dtype=_TIMESTAMP_DTYPE).tobytes() + \
+                encode_op(op, vectors)
+        with self._lock:
+            self._outgoing.append(msg)
+
+    def _on_op(self, op, vectors, old_vectors):
+        if self._vm.is_applying_remote() or self._vm.is_applying_loaded():
+            return
+        timestamp = self._clock.now()
+        for vector in vectors:
+            self._writes[vector.id] = timestamp
+            if op in (BoardOps.delete, BoardOps.clear):
+                self._on_board.discard(vector.id)
+            elif op == BoardOps.add or vector.id not in self._on_board:
+                # (moving/restyling a vector deleted elsewhere, e.g. by undo, puts it back on top, like an add)
+                if op == BoardOps.add and vector.id in self._on_board:
+                    self._remove_older_copy(vector)
+                self._births[vector.id] = timestamp
+                self._on_board.add(vector.id)
+        if op in (BoardOps.delete, BoardOps.clear):
+            self._send(BoardOps.delete, timestamp, vectors)
+        else:
+            self._send(op, timestamp, vectors, [self._births.get(vector.id, timestamp) for vector in vectors])
+
+    def _remove_older_copy(self, vector):
+        """
+        A vector re-added here (undo) was also put back by another replica, keep just the new copy.
+        """
+        vectors = self._vm._vectors
+        for i, other in enumerate(vectors):
+            if other.id == vector.id:
+                del vectors[i]
+                return
+
+    def receive(self, msg):
+        """
+        Merge an op from another replica.
+        """
+        op, ms, counter, replica_id = _MSG_HEADER.unpack_from(msg, 0)
+        op, timestamp = BoardOps(op), (ms, counter, replica_id)
+        self._clock.update(timestamp)
+        payload = memoryview(msg)[_MSG_HEADER.size:]
+        self._vm.set_applying_remote(True)
+        try:
+            if op == BoardOps.delete:
+                self._merge_delete(timestamp, decode_op(op, payload)['ids'])
+            else:
+                n_vectors = _COUNT.unpack_from(payload, 0)[0]
+                births = np.frombuffer(payload, dtype=_TIMESTAMP_DTYPE, count=n_vectors, offset=_COUNT.size)
+                vectors = decode_op(op, payload[_COUNT.size + births.nbytes:])['vectors']
+                self._merge_versions(op, timestamp, vectors, [tuple(int(x) for x in birth) for birth in births])
+        finally:
+            self._vm.set_applying_remote(False)
+
+    def _is_newer(self, vector_id, timestamp):
+        return vector_id not in self._writes or self._writes[vector_id] < timestamp
+
+    def _merge_delete(self, timestamp, ids):
+        deleted = []
+        for vector_id in ids:
+            if self._is_newer(vector_id, timestamp):
+                self._writes[vector_id] = timestamp
+                if vector_id in self._on_board:
+                    self._on_board.remove(vector_id)
+                    deleted.append(vector_id)
+        if deleted:
+            self._vm.apply_op(BoardOps.delete, ids=deleted)
+
+    def _merge_versions(self, op, timestamp, vectors, births):
+        replaced = []
+        for vector, birth in zip(vectors, births):
+            if not self._is_newer(vector.id, timestamp):
+                continue
+            known = vector.id in self._writes
+            self._writes[vector.id] = timestamp
+            if vector.id in self._on_board and self._births.get(vector.id) == birth:
+                replaced.append(vector)
+                continue
+            if vector.id in self._on_board:  # (re-added, goes to its new place in the drawing order)
+                self._vm.apply_op(BoardOps.delete, ids=[vector.id])
+            self._births[vector.id] = birth
+            self._on_board.add(vector.id)
+            if known:  # (may be in the deleted list here, so undo_delete mustn't add it again)
+                self._vm._deleted = [other for other in self._vm._deleted if other.id != vector.id]
+            self._insert(vector, birth)
+        if replaced:
+            self._vm.apply_op(op if op != BoardOps.add else BoardOps.move, vectors=replaced)
+
+    def _insert(self, vector, birth):
+        """
+        Add the vector in its place in the drawing order (usually the top).
+        """
+        self._vm.apply_op(BoardOps.add, vectors=[vector])
+        vectors = self._vm._vectors
+        if len(vectors) > 1 and self._births.get(vectors[-2].id, birth) > birth:
+            vectors.pop()
+            keys = [self._births.get(other.id, birth) for other in vectors]
+            vectors.insert(bisect_right(keys, birth), vector)
+
+
+class ReplicaLink(object):
+    """
+    Connects a Replica to another one over a socket:  threads send and receive (length-prefixed) messages, tick()
+    hands over the replica's outgoing messages and merges the received ones, (call it every frame).
+    With more than two replicas, relay (or connect every pair), duplicates are harmless.
+    """
+
+    def __init__(self, replica, sock):
+        self._replica = replica
+        self._sock = sock
+        self._received = []
+        self._lock = threading.Lock()
+        self._to_send = queue.Queue()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _read_exactly(self, n):
+        chunks = []
+        while n > 0:
+            chunk = self._sock.recv(min(n, 2**20))
+            if not chunk:
+                raise ConnectionError("Replica link closed.")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    def _read_loop(self):
+        try:
+            while True:
+                msg = self._read_exactly(_LENGTH.unpack(self._read_exactly(4))[0])
+                with self._lock:
+                    self._received.append(msg)
+        except OSError as e:
+            logging.info("Replica link closed:  %s" % (e,))
+
+    def _write_loop(self):
+        try:
+            while True:
+                data = self._to_send.get()
+                if data is None:
+                    return
+                self._sock.sendall(data)
+        except OSError as e:
+            logging.info("Replica link closed:  %s" % (e,))
+
+    def tick(self):
+        outgoing = self._replica.get_outgoing()
+        if outgoing:
+            self._to_send.put(b''.join(_LENGTH.pack(len(msg)) + msg for msg in outgoing))
+        with self._lock:
+            received, self._received = self._received, []
+        for msg in received:
+            self._replica.receive(msg)
+
+    def close(self):
+        self._to_send.put(None)
+        self._writer.join()
+        self._sock.close()
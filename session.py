@@ -0,0 +1,186 @@
+"""
+Record a session (everything drawn, including strokes in progress) to a file, and replay it headless at any speed.
+
+Session file:  magic (8 bytes), then records:
+    length (uint32), time since the start of the recording (float64, seconds), kind (uint8:  0 = frame,
+    1 = snapshot), packet (board_sync format, without its length field)
+
+Frame records hold what changed in one frame (see board_sync.OpEncoder), snapshot records rebuild the whole board
+and are written every snapshot_interval seconds (if anything changed), so seeking costs at most one snapshot plus
+snapshot_interval seconds of frames.  Records are written by a thread, which also encodes the snapshots (the UI
+thread only takes the board's vector list, see VectorManager.get_snapshot).  Replay only touches a VectorManager, so it's deterministic and needs no
+display:  the same session gives the same board at the same time, whatever the speed.
+"""
+import queue
+import struct
+import threading
+import time
+from bisect import bisect_right
+import numpy as np
+from board_sync import OpEncoder, BoardMirror, encode_packet
+from vector_manager import VectorManager
+
+_MAGIC = b'WBSESS01'
+_RECORD_HEADER = struct.Struct('<IdB')
+RECORD_FRAME = 0
+RECORD_SNAPSHOT = 1
+
+
+class SessionRecorder(object):
+    """
+    Call tick() every frame, and close() when done (waits for the writer thread).
+    """
+
+    def __init__(self, vector_manager, filename, snapshot_interval=30.0, time_fn=time.perf_counter):
+        """
+        :param snapshot_interval: seconds between snapshots (seek points)
+        :param time_fn: clock, (inject a virtual one for headless recordings)
+        """
+        self._vm = vector_manager
+        self._encoder = OpEncoder(vector_manager)
+        self._snapshot_interval = snapshot_interval
+        self._time_fn = time_fn
+        self._t_start = time_fn()
+        self._seq = 0
+        self._t_snapshot = 0.
+        self._changed = False  # since the last snapshot
+        self._file = open(filename, 'wb')
+        self._file.write(_MAGIC)
+        self._records = queue.Queue()  # (t, kind, packet or board_sync snapshot), None to stop
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._write_snapshot(0.)
+
+    def _write_loop(self):
+        while True:
+            record = self._records.get()
+            if record is None:
+                return
+            t, kind, packet = record
+            packet = (packet if kind == RECORD_FRAME else packet.get_packet())[4:]
+            self._file.write(_RECORD_HEADER.pack(len(packet), t, kind))
+            self._file.write(packet)
+
+    def _write_snapshot(self, t):
+        self._seq += 1
+        self._records.put((t, RECORD_SNAPSHOT, self._encoder.snapshot(self._seq)))
+
+    def tick(self):
+        t = self._time_fn() - self._t_start
+        msgs = self._encoder.frame_msgs()
+        if msgs:
+            self._seq += 1
+            self._records.put((t, RECORD_FRAME, encode_packet(self._seq, msgs)))
+            self._changed = True
+        if self._changed and t - self._t_snapshot >= self._snapshot_interval:
+            self._write_snapshot(t)
+            self._t_snapshot, self._changed = t, False
+
+    def close(self):
+        self.tick()
+        self._encoder.close()
+        self._records.put(None)
+        self._writer.join()
+        self._file.close()
+
+
+class Session(object):
+    """
+    A recorded session file, indexed.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._data = f.read()
+        if self._data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("%s isn't a session file." % (filename,))
+        times, kinds, offsets, lengths = [], [], [], []
+        pos = len(_MAGIC)
+        while pos + _RECORD_HEADER.size <= len(self._data):
+            length, t, kind = _RECORD_HEADER.unpack_from(self._data, pos)
+            if pos + _RECORD_HEADER.size + length > len(self._data):
+                break  # (recording was cut off)
+            times.append(t)
+            kinds.append(kind)
+            offsets.append(pos + _RECORD_HEADER.size)
+            lengths.append(length)
+            pos += _RECORD_HEADER.size + length
+        self.times = np.array(times)
+        self.kinds = np.array(kinds, dtype=np.uint8)
+        self._offsets = offsets
+        self._lengths = lengths
+        self.snapshots = np.nonzero(self.kinds == RECORD_SNAPSHOT)[0]
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def get_duration(self):
+        return self.times[-1] if len(self.times) else 0.
+
+    def get_packet(self, i):
+        return memoryview(self._data)[self._offsets[i]:self._offsets[i] + self._lengths[i]]
+
+
+class SessionPlayer(object):
+    """
+    Replays a session into a VectorManager.
+    """
+
+    def __init__(self, session, vector_manager=None):
+        """
+        :param session: Session or filename
+        :param vector_manager: to replay into, (default:  a new one, see .vector_manager)
+        """
+        self.session = session if isinstance(session, Session) else Session(session)
+        self.vector_manager = vector_manager if vector_manager is not None else VectorManager()
+        self._mirror = BoardMirror(self.vector_manager)
+        self._next = 0  # next record to apply
+        self.t = 0.
+
+    def advance_to(self, t):
+        """
+        Apply the records up to time t (frame records, snapshots in between are redundant).
+        :returns: number of records applied
+        """
+        n = 0
+        while self._next < len(self.session) and self.session.times[self._next] <= t:
+            if self.session.kinds[self._next] == RECORD_FRAME or self._next == 0:
+                self._mirror.apply_packet(self.session.get_packet(self._next))
+                n += 1
+            self._next += 1
+        self.t = t
+        return n
+
+    def seek(self, t):
+        """
+        Jump to time t (back or forward), starting from the last snapshot before it if that's less work.
+        """
+        snapshots = self.session.snapshots
+        i = snapshots[max(0, bisect_right(self.session.times[snapshots], t) - 1)]
+        if t < self.t or i >= self._next:
+            self._mirror.apply_packet(self.session.get_packet(i))
+            self._next = i + 1
+        self.advance_to(t)
+
+    def play(self, speed=1.0, on_frame=None, fps=30.0, time_fn=time.perf_counter, sleep_fn=time.sleep):
+        """
+        Replay from the current time to the end.
+        :param speed: 1.0 for real time, N for N times faster, None for as fast as possible
+        :param on_frame: function(t, vector_manager), called after each frame (e.g. to render it)
+        :param fps: frames per second (when speed isn't None)
+        :param time_fn, sleep_fn: clock, (inject virtual ones for headless runs)
+        """
+        duration = self.session.get_duration()
+        if speed is None:
+            while self._next < len(self.session):
+                self.advance_to(self.session.times[self._next])
+                if on_frame is not None:
+                    on_frame(self.t, self.vector_manager)
+            return
+        t_start, t_session = time_fn(), self.t
+        while self.t < duration:
+            t_frame = time_fn()
+            self.advance_to(min(duration, t_session + (t_frame - t_start) * speed))
+            if on_frame is not None:
+                on_frame(self.t, self.vector_manager)
+            sleep_fn(max(0., 1. / fps - (time_fn() - t_frame)))
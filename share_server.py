@@ -0,0 +1,379 @@
+"""
+Share a window's frames with viewers on the local network, over HTTP:
+
+    http://<host>:<port>/              page showing the MJPEG stream
+    http://<host>:<port>/stream.mjpg   multipart/x-mixed-replace JPEG stream
+    http://<host>:<port>/tiles         page showing the tile stream (less bandwidth)
+    http://<host>:<port>/stream.tiles  changed tiles only (see frame_tiles.py), each message prefixed by its length
+
+The drawing loop only hands frames over (share_frame() never blocks):  unchanged frames are skipped (compared on
+a tile grid), encoding runs on a thread pool, and each viewer has a small queue.  MJPEG viewers that can't keep up
+lose their oldest frames, tile viewers lose their queue and get a keyframe instead (deltas can't be skipped).
+Nothing is encoded for a kind of stream nobody is watching.
+"""
+import logging
+import queue
+import struct
+import threading
+import time
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from frame_tiles import dirty_tiles, encode_delta
+
+_BOUNDARY = 'whiteboardframe'
+
+_PAGE = """<!DOCTYPE html>
+<html><head><title>Whiteboard</title></head>
+<body style="margin:0; background:#333">
+<img src="/stream.mjpg" style="display:block; margin:auto; max-width:100%; max-height:100vh">
+</body></html>
+"""
+
+_TILES_PAGE = """<!DOCTYPE html>
+<html><head><title>Whiteboard</title></head>
+<body style="margin:0; background:#333">
+<canvas id="board" style="display:block; margin:auto; max-width:100%; max-height:100vh"></canvas>
+<script>
+const canvas = document.getElementById('board'), ctx = canvas.getContext('2d');
+let drawn = Promise.resolve();  // (keep messages in order)
+
+function apply(msg) {
+    const view = new DataView(msg.buffer, msg.byteOffset, msg.byteLength);
+    const keyframe = view.getUint8(4) & 1, w = view.getUint16(5, true), h = view.getUint16(7, true);
+    const rects = [];
+    let pos = 11;
+    for (let i = 0, n = view.getUint16(9, true); i < n; i++) {
+        const x = view.getUint16(pos, true), y = view.getUint16(pos + 2, true), len = view.getUint32(pos + 8, true);
+        const jpeg = new Blob([msg.subarray(pos + 12, pos + 12 + len)], {type: 'image/jpeg'});
+        rects.push([x, y, createImageBitmap(jpeg)]);
+        pos += 12 + len;
+    }
+    drawn = drawn.then(async () => {
+        if (keyframe && (canvas.width != w || canvas.height != h)) {
+            canvas.width = w;
+            canvas.height = h;
+        }
+        for (const [x, y, bitmap] of rects) {
+            ctx.drawImage(await bitmap, x, y);
+        }
+    });
+}
+
+async function run() {
+    const reader = (await fetch('/stream.tiles')).body.getReader();
+    let buf = new Uint8Array(0);
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) {
+            break;
+        }
+        const joined = new Uint8Array(buf.length + value.length);
+        joined.set(buf);
+        joined.set(value, buf.length);
+        buf = joined;
+        while (buf.length >= 4) {
+            const len = new DataView(buf.buffer, buf.byteOffset).getUint32(0, true);
+            if (buf.length < 4 + len) {
+                break;
+            }
+            apply(buf.slice(4, 4 + len));
+            buf = buf.subarray(4 + len);
+        }
+    }
+}
+run();
+</script>
+</body></html>
+"""
+
+_MSG_LENGTH = struct.Struct('<I')
+
+
+class ShareClient(object):
+    """
+    A connected viewer.
+    """
+
+    def __init__(self, kind, max_queue, min_seq=0):
+        """
+        :param kind: 'mjpeg' or 'tiles'
+        :param min_seq: (tiles) ignore messages for frames up to this one, (the client started with a keyframe)
+        """
+        self.kind = kind
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.min_seq = min_seq
+        self.n_dropped = 0
+
+    def put(self, item):
+        """
+        Queue an item for the viewer.  If the queue is full, MJPEG viewers lose their oldest frame, tile viewers
+        lose everything (they need a keyframe next).
+        :returns: False if the item couldn't be queued
+        """
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.kind == 'tiles':
+                    self.clear()
+                    return False
+                try:
+                    self.queue.get_nowait()
+                    self.n_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def clear(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.n_dropped += 1
+            except queue.Empty:
+                return
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "Whiteboard"
+
+    def log_message(self, format, *args):
+        logging.debug("Share server:  " + format % args)
+
+    def _send_page(self, page):
+        body = page.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, kind, content_type, write):
+        sharer = self.server.sharer
+        self.send_response(200)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        client = sharer.add_client(kind)
+        try:
+            while not sharer.is_closed():
+                try:
+                    item = client.queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                write(item)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            sharer.remove_client(client)
+
+    def _write_jpeg(self, jpeg):
+        self.wfile.write(b'--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %i\r\n\r\n' %
+                         (_BOUNDARY.encode(), len(jpeg)))
+        self.wfile.write(jpeg)
+        self.wfile.write(b'\r\n')
+
+    def _write_msg(self, msg):
+        self.wfile.write(_MSG_LENGTH.pack(len(msg)))
+        self.wfile.write(msg)
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/':
+            self._send_page(_PAGE)
+        elif self.path == '/tiles':
+            self._send_page(_TILES_PAGE)
+        elif self.path == '/stream.mjpg':
+            self._stream('mjpeg', 'multipart/x-mixed-replace; boundary=%s' % _BOUNDARY, self._write_jpeg)
+        elif self.path == '/stream.tiles':
+            self._stream('tiles', 'application/octet-stream', self._write_msg)
+        else:
+            self.send_error(404)
+
+
+class ShareServer(object):
+    """
+    Serves the frames passed to share_frame(), (e.g. add it as a UIWindow frame callback).
+    """
+
+    def __init__(self, port=8080, host='127.0.0.1', n_encoders=2, jpeg_quality=80, max_queue=2, tile_size=64,
+                 keyframe_every=300):
+        """
+        :param port: TCP port (0 for any free one, see get_address())
+        :param host: interface to listen on, '0.0.0.0' to share with other machines.
+        :param n_encoders: encoder threads (cv2.imencode releases the GIL)
+        :param jpeg_quality: 0-100
+        :param max_queue: encoded frames waiting per viewer before old ones are dropped
+        :param tile_size: pixels, for change detection & tile streams
+        :param keyframe_every: send the whole frame to tile viewers every this many (changed) frames
+        """
+        self._jpeg_quality = jpeg_quality
+        self._max_queue = max_queue
+        self._n_encoders = n_encoders
+        self._tile_size = tile_size
+        self._keyframe_every = keyframe_every
+        self._pool = ThreadPoolExecutor(max_workers=n_encoders, thread_name_prefix='share_encoder')
+        self._lock = threading.Lock()  # (short, share_frame takes it)
+        self._send_lock = threading.Lock()  # held while sending to viewers, (and encoding keyframes for them)
+        self._clients = []  # (changed with both locks held)
+        self._last_frame = None  # last frame shared
+        self._waiting = None  # (frame, dirty tiles) not yet encoded, (all encoders were busy)
+        self._n_encoding = 0
+        self._seq = 0  # last frame sent to the encoders
+        self._sent_jpeg_seq = 0  # newest frame sent to MJPEG clients
+        self._latest_jpeg = None  # for new clients
+        self._next_tile_seq = 1
+        self._tile_msgs = {}  # seq: (frame, message), encoded but not sent yet, (tile messages are sent in order)
+        self._keyframe_cache = (None, None, None)  # seq, frame, message of the last keyframe encoded
+        self._closed = False
+        self._stats = {'n_frames': 0, 'n_unchanged': 0, 'n_encoded': 0, 'n_stale': 0, 'n_keyframes': 0,
+                       'last_encode_time': None, 'jpeg_bytes': 0, 'tile_bytes': 0}
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.sharer = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info("Sharing at http://%s:%i/" % self.get_address())
+
+    def get_address(self):
+        return self._httpd.server_address[:2]
+
+    def is_closed(self):
+        return self._closed
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        with self._lock:
+            stats['n_clients'] = len(self._clients)
+            stats['n_dropped'] = sum(client.n_dropped for client in self._clients)
+        return stats
+
+    def _n_watching(self, kind):
+        return sum(1 for client in self._clients if client.kind == kind)
+
+    def _keyframe(self, seq, frame):
+        """
+        :returns: the tile keyframe message for the frame, (encoded once, however many viewers need it)
+        """
+        cached_seq, cached_frame, msg = self._keyframe_cache
+        if cached_seq != seq or cached_frame is not frame:
+            self._stats['n_keyframes'] += 1
+            msg = encode_delta(seq, frame, None, self._tile_size, self._jpeg_quality)
+            self._keyframe_cache = (seq, frame, msg)
+        return msg
+
+    def add_client(self, kind='mjpeg'):
+        """
+        :param kind: 'mjpeg' or 'tiles'
+        """
+        with self._send_lock:
+            # (encoded with the send lock held so no tile message can slip in before the keyframe, and added first
+            # so share_frame doesn't skip the frames after this one as unwatched)
+            with self._lock:
+                seq, frame = self._seq, self._last_frame
+                client = ShareClient(kind, self._max_queue, min_seq=seq)
+                self._clients.append(client)
+            if frame is not None:
+                if kind == 'tiles':
+                    client.put(self._keyframe(seq, frame))
+                else:
+                    if self._latest_jpeg is None or self._sent_jpeg_seq < seq:
+                        self._latest_jpeg = self._encode_jpeg(frame)
+                        self._sent_jpeg_seq = seq
+                    client.put(self._latest_jpeg)
+        logging.info("Share viewer connected (%i total)." % len(self._clients))
+        return client
+
+    def remove_client(self, client):
+        with self._send_lock, self._lock:
+            self._clients.remove(client)
+        logging.info("Share viewer disconnected (%i left)." % len(self._clients))
+
+    def share_frame(self, frame):
+        """
+        Hand a frame to the encoders, (called from the drawing loop, doesn't wait for anything).
+        :param frame: HxWx3 uint8 BGR image, must not be modified afterwards.
+        """
+        self._stats['n_frames'] += 1
+        with self._lock:
+            if not self._clients:  # (nobody watching, just keep it for the next viewer's first frame)
+                self._last_frame = frame
+                return
+        dirty = dirty_tiles(self._last_frame, frame, self._tile_size)
+        if not dirty.any():
+            self._stats['n_unchanged'] += 1
+            return
+        with self._lock:
+            self._last_frame = frame
+            if self._waiting is not None and self._waiting[1].shape == dirty.shape:
+                dirty = dirty | self._waiting[1]  # (changes since the last encoded frame)
+            if self._n_encoding >= self._n_encoders:
+                self._waiting = (frame, dirty)
+                return
+            self._waiting = None
+            self._n_encoding += 1
+            self._seq += 1
+            seq = self._seq
+        self._pool.submit(self._encode, seq, frame, dirty)
+
+    def _encode_jpeg(self, frame):
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self._jpeg_quality])
+        return jpeg.tobytes() if ok else None
+
+    def _encode(self, seq, frame, dirty):
+        while True:
+            jpeg, msg = None, None
+            try:
+                t_start = time.perf_counter()
+                if self._n_watching('mjpeg'):
+                    jpeg = self._encode_jpeg(frame)
+                if self._n_watching('tiles'):
+                    keyframe = (seq - 1) % self._keyframe_every == 0
+                    msg = self._keyframe(seq, frame) if keyframe else \
+                        encode_delta(seq, frame, dirty, self._tile_size, self._jpeg_quality)
+                self._stats['last_encode_time'] = time.perf_counter() - t_start
+                self._stats['n_encoded'] += 1
+            except Exception as e:
+                logging.error("Share encoder failed:  %s" % (e,))
+            self._send(seq, frame, jpeg, msg)
+            with self._lock:
+                if self._waiting is None or self._closed:
+                    self._n_encoding -= 1
+                    return
+                (frame, dirty), self._waiting = self._waiting, None
+                self._seq += 1
+                seq = self._seq
+
+    def _send(self, seq, frame, jpeg, msg):
+        with self._send_lock:
+            if jpeg is not None:
+                if seq < self._sent_jpeg_seq:  # a newer frame finished encoding first
+                    self._stats['n_stale'] += 1
+                else:
+                    self._sent_jpeg_seq = seq
+                    self._latest_jpeg = jpeg
+                    for client in self._clients:
+                        if client.kind == 'mjpeg':
+                            client.put(jpeg)
+                            self._stats['jpeg_bytes'] += len(jpeg)
+
+            self._tile_msgs[seq] = (frame, msg)
+            while self._next_tile_seq in self._tile_msgs:
+                frame, msg = self._tile_msgs.pop(self._next_tile_seq)
+                for client in self._clients:
+                    if client.kind != 'tiles' or self._next_tile_seq <= client.min_seq:
+                        continue
+                    if msg is None or not client.put(msg):  # (fell behind, or joined while this was encoded)
+                        msg_for_client = self._keyframe(self._next_tile_seq, frame)
+                        client.put(msg_for_client)
+                        self._stats['tile_bytes'] += len(msg_for_client)
+                    else:
+                        self._stats['tile_bytes'] += len(msg)
+                self._next_tile_seq += 1
+
+    def close(self):
+        self._closed = True
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._pool.shutdown(wait=True)
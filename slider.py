@@ -9,6 +9,9 @@ import logging
 from util import get_font_size, in_bbox, is_numeric, draw_bbox
 from controls import Control
 from gui_components import MouseReturnStates
+from layout_cache import LAYOUT_CACHE
+
+_LABEL_SAMPLES = 1001  # evenly spaced slider positions whose labels are measured
 
 
 def value_from_position(values, position, interpolate=True):
@@ -201,11 +204,24 @@ class Slider(Control):
 
     def _get_max_label_dims(self):
         """
-        Set 1000 random values and return the biggest label dimensions.
+        Biggest width & height of the labels the slider can show, (the same every run, see layout_cache.py).
+        """
+        params = [self._label, self._values, self._interpolate, self._label_font, self._font_scale,
+                  self._font_thickness]
+        width, height = LAYOUT_CACHE.get('slider_label_dims', params, self._measure_max_label_dims)
+        return width, height
+
+    def _measure_max_label_dims(self):
+        """
+        Measure the distinct labels at evenly spaced positions (and at each of the values).
         """
+        values = list(self._values)
+        if self._interpolate:
+            positions = np.linspace(0, 1, _LABEL_SAMPLES)
+            values += list(np.interp(positions, np.linspace(0, 1, len(self._values)), self._values))
+        labels = set(self._get_disp_str(val=value) for value in values)
         max_width, max_height = 0, 0
-        for i in range(1000):
-            label = self._get_disp_str(val=self.get_value(rel_val=np.random.rand()))
+        for label in labels:
             (width, height), _ = cv2.getTextSize(label, self._label_font, self._font_scale, self._font_thickness)
             max_width = max(max_width, width)
             max_height = max(max_height, height)
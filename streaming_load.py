@@ -0,0 +1,201 @@
+"""
+Load a board in the background, nearest-to-the-view first, so windows can come up (and be drawn on) right away.
+"""
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from board_file import is_binary_board, unpack_vectors, column_bboxes, load_board, iter_columns
+from vector_manager import BoardOps
+
+
+class StreamingLoader(object):
+    """
+    A thread reads the file and makes Vector objects in batches, starting with those visible in the view.
+    Call tick() from the UI thread (e.g. every frame) to add the finished batches to the VectorManager, (one add op
+    per batch, marked as applying loaded vectors so the journal & undo history skip them).
+    When loading is done, the drawing order is restored to what it was in the file (vectors drawn while
+    loading stay on top).  If reading the file fails, tick() raises the error and the VectorManager stays marked as
+    loading, so the part of the board that was loaded is never saved over the file.
+
+    Binary files are decoded a batch of rows at a time, in file order:  the visible vectors of each batch are added
+    as soon as it's decoded, the rest once everything is, nearest to the view first.
+    """
+
+    def __init__(self, vector_manager, filename, view=None, records=None, batch_size=2000):
+        """
+        :param filename: board file (binary or JSON format)
+        :param view: BoardView, load what it sees first
+        :param records: function returning a list of (op, apply_op kwargs) to apply on top of the file
+            (journal records), called on the loader thread.
+        :param batch_size: vectors per batch
+        """
+        self._vm = vector_manager
+        self._filename = filename
+        self._view = view
+        self._records = records
+        self._batch_size = batch_size
+        self._queue = queue.Queue()
+        self._done = False
+        self._error = None
+        self._n_loaded = 0
+        self._t_start = time.perf_counter()
+        self._vm.set_loading(True)
+        self._thread = threading.Thread(target=self._load, daemon=True)
+        self._thread.start()
+
+    def is_done(self):
+        return self._done
+
+    def get_n_loaded(self):
+        return self._n_loaded
+
+    def _view_distances(self, bboxes):
+        """
+        :param bboxes: Nx4 array (x_min, x_max, y_min, y_max)
+        :returns: boolean array (in the view), array of distances from the view's center, (everything is in the view
+            at distance 0 if there's no view)
+        """
+        if self._view is None or len(bboxes) == 0:
+            return np.ones(len(bboxes), dtype=bool), np.zeros(len(bboxes))
+        view_bbox = self._view.board_bbox
+        center = np.array([sum(view_bbox['x']) / 2, sum(view_bbox['y']) / 2])
+        visible = (bboxes[:, 0] <= view_bbox['x'][1]) & (view_bbox['x'][0] <= bboxes[:, 1]) & \
+                  (bboxes[:, 2] <= view_bbox['y'][1]) & (view_bbox['y'][0] <= bboxes[:, 3])
+        dist = np.hypot((bboxes[:, 0] + bboxes[:, 1]) / 2 - center[0], (bboxes[:, 2] + bboxes[:, 3]) / 2 - center[1])
+        return visible, dist
+
+    def _load(self):
+        try:
+            if is_binary_board(self._filename):
+                self._load_binary()
+            else:
+                self._load_json()
+        except Exception as e:
+            logging.error("Failed loading %s:  %s" % (self._filename, e))
+            self._queue.put(('error', e))
+
+    def _fold_records(self, ids):
+        """
+        Apply the journal records to the file's rows (by id) without making Vector objects for the rows.
+        :param ids: vector ids of the rows (on the board & deleted)
+        :returns: removed (set of rows no longer on the board), replaced ({row: new version}),
+                  added (list of vectors), deleted_rows (rows deleted, in order), deleted (other deleted vectors)
+        """
+        row_of = {vector_id: row for row, vector_id in enumerate(ids)}
+        removed, replaced, added, deleted_rows, deleted = set(), {}, {}, [], []
+        for op, kwargs in (self._records() if self._records is not None else []):
+            if op == BoardOps.add:
+                added.update({vector.id: vector for vector in kwargs['vectors']})
+            elif op == BoardOps.delete:
+                for vector_id in kwargs['ids']:
+                    if vector_id in added:
+                        deleted.append(added.pop(vector_id))
+                    elif vector_id in row_of and row_of[vector_id] not in removed:
+                        row = row_of[vector_id]
+                        removed.add(row)
+                        if row in replaced:
+                            deleted.append(replaced.pop(row))
+                        else:
+                            deleted_rows.append(row)
+            elif op in (BoardOps.move, BoardOps.restyle):
+                for vector in kwargs['vectors']:
+                    if vector.id in added:
+                        added[vector.id] = vector
+                    elif vector.id in row_of and row_of[vector.id] not in removed:
+                        replaced[row_of[vector.id]] = vector
+            elif op == BoardOps.clear:
+                removed.update(range(len(ids)))
+                replaced, added = {}, {}
+        return removed, replaced, list(added.values()), deleted_rows, deleted
+
+    def _load_binary(self):
+        rank, deleted_by_row, later = {}, {}, []  # later:  (distance, row, vector) for vectors not in the view
+        with np.load(self._filename) as npz:
+            n_vectors = int(npz['n_vectors'])
+            ids = npz['ids'].tolist()
+            removed, replaced, added, deleted_rows, deleted = self._fold_records(ids)
+            keep_deleted = set(deleted_rows)
+            for start, columns in iter_columns(npz, self._batch_size):
+                visible, dist = self._view_distances(column_bboxes(columns))
+                batch = []
+                for i, vector in enumerate(unpack_vectors(columns)):
+                    row = start + i
+                    if row >= n_vectors or row in keep_deleted:
+                        deleted_by_row[row] = vector
+                    if row >= n_vectors or row in removed:
+                        continue
+                    vector = replaced.get(row, vector)
+                    rank[vector.id] = row
+                    if visible[i]:
+                        batch.append(vector)
+                    else:
+                        later.append((dist[i], row, vector))
+                if batch:
+                    self._queue.put(('vectors', batch))
+        later.sort(key=lambda item: item[:2])
+        for start in range(0, len(later), self._batch_size):
+            self._queue.put(('vectors', [vector for _, _, vector in later[start:start + self._batch_size]]))
+        for i, vector in enumerate(added):
+            rank[vector.id] = len(ids) + i
+        self._queue.put(('vectors', added))
+
+        deleted_rows = sorted(deleted_rows) + list(range(n_vectors, len(ids)))
+        deleted = [deleted_by_row[row] for row in deleted_rows] + deleted
+        self._queue.put(('done', deleted, rank))
+
+    def _load_json(self):
+        vectors, deleted = load_board(self._filename, self._vm._types)
+        if self._records is not None and len(self._records()) > 0:
+            logging.warning("Journal records can't be applied to old (JSON) board files while streaming, ignoring.")
+        bboxes = np.array([[v.get_bbox()['x'][0], v.get_bbox()['x'][1], v.get_bbox()['y'][0], v.get_bbox()['y'][1]]
+                           for v in vectors]).reshape(-1, 4)
+        visible, dist = self._view_distances(bboxes)
+        order = np.lexsort((dist, ~visible))
+        rank = {vector.id: i for i, vector in enumerate(vectors)}
+        for start in range(0, len(order), self._batch_size):
+            self._queue.put(('vectors', [vectors[i] for i in order[start:start + self._batch_size]]))
+        self._queue.put(('done', deleted, rank))
+
+    def tick(self, max_batches=None):
+        """
+        Add the vectors loaded so far to the VectorManager (call from the UI thread).
+        :param max_batches: limit the work done per call
+        :returns: True if loading is finished
+        :raises: the loader thread's exception, if reading the file failed (on every call after that)
+        """
+        n = 0
+        while not self._done and self._error is None and (max_batches is None or n < max_batches):
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            n += 1
+            if item[0] == 'vectors' and len(item[1]) > 0:
+                self._vm.set_applying_loaded(True)
+                try:
+                    self._vm.apply_op(BoardOps.add, vectors=item[1])
+                finally:
+                    self._vm.set_applying_loaded(False)
+                self._n_loaded += len(item[1])
+            elif item[0] == 'done':
+                _, deleted, rank = item
+                self._vm._deleted = deleted + self._vm._deleted
+                self._vm._vectors.sort(key=lambda v: rank.get(v.id, np.inf))
+                self._vm.set_loading(False)
+                self._done = True
+                logging.info("Loaded %i vectors from %s in %.3f sec." %
+                             (self._n_loaded, self._filename, time.perf_counter() - self._t_start))
+            elif item[0] == 'error':
+                self._error = item[1]
+        if self._error is not None:
+            raise self._error
+        return self._done
+
+    def wait(self):
+        """
+        Block until everything is loaded, (raises like tick() if loading fails).
+        """
+        while not self.tick():
+            time.sleep(0.001)
@@ -0,0 +1,26 @@
+import os
+from tempfile import mkdtemp
+from vector_manager import VectorManager
+from autosave import AutoSaver
+from test_journal import _draw
+
+
+def test_autosave():
+    """
+    Saves happen in the background, are skipped when nothing changed, and load back.
+    """
+    filename = os.path.join(mkdtemp(), 'autosave.npz')
+    vm = VectorManager()
+    saver = AutoSaver(vm, filename, interval=0.0)
+    for _ in range(3):
+        _draw(vm)
+    assert saver.save_now()
+    saver.wait()
+    stats = saver.get_stats()
+    assert stats['n_saves'] == 1 and stats['last_bytes'] == os.path.getsize(filename) and stats['last_n_vectors'] == 3
+
+    assert not saver.save_now(), "nothing changed, shouldn't save"
+    _draw(vm)
+    saver.close()
+    assert saver.get_stats()['n_saves'] == 2
+    assert [v.id for v in VectorManager(filename)._vectors] == [v.id for v in vm._vectors]
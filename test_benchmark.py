@@ -0,0 +1,41 @@
+import json
+import os
+from tempfile import mkdtemp
+import numpy as np
+from benchmark import make_board, run_benchmarks, compare, main
+
+
+def test_make_board():
+    """
+    Synthetic boards have exactly the requested number of stroke points, with each stroke a random walk.
+    """
+    for stroke_lengths in ['short', 'lognormal', 'long']:
+        vm = make_board(5000, stroke_lengths)
+        strokes = [v for v in vm.get_all_vectors() if v.name == 'PencilVec']
+        assert sum(len(v._points) for v in strokes) == 5000
+        steps = np.vstack([np.diff(v._points, axis=0) for v in strokes if len(v._points) > 1])
+        assert np.abs(steps).max() < 30, "strokes should be continuous"
+    names = [v.name for v in make_board(5000).get_all_vectors()]
+    assert 'TextVec' in names and 'CircleVec' in names
+
+
+def test_benchmark_baseline():
+    """
+    Run a tiny benchmark, write it as JSON, check comparing against a (faster) baseline reports regressions.
+    """
+    results = run_benchmarks([500], repeat=1, log=lambda msg: None)
+    assert {'render_fit@500', 'get_vectors_in@500', 'select@500', 'pan_20_frames@500', 'save@500',
+            'load@500'} <= set(results['results'])
+    baseline = json.loads(json.dumps(results))
+    assert not any(regression for *_, regression in compare(results, baseline))
+    baseline['results']['load@500']['median'] /= 10.
+    assert [c[0] for c in compare(results, baseline) if c[-1]] == ['load@500']
+
+    temp_dir = mkdtemp()
+    baseline_file = os.path.join(temp_dir, 'baseline.json')
+    with open(baseline_file, 'w') as f:
+        json.dump(baseline, f)
+    out_file = os.path.join(temp_dir, 'results.json')
+    main(['--sizes', '500', '--repeat', '1', '--out', out_file, '--baseline', baseline_file])
+    with open(out_file) as f:
+        assert set(json.load(f)['results']) == set(results['results'])
@@ -0,0 +1,157 @@
+import time
+import numpy as np
+from vectors import PencilVec, LineVec, TextVec
+from vector_manager import VectorManager
+from board_sync import SyncServer, SyncClient
+from board_view import get_board_view
+from point_codec import DEFAULT_GRID
+from test_journal import _draw
+
+
+def _sync(server, clients):
+    server.tick()
+    for client in clients:
+        t_start = time.perf_counter()
+        while client.seq != server.get_seq():
+            client.tick()
+            time.sleep(0.001)
+            assert time.perf_counter() - t_start < 5.0
+
+
+def _assert_same(vm, vm2):
+    for vecs, vecs2 in [(vm.get_all_vectors(), vm2.get_all_vectors()),
+                        (vm.get_vectors_in_progress(), vm2.get_vectors_in_progress())]:
+        assert [(type(v), v.id, v._color, v._thickness) for v in vecs] == \
+               [(type(v), v.id, v._color, v._thickness) for v in vecs2]
+        for v, v2 in zip(vecs, vecs2):
+            assert np.allclose(np.array(v._points).reshape(-1, 2), np.array(v2._points).reshape(-1, 2),
+                               atol=DEFAULT_GRID)
+            assert getattr(v, '_text', None) == getattr(v2, '_text', None)
+    view = get_board_view('test', np.array([[-50., -50.], [50., 50.]]), (200, 200))
+    frame, frame2 = np.zeros((200, 200, 3), np.uint8), np.zeros((200, 200, 3), np.uint8)
+    vm.render(frame, view)
+    vm2.render(frame2, view)
+    assert np.mean(frame != frame2) < 0.001
+
+
+def test_board_sync():
+    """
+    Viewers (one joining late) reproduce the board, including strokes in progress, through every kind of op.
+    """
+    vm = VectorManager()
+    server = SyncServer(vm)
+    early = SyncClient(VectorManager(), *server.get_address())
+    vecs = [_draw(vm) for _ in range(5)]
+    _sync(server, [early])
+
+    stroke = PencilVec('red', 3)
+    vm.start_vector(stroke)
+    line = LineVec('blue', 2)
+    vm.start_vector(line)
+    for i in range(10):
+        stroke.add_point(np.array([i, i ** 2 / 10.]))
+        line.add_point(np.array([-i, 2. * i]))
+        _sync(server, [early])
+    _assert_same(vm, early._vm)
+
+    late = SyncClient(VectorManager(), *server.get_address())
+    _sync(server, [early, late])
+    text = TextVec('black', 20.)
+    text.add_point(np.array([5., 5.]))
+    vm.start_vector(text)
+    text.add_letters('hi')
+    stroke.add_point(np.array([20., 3.]))
+    _sync(server, [early, late])
+    _assert_same(vm, late._vm)
+
+    vm.cancel_vectors([line])
+    stroke.finalize()
+    text.finalize()
+    vm.finish_vectors()
+    vm.delete(vecs[1])
+    vm.select_vectors([vecs[2]])
+    vm.get_selected()[0].move_to((10., 10.))
+    vm.deselect_vectors_commit()
+    vm.restyle([vecs[3]], color='green', thickness=4)
+    _sync(server, [early, late])
+    for client in [early, late]:
+        _assert_same(vm, client._vm)
+
+    vm.clear()
+    _draw(vm)
+    _sync(server, [early, late])
+    for client in [early, late]:
+        _assert_same(vm, client._vm)
+        client.close()
+    server.close()
+
+
+def test_board_sync_backpressure():
+    """
+    A viewer over its byte budget skips the backlog and catches up from a snapshot.
+    """
+    vm = VectorManager()
+    server = SyncServer(vm, max_queued_bytes=4096)
+    client = SyncClient(VectorManager(), *server.get_address())
+    _sync(server, [client])
+    viewer = server._viewers[0]
+    viewer.send(b'\0' * 5000)  # (too big, dropped)
+    for _ in range(3):
+        _draw(vm)
+    _sync(server, [client])
+    assert viewer.n_resets == 1 and server.get_stats()['n_snapshots'] == 2
+    _assert_same(vm, client._vm)
+    client.close()
+    server.close()
+
+
+def test_board_sync_big_snapshot():
+    """
+    A board bigger than the byte budget still reaches a new viewer, (the snapshot isn't limited by it).
+    """
+    vm = VectorManager()
+    for _ in range(20):
+        _draw(vm, n_pts=100)
+    server = SyncServer(vm, max_queued_bytes=1024)
+    client = SyncClient(VectorManager(), *server.get_address())
+    while not server._viewers:
+        time.sleep(0.001)
+    _sync(server, [client])
+    _draw(vm)
+    _sync(server, [client])
+    assert server.get_stats()['n_snapshots'] == 1 and server._viewers[0].n_resets == 0
+    _assert_same(vm, client._vm)
+    client.close()
+    server.close()
+
+
+def test_board_sync_idle():
+    """
+    Ops aren't encoded while nobody is watching, a viewer connecting later still gets the whole board.
+    """
+    vm = VectorManager()
+    server = SyncServer(vm)
+    server.tick()
+    for _ in range(5):
+        _draw(vm)
+    server.tick()
+    assert server._encoder._frame_msgs == [] and server.get_stats()['n_snapshots'] == 0
+
+    stroke = PencilVec('red', 3)
+    vm.start_vector(stroke)
+    stroke.add_point(np.array([1., 2.]))
+    server.tick()
+    client = SyncClient(VectorManager(), *server.get_address())
+    while server.get_stats()['n_viewers'] == 0:
+        time.sleep(0.001)
+    stroke.add_point(np.array([3., 4.]))
+    _sync(server, [client])
+    _assert_same(vm, client._vm)
+    stroke.add_point(np.array([5., 1.]))
+    stroke.finalize()
+    vm.finish_vectors()
+    _draw(vm)
+    _sync(server, [client])
+    _assert_same(vm, client._vm)
+    client.close()
+    server.close()
@@ -0,0 +1,89 @@
+import os
+from tempfile import mkdtemp
+import cv2
+import numpy as np
+from display import HeadlessBackend, NO_KEY
+from layout import BOARD_LAYOUT, COLORS_BGR
+from whiteboard import WhiteboardApp
+from vector_manager import VectorManager
+from journal import Journal
+
+
+def test_headless_backend():
+    """
+    Injected events are delivered in time order as the virtual clock reaches them, keys stop the delivery.
+    """
+    display = HeadlessBackend(count_work_time=False)
+    received = []
+    display.create_window('win', (100, 50), lambda event, x, y, flags, param: received.append((display.time(), x)),
+                          param='win')
+    display.inject_mouse('win', cv2.EVENT_MOUSEMOVE, 2, 0, t=0.0105)
+    display.inject_mouse('win', cv2.EVENT_MOUSEMOVE, 1, 0, t=0.0005)
+    display.inject_key(ord('a'), t=0.0015)
+    display.inject_mouse('win', cv2.EVENT_MOUSEMOVE, 3, 0, t=0.0016)
+
+    assert display.wait_key(1) == NO_KEY and received == [(0.0005, 1)]
+    assert display.wait_key(1) == ord('a') and np.isclose(display.time(), 0.0015)
+    assert display.wait_key(10) == NO_KEY and [x for _, x in received] == [1, 3, 2]
+    assert display.get_n_pending() == 0
+
+    frame = np.zeros((50, 100, 3), np.uint8)
+    display.show('win', frame)
+    assert display.get_frame('win') is frame and display.get_n_shown('win') == 1
+    assert HeadlessBackend(max_time=0.).wait_key(1) == 27
+
+
+def test_headless_app():
+    """
+    Run the whole app without a display:  draw a stroke in the board window, check the board and the frames.
+    """
+    display = HeadlessBackend()
+    app = WhiteboardApp(display=display)
+    title = BOARD_LAYOUT['win_name']
+    t = 0.1
+    display.inject_mouse(title, cv2.EVENT_LBUTTONDOWN, 100, 100, t=t)
+    for i in range(1, 20):
+        t += 0.005
+        display.inject_mouse(title, cv2.EVENT_MOUSEMOVE, 100 + 10 * i, 100 + 5 * i, flags=cv2.EVENT_FLAG_LBUTTON, t=t)
+    display.inject_mouse(title, cv2.EVENT_LBUTTONUP, 300, 200, t=t + 0.005)
+    display.inject_key(ord('q'), t=t + 0.1)
+    app.run()
+
+    vectors = app._vector_manager.get_all_vectors()
+    assert len(vectors) == 1 and vectors[0].name == 'PencilVec' and len(vectors[0]._points) == 20
+    frame = display.get_frame(title)
+    assert frame.shape[:2] == (BOARD_LAYOUT['win_size'][1], BOARD_LAYOUT['win_size'][0])
+    assert (frame[150] != COLORS_BGR[BOARD_LAYOUT['bkg_color']]).any(axis=1).any(), "stroke should be drawn"
+    assert display.get_n_shown(title) > 10
+    assert app._latency.get_stats()['pencil']['imshow']['n'] == 21
+
+
+def test_app_crash_teardown():
+    """
+    If the frame loop raises, the app still shuts down:  the journal is flushed, (the stroke survives).
+    """
+    state_file = os.path.join(mkdtemp(), 'board.npz')
+    display = HeadlessBackend()
+    app = WhiteboardApp(state_file=state_file, display=display)
+    keypress = app._keypress
+
+    def _crash(key):
+        if key == ord('x'):
+            raise RuntimeError("crash")
+        return keypress(key)
+
+    app._keypress = _crash
+    title = BOARD_LAYOUT['win_name']
+    display.inject_mouse(title, cv2.EVENT_LBUTTONDOWN, 100, 100, t=0.1)
+    display.inject_mouse(title, cv2.EVENT_MOUSEMOVE, 200, 150, flags=cv2.EVENT_FLAG_LBUTTON, t=0.11)
+    display.inject_mouse(title, cv2.EVENT_LBUTTONUP, 200, 150, t=0.12)
+    display.inject_key(ord('x'), t=0.2)
+    try:
+        app.run()
+        assert False, "the crash should propagate"
+    except RuntimeError:
+        pass
+    assert app._journal._file.closed
+    vm = VectorManager()
+    Journal(vm, state_file).close()
+    assert [v.id for v in vm.get_all_vectors()] == [v.id for v in app._vector_manager.get_all_vectors()] != []
@@ -0,0 +1,74 @@
+import numpy as np
+from board_view import BoardView
+from display import HeadlessBackend
+from frame_profiler import FrameProfiler, RingBuffer, STAGES
+from tools import ToolManager
+from vector_manager import VectorManager
+from windows import UIWindow
+from test_latency import _App
+from test_vectors import _make_board
+
+
+def test_ring_buffer():
+    """
+    Only the last n values are kept.
+    """
+    ring = RingBuffer(10)
+    assert len(ring) == 0
+    for value in range(25):
+        ring.add(value)
+    assert len(ring) == 10 and sorted(ring.get_values()) == list(range(15, 25))
+
+
+def test_frame_profiler():
+    """
+    Stage timings go to their own rings, percentiles come out in order, vector counts add up, and the HUD draws.
+    """
+    profiler = FrameProfiler(n_frames=50, hud_update_interval=5)
+    vm = _make_board(100, 10)
+    for vec in vm._vectors[::2]:
+        vec.move_to(vec.get_centroid() + 1000.)
+    view = BoardView('test', (320, 240), np.array([-160., -120.]), 1.0)
+    frame = np.zeros((240, 320, 3), np.uint8)
+    for _ in range(60):
+        profiler.start_frame()
+        profiler.mark('blank')
+        vm.render(frame, view, counts=profiler.get_counts())
+        profiler.mark('vectors')
+        profiler.end_frame()
+    profiler.add_time('mouse', 1.5)
+
+    stats = profiler.get_stats()
+    assert set(stats) == {'blank', 'vectors', 'mouse', 'frame'}
+    assert stats['vectors']['n'] == 50 and stats['mouse']['p99'] == 1.5
+    assert stats['vectors']['p50'] <= stats['vectors']['p95'] <= stats['vectors']['p99']
+    assert stats['frame']['p50'] >= stats['vectors']['p50']
+
+    counts = profiler.get_counts()
+    assert counts['vectors'] == len(vm._vectors) and counts['in_progress'] == 0
+    assert counts['drawn'] + counts['culled'] == counts['vectors']
+    assert counts['drawn'] == sum(view.sees_bbox(v.get_bbox()) for v in vm._vectors) and counts['culled'] >= 50
+
+    hud = np.full((240, 320, 3), 200, np.uint8)
+    profiler.draw_hud(hud)
+    assert hud[2, 2, 0] < 100, "HUD background should be darkened"
+    assert (hud == 255).any(), "HUD should have text"
+    assert set(STAGES) >= {'blank', 'grid', 'vectors', 'controls', 'tools', 'imshow'}
+
+
+def test_hud_not_in_callback_frames():
+    """
+    The HUD is drawn on the shown frame only, frame callbacks (viewers, recordings) get the board without it.
+    """
+    app, vm = _App(), VectorManager()
+    display = HeadlessBackend()
+    window = UIWindow('board', app, BoardView('board', (320, 240), np.array([0., 0.]), 1.), vm,
+                      ToolManager(app, vm), 'Board', (320, 240), display=display)
+    window.set_profiling(True)
+    shared = []
+    window.add_frame_callback(shared.append)
+    for _ in range(20):
+        window.refresh({'show_hud': True})
+    shown = display.get_frame('Board')
+    assert (shown != shared[-1]).any(), "the HUD should be shown"
+    assert (shared[-1] == shared[0]).all(), "callback frames should be the plain board"
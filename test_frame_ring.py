@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+from tempfile import mkdtemp
+import cv2
+import numpy as np
+from frame_ring import FrameRing, FrameRingReader, dump_frames
+
+
+def test_frame_ring():
+    """
+    Frames are read back as views, unchanged frames aren't copied, overwritten slots are detected, and the
+    reference consumer dumps frames from another process.
+    """
+    name = 'wb_test_%s' % uuid.uuid4().hex[:8]
+    ring = FrameRing(name, (60, 80, 3), n_slots=3)
+    try:
+        reader = FrameRingReader(name)
+        assert reader.read() is None
+        frame = np.zeros((60, 80, 3), dtype=np.uint8)
+        for i in range(1, 4):
+            frame = frame.copy()
+            frame[i * 10:i * 10 + 5] = 255
+            ring.publish(frame)
+        index, _, dirty, view, _ = reader.read()
+        assert index == 3 and dirty and np.array_equal(view, frame)
+        assert not view.flags.owndata
+
+        ring.publish(frame.copy())
+        index, _, dirty, same_view, content_index = reader.read()
+        assert index == 4 and not dirty and content_index == 3 and np.array_equal(same_view, frame)
+        assert reader.is_valid(3) and reader.read(3)[2]  # (same slot & pixels as frame 4)
+        assert reader.read(2) is not None
+        for _ in range(3):
+            frame = frame.copy()
+            frame[0] += 1
+            ring.publish(frame)
+        assert reader.read(2) is None
+        reader.close()
+
+        out_dir = mkdtemp()
+        consumer = subprocess.Popen([sys.executable, '-c', 'import frame_ring; frame_ring.dump_frames(%r, %r, 3)' %
+                                     (name, out_dir)], cwd=os.path.dirname(os.path.abspath(__file__)))
+        while consumer.poll() is None:
+            frame = frame.copy()
+            frame[-1] += 1
+            ring.publish(frame)
+            time.sleep(0.005)
+        assert consumer.returncode == 0 and len(os.listdir(out_dir)) == 3
+        saved = cv2.imread(os.path.join(out_dir, sorted(os.listdir(out_dir))[0]))
+        assert saved.shape == (60, 80, 3)
+    finally:
+        ring.close()
+
+
+def test_frame_ring_skipped_dirty():
+    """
+    A reader that misses a dirty frame still dumps its content, from the clean frame after it.
+    """
+    name = 'wb_test_%s' % uuid.uuid4().hex[:8]
+    ring = FrameRing(name, (60, 80, 3), n_slots=3)
+    try:
+        frame = np.zeros((60, 80, 3), dtype=np.uint8)
+        ring.publish(frame)
+        frame = frame.copy()
+        frame[10:20] = 255
+        ring.publish(frame)  # (dirty, but the reader only starts at the next one)
+        ring.publish(frame.copy())
+        out_dir = mkdtemp()
+        assert dump_frames(name, out_dir, timeout=0.1) == 1
+        assert os.listdir(out_dir) == ['frame_00000002.png']
+        assert np.array_equal(cv2.imread(os.path.join(out_dir, 'frame_00000002.png')), frame)
+    finally:
+        ring.close()
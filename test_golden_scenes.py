@@ -0,0 +1,42 @@
+import os
+from tempfile import mkdtemp
+import cv2
+from golden_scenes import SCENES, check_scenes, compare_images, update_goldens, render, main
+
+
+def test_golden_images():
+    """
+    Every view of every scene renders like its golden image, (times are reported, not checked, tests run on
+    busy machines).
+    """
+    results = check_scenes(repeat=2, check_time=False)
+    assert len(results) == sum(len(scene.views) for scene in SCENES.values())
+    for result in results:
+        assert result['image_ok'], "%s/%s differs from its golden image" % (result['scene'], result['view'])
+        assert result['median_ms'] > 0 and result['budget_ms'] > 0
+
+
+def test_compare_images():
+    """
+    Small differences are tolerated, a missing stroke isn't, and failures are written as images.
+    """
+    scene = SCENES['shapes']
+    vm = scene.load_board()
+    image = render(vm, scene.get_view(vm, '1x'), scene.show_grid)
+    golden = image.copy()
+    assert compare_images(image, golden)['diff_fraction'] == 0.
+    faint = cv2.add(image, 10)
+    assert compare_images(faint, golden)['ok']
+    changed = image.copy()
+    cv2.line(changed, (0, 0), (999, 499), (0, 0, 0), 3)
+    assert not compare_images(changed, golden)['ok']
+    assert not compare_images(image[:-1], golden)['ok']
+
+    golden_dir = mkdtemp()
+    update_goldens(['shapes'], golden_dir)
+    cv2.imwrite(scene.get_image_file('4x', golden_dir), changed)
+    out_dir = os.path.join(golden_dir, 'failures')
+    results = check_scenes(['shapes'], golden_dir, repeat=1, out_dir=out_dir, check_time=False)
+    assert [r['view'] for r in results if not r['ok']] == ['4x']
+    assert os.path.exists(results[1]['failure_image'])
+    assert main(['--scenes', 'shapes', '--golden-dir', golden_dir, '--repeat', '1']) == 1
@@ -0,0 +1,147 @@
+import time
+import numpy as np
+from vector_manager import VectorManager, BoardOps
+from history import History
+from timeline import Timeline
+from test_vectors import _make_board
+from test_journal import _draw
+
+
+def _state_of(vectors):
+    # (undone deletes go back on top, so ignore drawing order)
+    return sorted((v.id, v._color, v._thickness, tuple(np.round(v.get_centroid(), 6))) for v in vectors)
+
+
+def _state(vm):
+    return _state_of(vm.get_all_vectors())
+
+
+def test_undo_redo():
+    """
+    Undo every kind of change back to an empty board, then redo it all.
+    """
+    vm = VectorManager()
+    history = History(vm, coalesce_window=0.)
+    states = [_state(vm)]
+    vecs = []
+    for _ in range(3):
+        vecs.append(_draw(vm))
+        states.append(_state(vm))
+    vm.delete(vecs[1])
+    states.append(_state(vm))
+    vm.select_vectors([vecs[0]])
+    vm.get_selected()[0].move_to((50., 50.))
+    vm.deselect_vectors_commit()
+    states.append(_state(vm))
+    vm.restyle([vm.get_all_vectors()[0]], color='red', thickness=5)
+    states.append(_state(vm))
+    vm.clear()
+    states.append(_state(vm))
+
+    for state in states[-2::-1]:
+        assert history.undo()
+        assert _state(vm) == state
+    assert not history.undo()
+    for state in states[1:]:
+        assert history.redo()
+        assert _state(vm) == state
+    assert not history.redo()
+
+    # undo/redo a clear again, and the board never shares a list with its caller
+    history.undo()
+    assert history.redo() and vm.get_all_vectors() == []
+    history.undo()
+    assert _state(vm) == states[-2]
+    vectors = [vecs[0].copy()]
+    vm.clear()
+    vm.apply_op(BoardOps.add, vectors=vectors)
+    vectors.append(vecs[1])
+    assert len(vm.get_all_vectors()) == 1
+
+    # a new change forgets what could be redone
+    history.undo()
+    _draw(vm)
+    assert not history.can_redo()
+
+
+def test_history_limits():
+    """
+    Drags coalesce, memory/step limits drop the oldest commands, undoing a clear only copies a list (with no other op
+    callbacks), a clear's memory counts its points.
+    """
+    vm = VectorManager()
+    history = History(vm, max_commands=5, coalesce_window=10.)
+    vec = _draw(vm)
+    for x in range(20):
+        vm.select_vectors([vm.get_all_vectors()[0]])
+        vm.get_selected()[0].move_to((x, 0.))
+        vm.deselect_vectors_commit()
+    history.undo()  # the whole drag
+    assert np.allclose(vm.get_all_vectors()[0].get_centroid(), vec.get_centroid())
+
+    history = History(vm, max_commands=5, coalesce_window=0.)
+    for _ in range(10):
+        _draw(vm)
+    assert len(history._undo_stack) == 5
+    history._max_bytes = history.get_memory_used() // 2
+    _draw(vm)
+    assert len(history._undo_stack) < 5
+
+    vm = _make_board(20000, 2)
+    n_vectors = len(vm.get_all_vectors())
+    history = History(vm)
+    vm.clear()
+    assert history.get_memory_used() >= sum(len(v._points) * 16 for v in history._undo_stack[0]._vectors)
+    t_start = time.perf_counter()
+    history.undo()
+    assert time.perf_counter() - t_start < 0.005
+    assert len(vm.get_all_vectors()) == n_vectors
+
+
+def test_timeline():
+    """
+    The board at every past moment matches what it was then, whichever checkpoint the query starts from.
+    """
+    vm = VectorManager()
+    Timeline(vm, checkpoint_every=7)
+    times, states = [time.time()], [_state(vm)]
+    for i in range(60):
+        if i % 10 == 9:
+            vm.clear()
+        elif i % 5 == 4 and vm.get_all_vectors():
+            vm.restyle(vm.get_all_vectors()[:2], color='red')
+        elif i % 3 == 2 and vm.get_all_vectors():
+            vm.delete(vm.get_all_vectors()[0])
+        else:
+            _draw(vm)
+        times.append(time.time())
+        states.append(_state(vm))
+    for t, state in zip(times, states):
+        assert _state_of(vm.get_vectors_at(t)) == state
+    vm.clear()
+    first = _draw(vm)
+    time.sleep(0.01)
+    t_between = time.time()
+    time.sleep(0.01)
+    second = _draw(vm)
+    assert vm.get_vectors_at(t_between) == [first]
+    assert vm.get_vectors_at(second._finalized_t) == [first, second]
+
+
+def test_timeline_bounded():
+    """
+    Old checkpoints are dropped, the recent past is still exact and earlier times give the earliest state kept.
+    """
+    vm = VectorManager()
+    timeline = Timeline(vm, checkpoint_every=5, max_checkpoints=3)
+    times, states = [], []
+    for _ in range(40):
+        _draw(vm)
+        times.append(time.time())
+        states.append(_state(vm))
+    assert len(timeline._checkpoints) == 3 and len(timeline._deltas) <= 3 * 5
+    earliest, _ = timeline.get_time_range()
+    for t, state in zip(times, states):
+        if t >= earliest:
+            assert _state_of(vm.get_vectors_at(t)) == state
+    assert len(vm.get_vectors_at(times[0])) == len(timeline._checkpoints[0][1]) > 1
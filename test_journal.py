@@ -0,0 +1,225 @@
+import os
+import time
+import numpy as np
+from tempfile import mkdtemp
+from vectors import PencilVec
+from vector_manager import VectorManager
+from journal import Journal
+from chunked_board import is_chunked_board
+from history import History
+from streaming_load import StreamingLoader
+from vector_manager import BoardOps
+from board_view import get_board_view
+from point_codec import DEFAULT_GRID
+from board_file import save_board
+
+
+def _draw(vm, n_pts=10):
+    vec = PencilVec('black', 2)
+    for pt in np.cumsum(np.random.normal(0, 3, (n_pts, 2)), axis=0):
+        vec.add_point(pt)
+    vec.finalize()
+    vm.start_vector(vec, also_finish=True)
+    return vec
+
+
+def _ids(vm):
+    return [v.id for v in vm.get_all_vectors()]
+
+
+def test_journal_recovery():
+    """
+    Make some changes, "crash" (don't close), check a new journal recovers the board, before and after compaction,
+    and that a torn record at the end is ignored.
+    """
+    state_file = os.path.join(mkdtemp(), 'board.npz')
+    vm = VectorManager()
+    journal = Journal(vm, state_file, sync_every=1)
+    vecs = [_draw(vm) for _ in range(5)]
+    vm.delete(vecs[1])
+    vm.select_vectors([vecs[2]])
+    vm.get_selected()[0].move_to((100., 100.))
+    vm.deselect_vectors_commit()
+    vm.undo_delete()
+    journal.sync()
+
+    vm2 = VectorManager()
+    Journal(vm2, state_file)
+    assert _ids(vm2) == _ids(vm)
+    moved = [v for v in vm2.get_all_vectors() if v.id == vecs[2].id][0]
+    assert np.allclose(moved.get_centroid(), (100., 100.), atol=DEFAULT_GRID)
+
+    # snapshot, then more changes on top of it
+    journal.compact(wait=True)
+    assert not os.path.exists(state_file + '.journal.old')
+    vm.clear()
+    _draw(vm)
+    journal.sync()
+    with open(state_file + '.journal', 'ab') as f:
+        f.write(b'\x40\x00\x00\x00torn')
+
+    vm3 = VectorManager()
+    Journal(vm3, state_file)
+    assert _ids(vm3) == _ids(vm) and len(_ids(vm3)) == 1
+
+
+def test_journal_streaming():
+    """
+    Streaming recovery gives the same board (and drawing order) as loading it all up front.
+    """
+    state_file = os.path.join(mkdtemp(), 'board.npz')
+    vm = VectorManager()
+    journal = Journal(vm, state_file)
+    vecs = [_draw(vm) for _ in range(30)]
+    journal.compact(wait=True)
+    vm.delete(vecs[3])
+    vm.select_vectors([vecs[5]])
+    vm.get_selected()[0].move_to((-50., 20.))
+    vm.deselect_vectors_commit()
+    _draw(vm)
+    journal.close()
+
+    view = get_board_view('test', np.array([[-60., 10.], [-40., 30.]]), (100, 100))
+    vm2 = VectorManager()
+    journal2 = Journal(vm2, state_file, stream=True, view=view)
+    assert vm2.is_loading()
+    journal2._loader.wait()
+    assert not vm2.is_loading()
+    assert _ids(vm2) == _ids(vm)
+    assert [v.id for v in vm2._deleted] == [v.id for v in vm._deleted]
+
+
+def test_streaming_ops():
+    """
+    Loaded batches are add ops (for gauges, viewers, ...), but aren't journaled again or undoable, and the visible
+    vectors come first.
+    """
+    state_file = os.path.join(mkdtemp(), 'board.npz')
+    vm = VectorManager()
+    journal = Journal(vm, state_file)
+    vecs = [_draw(vm) for _ in range(50)]
+    for i, vec in enumerate(vecs):
+        vec.move_to((1000. * (i % 2), 0.))
+    journal.compact(wait=True)
+    journal.close()
+
+    view = get_board_view('test', np.array([[-10., -10.], [10., 10.]]), (100, 100))
+    vm2 = VectorManager()
+    history = History(vm2)
+    added = []
+    vm2.add_op_callback(lambda op, vectors, old: added.append([v.id for v in vectors]) if op == BoardOps.add else None)
+    journal2 = Journal(vm2, state_file, stream=True, view=view)
+    journal2._loader.wait()
+    assert _ids(vm2) == _ids(vm) and sum(len(batch) for batch in added) == 50
+    assert len(history._undo_stack) == 0 and journal2._size == 0
+
+    vm3 = VectorManager()
+    added = []
+    vm3.add_op_callback(lambda op, vectors, old: added.append([v.id for v in vectors]))
+    StreamingLoader(vm3, state_file, view=view, batch_size=10).wait()
+    assert len(added) > 2 and set(sum(added, [])[:25]) == {v.id for v in vecs[::2]}, "visible vectors first"
+    assert _ids(vm3) == _ids(vm)
+
+
+def test_streaming_truncated():
+    """
+    A state file that ends early fails loading (rather than looking loaded with part of the board), and the partly
+    loaded board is never compacted over it.
+    """
+    state_file = os.path.join(mkdtemp(), 'board.npz')
+    vm = VectorManager()
+    vecs = [_draw(vm, n_pts=200) for _ in range(50)]
+    save_board(state_file, vecs, [], point_grid=DEFAULT_GRID)
+    with np.load(state_file) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    arrays['points_encoded'] = arrays['points_encoded'][:len(arrays['points_encoded']) // 2]
+    with open(state_file, 'wb') as f:
+        np.savez(f, **arrays)
+    with open(state_file, 'rb') as f:
+        truncated = f.read()
+
+    vm2 = VectorManager()
+    journal = Journal(vm2, state_file, stream=True, compact_bytes=0)
+    try:
+        while journal.is_loading():
+            journal.tick()
+            time.sleep(0.001)
+        assert False, "loading a truncated file should fail"
+    except ValueError:
+        pass
+    assert vm2.is_loading() and not journal.is_loading()
+    _draw(vm2)  # (journaled, but too big a journal doesn't compact now)
+    assert not journal.is_compacting()
+    try:
+        journal.compact()
+        assert False, "a partly loaded board shouldn't be compacted"
+    except RuntimeError:
+        pass
+    journal.close()
+    with open(state_file, 'rb') as f:
+        assert f.read() == truncated
+
+
+def test_journal_formats():
+    """
+    Snapshots are written in the state file's format, JSON state files (no journal position) are converted to .npz
+    once and journaled as that.
+    """
+    temp_dir = mkdtemp()
+    json_file = os.path.join(temp_dir, 'old_board.json')
+    vm = VectorManager()
+    for _ in range(3):
+        _draw(vm)
+    vm.save(json_file)
+    with open(json_file, 'rb') as f:
+        json_data = f.read()
+    vm2 = VectorManager()
+    journal = Journal(vm2, json_file)
+    assert _ids(vm2) == _ids(vm) and os.path.exists(os.path.join(temp_dir, 'old_board.npz'))
+    _draw(vm2)
+    journal.compact(wait=True)
+    _draw(vm2)
+    journal.close()
+    vm3 = VectorManager()
+    Journal(vm3, json_file).close()
+    assert _ids(vm3) == _ids(vm2) and len(_ids(vm3)) == 5
+    with open(json_file, 'rb') as f:
+        assert f.read() == json_data
+
+    state_file = os.path.join(temp_dir, 'board.wbc')
+    vm = VectorManager()
+    journal = Journal(vm, state_file)
+    for _ in range(5):
+        _draw(vm)
+    journal.compact(wait=True)
+    _draw(vm)
+    journal.close()
+    assert is_chunked_board(state_file)
+    vm2 = VectorManager()
+    Journal(vm2, state_file).close()
+    assert sorted(_ids(vm2)) == sorted(_ids(vm))
+
+
+def test_chunked_compactions():
+    """
+    A snapshot of a chunked board reads the file the board was opened from, even if an earlier compaction has
+    replaced it by the time the snapshot is written.
+    """
+    state_file = os.path.join(mkdtemp(), 'board.wbc')
+    seed = VectorManager()
+    for _ in range(5):
+        _draw(seed)
+    seed.save(state_file)
+
+    vm = VectorManager()
+    journal = Journal(vm, state_file)
+    vec_a = _draw(vm)
+    journal.compact(wait=True)
+    _draw(vm)
+    vm.delete(vec_a)
+    journal.compact(wait=True)
+    journal.close()
+
+    vm2 = VectorManager()
+    Journal(vm2, state_file).close()
+    assert sorted(_ids(vm2)) == sorted(_ids(vm)) and len(_ids(vm2)) == 6 and vec_a.id not in _ids(vm2)
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+from board_view import BoardView
+from display import HeadlessBackend
+from latency import LatencyTracker
+from metrics import MetricsRegistry
+from tools import ToolManager
+from vector_manager import VectorManager
+from windows import UIWindow
+
+
+class _App(object):
+    def is_active_window(self, win_name):
+        return True
+
+    def set_active_window(self, win_name):
+        pass
+
+    def get_option(self, option_name):
+        return False
+
+
+def test_latency():
+    """
+    Mouse events are timed (virtual clock) until the next frame of their window is shown, per tool & sink.
+    """
+    clock = [0.]
+    registry = MetricsRegistry()
+    tracker = LatencyTracker(time_fn=lambda: clock[0], registry=registry)
+    app, vm = _App(), VectorManager()
+    tools = ToolManager(app, vm)
+    window = UIWindow('board', app, BoardView('board', (200, 100), np.array([0., 0.]), 1.), vm, tools, 'Board',
+                      (200, 100), display=HeadlessBackend())
+    window.set_latency_tracker(tracker)
+    shared = []
+    window.add_frame_callback(lambda frame: shared.append(clock[0]))
+
+    for tool_name, delay in [('pencil', 0.010), ('line', 0.020), ('pan', 0.030)]:
+        tools.switch_tool(tool_name)
+        for i, event in enumerate([cv2.EVENT_LBUTTONDOWN, cv2.EVENT_MOUSEMOVE, cv2.EVENT_MOUSEMOVE,
+                                   cv2.EVENT_LBUTTONUP]):
+            window.cv2_mouse_event(event, 10 + 10 * i, 20 + 5 * i, 0, None)
+            clock[0] += delay
+            window.refresh()
+    window.cv2_mouse_event(cv2.EVENT_MOUSEMOVE, 50, 50, 0, None)  # (not captured, no state change)
+    clock[0] += 1.
+    window.refresh()
+
+    stats = tracker.get_stats()
+    assert set(stats) == {'pencil', 'line', 'pan'}
+    for tool_name, delay in [('pencil', 10.), ('line', 20.), ('pan', 30.)]:
+        assert stats[tool_name]['imshow']['n'] == 4 and stats[tool_name]['callbacks']['n'] == 4
+        assert np.isclose(stats[tool_name]['imshow']['p50'], delay)
+        assert np.isclose(stats[tool_name]['imshow']['max'], delay)
+    assert registry.snapshot()['latency'] == stats
+    assert len(vm.get_all_vectors()) == 2
+
+
+def test_latency_batched():
+    """
+    Several events drawn in the same frame each get their own latency, an event in another window waits for it.
+    """
+    clock = [0.]
+    tracker = LatencyTracker(time_fn=lambda: clock[0], registry=None)
+    for t in [0., 0.004, 0.008]:
+        clock[0] = t
+        tracker.event_handled('board', tracker.now(), 'pencil')
+    tracker.event_handled('control', tracker.now(), 'select')
+    clock[0] = 0.010
+    tracker.start_frame('board')
+    clock[0] = 0.016
+    tracker.frame_presented('board')
+    stats = tracker.get_stats()
+    assert list(stats) == ['pencil'] and stats['pencil']['imshow']['n'] == 3
+    assert np.isclose(stats['pencil']['imshow']['max'], 16.) and np.isclose(stats['pencil']['imshow']['p50'], 12.)
+    tracker.start_frame('control')
+    clock[0] = 0.020
+    tracker.frame_presented('control')
+    assert np.isclose(tracker.get_stats()['select']['imshow']['p50'], 12.)
+
+
+def test_latency_with_profiling():
+    """
+    The profiler times mouse handling on its own clock, not the display's (virtual) one.
+    """
+    clock = [1e6]
+    tracker = LatencyTracker(time_fn=lambda: clock[0], registry=None)
+    app, vm = _App(), VectorManager()
+    window = UIWindow('board', app, BoardView('board', (200, 100), np.array([0., 0.]), 1.), vm,
+                      ToolManager(app, vm), 'Board', (200, 100), display=HeadlessBackend())
+    window.set_latency_tracker(tracker)
+    window.set_profiling(True)
+    for i, event in enumerate([cv2.EVENT_LBUTTONDOWN, cv2.EVENT_MOUSEMOVE, cv2.EVENT_LBUTTONUP]):
+        window.cv2_mouse_event(event, 10 + 10 * i, 20, 0, None)
+        clock[0] += 0.010
+        window.refresh()
+    assert 0. <= window.get_profiler().get_stats()['mouse']['p99'] < 1000.
+    assert np.isclose(tracker.get_stats()['pencil']['imshow']['p50'], 10.)
@@ -0,0 +1,75 @@
+import os
+import shutil
+from tempfile import mkdtemp
+import cv2
+import numpy as np
+import layout_cache
+from layout_cache import LayoutCache, get_layout_key
+from slider import Slider
+
+
+def test_layout_cache():
+    """
+    Values are computed once, kept across runs in the file, and recomputed for a different layout.
+    """
+    filename = os.path.join(mkdtemp(), 'cache', 'layout_cache.json')
+    sizes = {'board': (1000, 500), 'control': (700, 450)}
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return (12, 34)
+
+    cache = LayoutCache()
+    cache.load(filename, sizes)
+    assert cache.get('dims', ['Zoom %.1f', 0.5], compute) == [12, 34]
+    assert cache.get('dims', ['Zoom %.1f', 0.5], compute) == [12, 34] and len(computed) == 1
+    cache.save()
+
+    cache = LayoutCache()
+    cache.load(filename, sizes)
+    assert cache.get('dims', ['Zoom %.1f', 0.5], compute) == [12, 34] and len(computed) == 1
+    assert cache.get('dims', ['Zoom %.2f', 0.5], compute) == [12, 34] and len(computed) == 2
+
+    cache.load(filename, {'board': (1200, 500), 'control': (700, 450)})
+    cache.get('dims', ['Zoom %.1f', 0.5], compute)
+    assert len(computed) == 3
+
+    with open(filename, 'w') as f:
+        f.write("{not json")
+    cache.load(filename, sizes)
+    cache.get('dims', ['Zoom %.1f', 0.5], compute)
+    assert len(computed) == 4
+
+
+def test_layout_key():
+    """
+    Changing the code that computes entries (e.g. how slider labels are formatted) starts the cache over.
+    """
+    sizes = {'board': (1000, 500)}
+    key = get_layout_key(sizes)
+    assert any(os.path.basename(filename) == 'slider.py' for filename in layout_cache._KEY_FILES)
+    key_files = layout_cache._KEY_FILES
+    temp_dir = mkdtemp()
+    layout_cache._KEY_FILES = [shutil.copy(filename, temp_dir) for filename in key_files]
+    try:
+        assert get_layout_key(sizes) == key
+        with open(layout_cache._KEY_FILES[-1], 'a') as f:
+            f.write("\n# changed\n")
+        assert get_layout_key(sizes) != key
+    finally:
+        layout_cache._KEY_FILES = key_files
+
+
+def test_slider_label_dims():
+    """
+    The measured label size covers every label the slider can show, (checked at random positions).
+    """
+    bbox = {'x': (0, 300), 'y': (0, 40)}
+    for label_str, values in [("Zoom: %.1f", [1., 10.]), ("%.3f", [0.01, 2.5, 100.])]:
+        slider = Slider(None, bbox, 'slider', values=values, label_str=label_str, init_val=values[0])
+        width, height = slider._get_max_label_dims()
+        labels = [slider._get_disp_str(slider.get_value(position)) for position in np.random.rand(1000)]
+        sizes = [cv2.getTextSize(label, slider._label_font, slider._font_scale, slider._font_thickness)[0]
+                 for label in labels]
+        assert max(w for w, _ in sizes) <= width and max(h for _, h in sizes) <= height
@@ -0,0 +1,36 @@
+import numpy as np
+from load_generator import LoadGenerator, SimulatedUser, BEHAVIORS
+
+
+def test_simulated_user():
+    """
+    Users' gestures stay in the window, follow their mix, and repeat with the seed.
+    """
+    size = (1000, 500)
+    user = SimulatedUser(0, mix={'pencil': 1, 'circle': 1}, seed=1)
+    gestures = [user.next_gesture(size) for _ in range(50)]
+    assert {behavior for behavior, *_ in gestures} == {'pencil', 'circle'}
+    for behavior, tool_name, points in gestures:
+        assert tool_name == behavior and len(points) >= 5
+        assert (points >= 0).all() and (points < size).all()
+    again = SimulatedUser(0, mix={'pencil': 1, 'circle': 1}, seed=1)
+    assert all(np.array_equal(points, again.next_gesture(size)[2]) for _, _, points in gestures)
+
+
+def test_load_generator():
+    """
+    A short run with every behavior makes vectors, moves some, and reports rates & memory.
+    """
+    generator = LoadGenerator(n_users=3, mix={name: 1 for name in BEHAVIORS}, seed=2, report_interval=0.5)
+    results = generator.run(2.)
+    gestures = results['gestures']
+    assert sum(gestures.values()) >= 6 and sum(1 for n in gestures.values() if n) >= 3
+    assert results['ops']['add'] > 0
+    if gestures['select'] and results['ops']['move']:
+        assert not generator.app._vector_manager.get_selected(), "selections should be committed"
+    reports = results['reports']
+    assert len(reports) >= 3 and reports[-1]['vectors'] == len(generator.app._vector_manager.get_all_vectors())
+    assert all(report['frames'] > 0 and report['frame_ms']['p50'] > 0 for report in reports[:-1])
+    summary = results['summary']
+    assert summary['ops_per_sec'] > 0 and summary['rss_growth_bytes'] == reports[-1]['rss_bytes'] - \
+        reports[0]['rss_bytes']
@@ -0,0 +1,65 @@
+import numpy as np
+from board_view import BoardView
+from history import History
+from memory_stats import MemoryAccounting, AllocationSnapshots
+from metrics import MetricsRegistry
+from timeline import Timeline
+from vector_manager import VectorManager
+from vectors import CircleVec
+from test_journal import _draw
+
+
+def test_memory_accounting():
+    """
+    Each part counts the vectors it holds, shared ones are counted once in the total, caches are found.
+    """
+    vm = VectorManager()
+    history = History(vm, coalesce_window=0.)
+    timeline = Timeline(vm)
+    registry = MetricsRegistry()
+    memory = MemoryAccounting(vm, history, timeline, registry=registry)
+    vecs = [_draw(vm, n_pts=100) for _ in range(5)]
+    stats = memory.get_stats()
+    assert stats['board'] == {'vectors': 5, 'bytes': 5 * 100 * 16, 'exclusive_bytes': 0}
+    assert stats['history']['vectors'] == 5 and stats['timeline']['bytes'] == 5 * 1600
+    assert stats['total_bytes'] == 5 * 1600
+
+    vm.delete(vecs[0])
+    circle = CircleVec('red', 2)
+    circle.add_point((0., 0.))
+    circle.add_point((10., 0.))
+    vm.start_vector(circle)
+    circle.render(np.zeros((100, 100, 3), np.uint8), BoardView('board', (100, 100), np.array((-50., -50.)), 1.))
+    assert registry.snapshot()['memory'] is None, "only measured when asked"
+    memory.update()
+    stats = registry.snapshot()['memory']
+    assert stats['board']['vectors'] == 4 and stats['deleted']['vectors'] == 1
+    assert stats['deleted']['exclusive_bytes'] == 0, "the history & timeline still have the deleted vector"
+    assert stats['in_progress']['vectors'] == 1 and stats['in_progress']['exclusive_bytes'] > 0
+    assert stats['render_caches']['vectors'] == 1 and stats['render_caches']['bytes'] > 0
+
+    circle.finalize()
+    vm.select_vectors(vm.get_all_vectors()[:2])  # (selecting finishes the circle)
+    stats = memory.get_stats()
+    assert stats['selected'] == {'vectors': 2, 'bytes': 3200, 'exclusive_bytes': 3200}, "selections are copies"
+    memory.close()
+    assert 'memory' not in registry.snapshot()
+
+
+def test_allocation_snapshots():
+    """
+    Memory allocated between two snapshots shows up in the diff, at the line that allocated it.
+    """
+    snapshots = AllocationSnapshots()
+    try:
+        snapshots.take('before')
+        kept = [bytearray(800000) for _ in range(5)]  # 4 MB
+        snapshots.take('after')
+        assert snapshots.get_labels() == ['before', 'after']
+        biggest = snapshots.diff(limit=5)[0]
+        assert 'test_memory_stats.py' in biggest['where'] and biggest['size_diff'] >= 4000000
+        assert snapshots.diff('after', 'before')[0]['size_diff'] <= -4000000
+        assert snapshots.get_traced_memory()[0] >= 4000000 and len(kept) == 5
+    finally:
+        snapshots.stop()
+    assert snapshots.get_traced_memory() == (0, 0)
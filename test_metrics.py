@@ -0,0 +1,80 @@
+import json
+import os
+import urllib.request
+from tempfile import mkdtemp
+import numpy as np
+from metrics import MetricsRegistry, MetricsServer
+from board_metrics import BoardMetrics
+from vector_manager import VectorManager, BoardOps
+from test_journal import _draw
+
+
+def test_metrics_registry():
+    """
+    Counters, gauges (set or computed when read), histograms & hit rates show up in snapshots, files and the server.
+    """
+    registry = MetricsRegistry()
+    registry.counter('test.events').inc()
+    registry.counter('test.events').inc(2)
+    registry.gauge('test.level').set(7)
+    registry.gauge('test.computed', fn=lambda: [1, 2])
+    histogram = registry.histogram('test.frame_ms')
+    for value in np.arange(1, 101):
+        histogram.observe(value)
+    hits, misses = registry.hit_rate('test.cache')
+    hits.inc(3)
+    misses.inc()
+
+    snapshot = registry.snapshot()
+    assert snapshot['test.events'] == 3 and snapshot['test.level'] == 7 and snapshot['test.computed'] == [1, 2]
+    assert snapshot['test.cache.hit_rate'] == 0.75
+    frame_ms = snapshot['test.frame_ms']
+    assert frame_ms['n'] == 100 and frame_ms['max'] == 100 and frame_ms['mean'] == 50.5
+    assert 50 <= frame_ms['p50'] <= 100 and frame_ms['p99'] >= 99
+    assert sum(count for _, count in frame_ms['buckets']) == 100
+
+    filename = os.path.join(mkdtemp(), 'metrics.json')
+    registry.write_json(filename)
+    with open(filename) as f:
+        assert json.load(f)['test.events'] == 3
+
+    server = MetricsServer(registry, port=0)
+    try:
+        with urllib.request.urlopen('http://%s:%i/metrics' % server.get_address()) as response:
+            assert json.loads(response.read())['test.cache.hits'] == 3
+    finally:
+        server.close()
+
+
+def test_board_metrics():
+    """
+    Vector counts by type & total points follow every op without walking the board.
+    """
+    registry = MetricsRegistry()
+    vm = VectorManager()
+    vecs = [_draw(vm, n_pts=10) for _ in range(3)]
+    board_metrics = BoardMetrics(vm, registry)
+
+    def check():
+        snapshot = registry.snapshot()
+        counts = {}
+        for vec in vm.get_all_vectors():
+            counts[vec.name] = counts.get(vec.name, 0) + 1
+        assert {k: v for k, v in snapshot['board.vectors'].items() if v} == counts
+        assert snapshot['board.points'] == sum(len(vec._points) for vec in vm.get_all_vectors())
+
+    check()
+    _draw(vm, n_pts=5)
+    check()
+    vm.delete(vecs[0])
+    check()
+    vm.restyle([vecs[1]], color='red')
+    check()
+    vm.undo_delete()
+    check()
+    vm.clear()
+    check()
+    vm.apply_op(BoardOps.add, vectors=vecs)
+    check()
+    board_metrics.close()
+    assert 'board.points' not in registry.snapshot()
@@ -0,0 +1,31 @@
+import numpy as np
+from point_codec import encode_points, decode_points, PointDecoder
+
+
+def test_point_codec():
+    """
+    Round trip error is at most grid / 2, with and without zlib, and pen-like strokes shrink a lot.
+    """
+    pts = np.cumsum(np.random.normal(0, 2, (10000, 2)), axis=0)
+    pts[::100] += np.random.uniform(-1e6, 1e6, (100, 2))  # big jumps between strokes
+    for grid in [1. / 128, 0.01, 1.0]:
+        for compress in [False, True]:
+            decoded = decode_points(encode_points(pts, grid=grid, compress=compress))
+            assert decoded.shape == pts.shape
+            assert np.abs(decoded - pts).max() <= grid / 2
+
+    assert len(encode_points(pts)) < pts.astype(np.float32).nbytes / 2
+    assert decode_points(encode_points(np.zeros((0, 2)))).shape == (0, 2)
+
+
+def test_point_decoder():
+    """
+    Decoding a piece at a time gives the same points as decoding them all at once.
+    """
+    pts = np.cumsum(np.random.normal(0, 2, (10000, 2)), axis=0)
+    for compress in [False, True]:
+        buf = encode_points(pts, compress=compress)
+        decoder = PointDecoder(buf, read_size=64)
+        pieces = [decoder.decode(n) for n in [0, 1, 999, 5000, 20000]]
+        assert [len(piece) for piece in pieces] == [0, 1, 999, 5000, 4000]
+        assert np.array_equal(np.concatenate(pieces), decode_points(buf))
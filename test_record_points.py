@@ -0,0 +1,59 @@
+import os
+from tempfile import mkdtemp
+import cv2
+from display import HeadlessBackend
+from layout import BOARD_LAYOUT, CONTROL_LAYOUT
+from record_points import RecordingBackend, load_trace, replay_trace
+from whiteboard import WhiteboardApp
+
+
+def _record(filename):
+    """
+    Record a trace of a scripted session (two strokes in the board window, some clicks in the control window).
+    """
+    display = HeadlessBackend()
+    recorder = RecordingBackend(display, filename)
+    app = WhiteboardApp(display=recorder)
+    board, control = BOARD_LAYOUT['win_name'], CONTROL_LAYOUT['win_name']
+    t = 0.05
+    for stroke in range(2):
+        display.inject_mouse(board, cv2.EVENT_LBUTTONDOWN, 100, 100 + 50 * stroke, t=t)
+        for i in range(1, 15):
+            t += 0.004
+            display.inject_mouse(board, cv2.EVENT_MOUSEMOVE, 100 + 15 * i, 100 + 50 * stroke + 3 * i,
+                                 flags=cv2.EVENT_FLAG_LBUTTON, t=t)
+        display.inject_mouse(board, cv2.EVENT_LBUTTONUP, 310, 150, t=t + 0.004)
+        display.inject_mouse(control, cv2.EVENT_MOUSEMOVE, 20, 20, t=t + 0.01)
+        t += 0.1
+    display.inject_key(ord('q'), t=t)
+    app.run()
+    recorder.close(app._vector_manager)
+    return app
+
+
+def test_trace_replay():
+    """
+    A recorded trace replays (flat out & in real time) to the same board, with frame & latency stats.
+    """
+    filename = os.path.join(mkdtemp(), 'session.trace')
+    app = _record(filename)
+    assert len(app._vector_manager.get_all_vectors()) == 2
+    header, events, end = load_trace(filename)
+    assert set(header['windows']) == {BOARD_LAYOUT['win_name'], CONTROL_LAYOUT['win_name']}
+    assert len(events) == 2 * 16 + 2 + 1 and events[-1]['kind'] == 'key'
+    assert all(a['t'] <= b['t'] for a, b in zip(events, events[1:]))
+
+    for realtime in [False, True]:
+        result = replay_trace(filename, realtime=realtime)
+        assert result['board_matches'] is True
+        assert result['n_events'] == len(events)
+        assert result['latency']['pencil']['imshow']['n'] == 32
+        assert result['frames'][BOARD_LAYOUT['win_name']]['n'] > 2
+        if realtime:
+            assert result['duration'] >= events[-1]['t']
+
+    with open(filename) as f:
+        lines = f.readlines()
+    with open(filename, 'w') as f:
+        f.writelines(lines[:-4] + lines[-1:])  # (lose the last stroke's end & the rest)
+    assert replay_trace(filename)['board_matches'] is False
@@ -0,0 +1,91 @@
+import random
+import socket
+import time
+import numpy as np
+from vector_manager import VectorManager
+from replica import Replica, ReplicaLink
+from history import History
+from point_codec import DEFAULT_GRID
+from test_journal import _draw
+
+
+def _board(vm):
+    return [(v.id, v._color, v._thickness) for v in vm.get_all_vectors()]
+
+
+def _random_op(vm, rng):
+    vectors = vm.get_all_vectors()
+    choice = rng.random()
+    if choice < 0.4 or not vectors:
+        _draw(vm)
+    elif choice < 0.6:
+        vm.delete(rng.choice(vectors))
+    elif choice < 0.75:
+        vm.select_vectors([rng.choice(vectors)])
+        vm.get_selected()[0].move_to(tuple(rng.uniform(-100, 100, 2)))
+        vm.deselect_vectors_commit()
+    elif choice < 0.9:
+        vm.restyle([rng.choice(vectors)], color=rng.choice(['red', 'green', 'blue']), thickness=int(rng.integers(1, 6)))
+    elif choice < 0.95:
+        vm.undo_delete()
+    else:
+        vm.clear()
+
+
+def test_replicas_converge():
+    """
+    Three replicas with skewed clocks make concurrent random edits, ops are delivered late, out of order and
+    duplicated, after everything is delivered the boards are identical.
+    """
+    rng = np.random.default_rng(0)
+    clock = [1000]
+    skews = [0, 5, -3]
+    vms = [VectorManager() for _ in skews]
+    replicas = [Replica(vm, i, time_fn=lambda skew=skew: clock[0] + skew) for i, (vm, skew) in enumerate(zip(vms, skews))]
+    histories = [History(vm) for vm in vms]
+    in_flight = []  # (destination, msg)
+
+    for step in range(300):
+        clock[0] += int(rng.integers(0, 2))
+        i = int(rng.integers(0, len(vms)))
+        _random_op(vms[i], rng)
+        if rng.random() < 0.05:
+            histories[i].undo()
+        for msg in replicas[i].get_outgoing():
+            in_flight.extend((j, msg) for j in range(len(vms)) if j != i)
+        # deliver a random part of what's in flight, in random order, sometimes twice
+        rng.shuffle(in_flight)
+        n_deliver = int(rng.integers(0, len(in_flight) + 1))
+        for j, msg in in_flight[:n_deliver]:
+            replicas[j].receive(msg)
+            if rng.random() < 0.05:
+                replicas[j].receive(msg)
+        in_flight = in_flight[n_deliver:]
+
+    for j, msg in in_flight:
+        replicas[j].receive(msg)
+    boards = [_board(vm) for vm in vms]
+    assert len(boards[0]) > 0
+    assert boards[1] == boards[0] and boards[2] == boards[0]
+    for v0, v1 in zip(vms[0].get_all_vectors(), vms[1].get_all_vectors()):
+        assert np.allclose(v0._points, v1._points, atol=DEFAULT_GRID)
+
+
+def test_replica_link():
+    """
+    Two replicas over a socket.
+    """
+    vm, vm2 = VectorManager(), VectorManager()
+    sock, sock2 = socket.socketpair()
+    link, link2 = ReplicaLink(Replica(vm, 1), sock), ReplicaLink(Replica(vm2, 2), sock2)
+    vecs = [_draw(vm) for _ in range(3)]
+    _draw(vm2)
+    vm.delete(vecs[0])
+    t_start = time.perf_counter()
+    while len(vm.get_all_vectors()) != 3 or _board(vm) != _board(vm2):
+        link.tick()
+        link2.tick()
+        time.sleep(0.001)
+        assert time.perf_counter() - t_start < 5.0
+    link.close()
+    link2.close()
@@ -0,0 +1,139 @@
+import os
+import time
+from tempfile import mkdtemp
+import cv2
+import numpy as np
+from layout import COLORS_BGR
+from point_codec import DEFAULT_GRID
+from vectors import PencilVec
+from vector_manager import VectorManager
+from session import SessionRecorder, Session, SessionPlayer
+from video_export import export_video, fit_view, _session_bbox
+from test_journal import _draw
+from test_board_sync import _assert_same
+from test_vectors import _make_board
+
+
+def _record(filename):
+    """
+    Record a scripted session on a virtual clock.
+    :returns: list of (t, board state as a VectorManager copy) at every frame
+    """
+    clock = [0.]
+    vm = VectorManager()
+    _draw(vm)
+    recorder = SessionRecorder(vm, filename, snapshot_interval=1.0, time_fn=lambda: clock[0])
+    states = []
+
+    def frame():
+        clock[0] += 0.1
+        recorder.tick()
+        copy = VectorManager()
+        copy._vectors = [v.copy() for v in vm.get_all_vectors()]
+        copy._vecs_in_progress = [v.copy() for v in vm.get_vectors_in_progress()]
+        states.append((clock[0], copy))
+
+    for i in range(40):
+        if i % 10 == 0:
+            stroke = PencilVec('blue', 2)
+            vm.start_vector(stroke)
+        stroke.add_point(np.array([i, np.sin(i)]) * 10)
+        if i % 10 == 9:
+            stroke.finalize()
+            vm.finish_vectors()
+        if i == 25:
+            vm.delete(vm.get_all_vectors()[0])
+        if i == 29:
+            vm.select_vectors(vm.get_all_vectors()[:1])
+            vm.get_selected()[0].move_to((5., 5.))
+            vm.deselect_vectors_commit()
+        frame()
+    vm.clear()
+    _draw(vm)
+    frame()
+    recorder.close()
+    return states
+
+
+def test_session_replay():
+    """
+    Replaying (straight through, seeking back & forth, at any speed) gives the board as it was at each time.
+    """
+    filename = os.path.join(mkdtemp(), 'lecture.wbs')
+    states = _record(filename)
+    session = Session(filename)
+    assert len(session.snapshots) > 3
+
+    player = SessionPlayer(session)
+    for t, state in states:
+        player.advance_to(t)
+        _assert_same(state, player.vector_manager)
+    for i in [30, 3, 17, 40, 0, 22]:
+        player.seek(states[i][0])
+        _assert_same(states[i][1], player.vector_manager)
+
+    frames = []
+    SessionPlayer(filename).play(speed=None, on_frame=lambda t, vm: frames.append(t))
+    assert frames[-1] == session.get_duration()
+
+    clock = [0.]
+    player = SessionPlayer(filename)
+    player.play(speed=4.0, fps=10., time_fn=lambda: clock[0], sleep_fn=lambda dt: clock.__setitem__(0, clock[0] + dt))
+    assert np.isclose(clock[0], session.get_duration() / 4, atol=0.2)
+    _assert_same(states[-1][1], player.vector_manager)
+
+
+def test_session_snapshots_off_ui_thread():
+    """
+    Snapshots of a big board are encoded by the writer thread, not in tick(), and still replay the board.
+    """
+    filename = os.path.join(mkdtemp(), 'big.wbs')
+    vm = _make_board(50000, 10)
+    clock = [0.]
+    t_start = time.perf_counter()
+    recorder = SessionRecorder(vm, filename, snapshot_interval=1.0, time_fn=lambda: clock[0])
+    _draw(vm)
+    clock[0] = 2.
+    recorder.tick()
+    assert time.perf_counter() - t_start < 0.05
+    recorder.close()
+    session = Session(filename)
+    assert len(session.snapshots) == 2
+    player = SessionPlayer(session)
+    player.seek(2.)
+    assert [v.id for v in player.vector_manager.get_all_vectors()] == [v.id for v in vm.get_all_vectors()]
+
+
+def test_video_export():
+    """
+    Segments rendered in parallel join into one video, matching the board over time, (also from a saved board).
+    """
+    temp_dir = mkdtemp()
+    filename = os.path.join(temp_dir, 'lecture.wbs')
+    states = _record(filename)
+    video_file = os.path.join(temp_dir, 'lecture.avi')
+    n_frames = export_video(filename, video_file, size=(160, 120), fps=10., n_workers=2, frames_per_segment=7)
+    assert n_frames == int(round(Session(filename).get_duration() * 10)) + 1
+
+    reader = cv2.VideoCapture(video_file)
+    frames = []
+    while True:
+        ok, frame = reader.read()
+        if not ok:
+            break
+        frames.append(frame)
+    assert len(frames) == n_frames
+    bbox = _session_bbox(Session(filename))
+    for _, state in states:
+        for vector in state.get_all_vectors() + state.get_vectors_in_progress():
+            for axis in ['x', 'y']:  # (recorded points are on the codec's grid)
+                assert bbox[axis][0] - DEFAULT_GRID <= vector.get_bbox()[axis][0]
+                assert vector.get_bbox()[axis][1] <= bbox[axis][1] + DEFAULT_GRID
+    final = np.full((120, 160, 3), COLORS_BGR['off_white'], dtype=np.uint8)
+    states[-1][1].render(final, fit_view(bbox, (160, 120)))
+    assert np.mean(np.abs(frames[-1].astype(int) - final)) < 5
+    assert np.mean(np.abs(frames[n_frames // 2].astype(int) - final)) > 0.5
+
+    board_file = os.path.join(temp_dir, 'board.npz')
+    states[20][1].save(board_file)
+    assert export_video(board_file, os.path.join(temp_dir, 'board.avi'), size=(160, 120), fps=10., n_workers=2) > 0
@@ -0,0 +1,156 @@
+import socket
+import struct
+import time
+import cv2
+import numpy as np
+from share_server import ShareServer
+from frame_tiles import TileDecoder, dirty_tiles, dirty_rects, encode_delta
+
+
+def _read_jpeg(stream):
+    """
+    Read the next part of a multipart MJPEG stream.
+    """
+    headers = {}
+    while True:
+        line = stream.readline().strip()
+        if line.startswith(b'--') or not line:
+            if headers:
+                break
+            continue
+        key, value = line.split(b':', 1)
+        headers[key.strip().lower()] = value.strip()
+    jpeg = stream.read(int(headers[b'content-length']))
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_share_server():
+    """
+    A viewer gets the frames, unchanged frames aren't encoded.
+    """
+    server = ShareServer(port=0, n_encoders=2)
+    try:
+        sock = socket.create_connection(server.get_address())
+        sock.sendall(b'GET /stream.mjpg HTTP/1.0\r\n\r\n')
+        stream = sock.makefile('rb')
+        assert stream.readline().split()[1] == b'200'
+        while stream.readline().strip():
+            pass
+        while server.get_stats()['n_clients'] == 0:
+            time.sleep(0.01)
+
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        frame[40:80, 50:100] = (255, 128, 0)
+        server.share_frame(frame)
+        server.share_frame(frame.copy())
+        img = _read_jpeg(stream)
+        assert np.mean(np.abs(img.astype(int) - frame)) < 5
+        stats = server.get_stats()
+        assert stats['n_unchanged'] == 1 and stats['n_encoded'] == 1
+        sock.close()
+    finally:
+        server.close()
+
+
+def test_frame_tiles():
+    """
+    Only the tiles a stroke touches are encoded, decoding keyframe + deltas rebuilds the frame.
+    """
+    frame = np.full((200, 300, 3), 240, dtype=np.uint8)
+    for i in range(30):
+        cv2.circle(frame, tuple(np.random.randint(0, 300, 2).tolist()), 20, (i * 8, 100, 0), 2)
+    decoder = TileDecoder()
+    keyframe = encode_delta(1, frame)
+    decoder.apply(keyframe)
+    frames = [frame]
+    for seq in range(2, 6):
+        new = frames[-1].copy()
+        cv2.line(new, (10 * seq, 20), (40 * seq, 30 + seq), (0, 0, 255), 2)
+        dirty = dirty_tiles(frames[-1], new, 32)
+        assert 0 < dirty.sum() < dirty.size / 4
+        msg = encode_delta(seq, new, dirty, tile_size=32)
+        assert len(msg) < len(keyframe) / 2
+        decoder.apply(msg)
+        frames.append(new)
+    assert decoder.seq == 5
+    assert np.mean(np.abs(decoder.frame.astype(int) - frames[-1])) < 10  # (jpeg)
+    assert not dirty_tiles(frames[-1], frames[-1].copy(), 32).any()
+    assert len(dirty_rects(np.array([[1, 1, 0, 1]], dtype=bool), 32, (20, 100))) == 2
+
+
+def test_tile_stream():
+    """
+    A tile viewer joining late starts from a keyframe and stays in sync.
+    """
+    server = ShareServer(port=0, n_encoders=3, tile_size=32, keyframe_every=1000)
+    try:
+        frame = np.full((100, 130, 3), 200, dtype=np.uint8)
+        server.share_frame(frame)
+        sock = socket.create_connection(server.get_address())
+        sock.sendall(b'GET /stream.tiles HTTP/1.0\r\n\r\n')
+        stream = sock.makefile('rb')
+        while stream.readline().strip():
+            pass
+        while server.get_stats()['n_clients'] == 0:
+            time.sleep(0.01)
+        for i in range(10):
+            frame = frame.copy()
+            frame[i * 10:i * 10 + 5, i * 12:i * 12 + 5] = (255, 0, 0)
+            server.share_frame(frame)
+
+        decoder = TileDecoder()
+        while decoder.seq != server._seq:
+            length = struct.unpack('<I', stream.read(4))[0]
+            decoder.apply(stream.read(length))
+        assert np.mean(np.abs(decoder.frame.astype(int) - frame)) < 3
+        sock.close()
+    finally:
+        server.close()
+
+
+def test_keyframes_shared():
+    """
+    Viewers needing a keyframe of the same frame share one encoding, and sending doesn't hold up share_frame().
+    """
+    server = ShareServer(port=0, n_encoders=1, tile_size=32)
+    try:
+        frame = np.full((100, 130, 3), 200, dtype=np.uint8)
+        server.share_frame(frame)
+        clients = [server.add_client('tiles') for _ in range(5)]
+        assert server.get_stats()['n_keyframes'] == 1
+        assert all(client.queue.qsize() == 1 for client in clients)
+
+        with server._send_lock:
+            t_start = time.perf_counter()
+            for i in range(5):
+                frame = frame.copy()
+                frame[i * 10:i * 10 + 5] = (255, 0, 0)
+                server.share_frame(frame)
+            assert time.perf_counter() - t_start < 0.1
+        for client in clients:
+            server.remove_client(client)
+    finally:
+        server.close()
+
+
+def test_share_idle():
+    """
+    With no viewers, frames aren't diffed or encoded, the next viewer still starts from the latest one.
+    """
+    server = ShareServer(port=0, n_encoders=1, tile_size=32)
+    try:
+        frame = np.full((100, 130, 3), 200, dtype=np.uint8)
+        for i in range(5):
+            server.share_frame(frame)
+            frame = frame.copy()
+            frame[i * 10:i * 10 + 5] = (255, 0, 0)
+        server.share_frame(frame)
+        stats = server.get_stats()
+        assert stats['n_frames'] == 6 and stats['n_unchanged'] == 0 and stats['n_encoded'] == 0
+        client = server.add_client('tiles')
+        decoder = TileDecoder()
+        decoder.apply(client.queue.get(timeout=1.))
+        assert np.mean(np.abs(decoder.frame.astype(int) - frame)) < 10  # (jpeg)
+        server.remove_client(client)
+    finally:
+        server.close()
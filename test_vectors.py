@@ -4,7 +4,9 @@ from vectors import LineVec, CircleVec, PencilVec, RectangleVec, TextVec
 from layout import COLORS_RGB
 from board_view import BoardView, get_board_view
 from tempfile import mkdtemp
-from vector_manager import VectorManager
+from vector_manager import VectorManager, BoardOps
+from util import get_bbox
+from point_codec import DEFAULT_GRID
 
 
 def test_vectors(show=False):
@@ -112,6 +114,81 @@ def test_vectors(show=False):
     return True
 
 
+def _make_board(n_vecs, n_pts, dist_sd=3):
+    """
+    :returns: VectorManager with n_vecs random-walk vectors of n_pts points each (plus a few text vectors).
+    """
+    vecs_t = [PencilVec, LineVec, CircleVec, RectangleVec]
+    vm = VectorManager(None)
+    for i in range(n_vecs):
+        vec = vecs_t[i % len(vecs_t)](np.random.choice(['red', 'green', 'blue', 'black']),
+                                      thickness=np.random.randint(1, 5))
+        pts = np.cumsum(np.random.normal(0, dist_sd, (n_pts, 2)), axis=0)
+        vec._points = list(pts) if vec.name == 'PencilVec' else [pts[0], pts[-1]]
+        vec._bbox = get_bbox(vec._points)
+        vec.finalize()
+        vm._vectors.append(vec)
+    for string in ['foo', 'p(a|b)']:
+        vec = TextVec('black', text_size=12)
+        vec.add_point(np.random.normal(0, 10, 2))
+        vec.add_letters(string)
+        vec.finalize()
+        vm._vectors.append(vec)
+    return vm
+
+
+def test_board_file():
+    """
+    Save a board in the binary & JSON formats, check both load back the same vectors.
+    """
+    vm = _make_board(20, 30)
+    vm._deleted.append(vm._vectors.pop(3))
+    temp_dir = mkdtemp()
+
+    for filename in ['board.npz', 'board.json']:
+        vm.save(temp_dir + '/' + filename)
+        vm2 = VectorManager(temp_dir + '/' + filename)
+        assert len(vm2._vectors) == len(vm._vectors) and len(vm2._deleted) == len(vm._deleted)
+        for v1, v2 in zip(vm._vectors + vm._deleted, vm2._vectors + vm2._deleted):
+            assert type(v1) == type(v2) and v1.id == v2.id, "%s != %s" % (v1, v2)
+            assert v1._color == v2._color and v1._thickness == v2._thickness
+            assert np.abs(np.array(v1._points) - v2._points).max() <= DEFAULT_GRID / 2
+            assert v1._finalized_t == v2._finalized_t
+            assert getattr(v1, '_text', None) == getattr(v2, '_text', None)
+
+
+def test_chunked_board():
+    """
+    Spread vectors over a big board, save it chunked, check a lazily opened copy returns the same vectors
+    in a view, only loads the chunks it needs, and saves everything back.
+    """
+    vm = _make_board(400, 10)
+    for vec in vm._vectors:
+        vec.move_to(vec.get_centroid() + np.random.uniform(-5000, 5000, 2))
+    save_file = mkdtemp() + '/board.wbc'
+    vm.save(save_file)
+
+    vm2 = VectorManager(save_file, memory_budget=200000)
+    bbox = {'x': (-1000, 1000), 'y': (-500, 500)}
+    expected = sorted(v.id for v in vm.get_vectors_in(bbox))
+    assert sorted(v.id for v in vm2.get_vectors_in(bbox)) == expected
+    assert len(vm2._lazy._resident) < len(vm2._lazy._file.chunks) / 4, "should only materialize nearby chunks"
+
+    all_ids = sorted(v.id for v in vm2.get_all_vectors())
+    assert all_ids == sorted(v.id for v in vm._vectors)
+
+    # snapshots don't materialize the chunks, and aren't affected by later changes
+    n_resident = len(vm2._lazy._resident)
+    deleted_id = vm2.get_vectors_in(bbox)[0].id
+    vm2.apply_op(BoardOps.delete, ids=[deleted_id])
+    added = _make_board(1, 10)._vectors[0]
+    vm2.apply_op(BoardOps.add, vectors=[added])
+    _, vectors, _ = vm2.get_snapshot()
+    assert len(vm2._lazy._resident) == n_resident
+    vm2.clear()
+    assert sorted(v.id for v in vectors) == sorted([v for v in all_ids if v != deleted_id] + [added.id])
+
+
 def test_board_view():
     """
     Create a bunch of points in [0, 100] x [0, 10], create a board view that fits them into a 640x480 window.
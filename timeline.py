@@ -0,0 +1,95 @@
+"""
+Board time-travel:  what did the board look like at time T?
+
+Every op is kept as a delta, and every checkpoint_every deltas the board's vector list is checkpointed (a list of
+references, finished vectors are never changed in place, so this costs a pointer per vector).  The state at T is
+the last checkpoint before T plus at most checkpoint_every deltas, never a replay from the start.
+
+Each checkpoint holds the whole board, so only the last max_checkpoints are kept:  the oldest is dropped (with the
+deltas up to the next one), and the earliest time that can be asked for moves forward.
+
+Times are epoch seconds (time.time()), the clock of Vector._finalized_t (saved in board files).  Adds are indexed by the vectors'
+_finalized_t (so a vector is on the board at its own _finalized_t), everything else by when it happened.
+"""
+import time
+from bisect import bisect_right
+from vector_manager import BoardOps
+
+
+class Timeline(object):
+    def __init__(self, vector_manager, checkpoint_every=256, max_checkpoints=32):
+        """
+        Start recording, (the board's current state is the earliest one that can be asked for).
+        :param checkpoint_every: deltas between checkpoints (bounds the work per query)
+        :param max_checkpoints: keep this many checkpoints (bounds memory), or None to keep everything
+        """
+        self._vm = vector_manager
+        self._checkpoint_every = checkpoint_every
+        self._max_checkpoints = max_checkpoints
+        self._delta_times = []
+        self._deltas = []  # (op, vectors, ids)
+        self._checkpoint_times = []
+        self._checkpoints = []  # (index of the first delta not included, list of vectors)
+        self._add_checkpoint(time.time())
+        self._vm.add_op_callback(self._on_op)
+        self._vm.set_timeline(self)
+
+    def _add_checkpoint(self, t):
+        self._checkpoint_times.append(t)
+        self._checkpoints.append((len(self._deltas), list(self._vm.get_all_vectors())))
+        if self._max_checkpoints is not None and len(self._checkpoints) > self._max_checkpoints:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        n_dropped = self._checkpoints[1][0]
+        del self._deltas[:n_dropped]
+        del self._delta_times[:n_dropped]
+        del self._checkpoint_times[0]
+        self._checkpoints = [(first_delta - n_dropped, vectors) for first_delta, vectors in self._checkpoints[1:]]
+
+    def _on_op(self, op, vectors, old_vectors):
+        now = time.time()
+        t = now
+        if op == BoardOps.add and len(vectors) > 0:
+            t = min(now, max(vector._finalized_t for vector in vectors))
+        t = max(t, self._delta_times[-1] if self._delta_times else self._checkpoint_times[-1])
+        if op == BoardOps.delete:
+            self._deltas.append((op, None, [vector.id for vector in vectors]))
+        elif op == BoardOps.clear:
+            self._deltas.append((op, None, None))
+        else:
+            self._deltas.append((op, list(vectors), None))
+        self._delta_times.append(t)
+        if len(self._deltas) - self._checkpoints[-1][0] >= self._checkpoint_every:
+            self._add_checkpoint(t)
+
+    def get_time_range(self):
+        """
+        :returns: earliest, latest time with a known board state
+        """
+        return self._checkpoint_times[0], max(self._delta_times[-1:] + [self._checkpoint_times[-1]])
+
+    def get_vectors_at(self, t):
+        """
+        :param t: epoch time (before the start of recording gives the earliest state)
+        :returns: list of the vectors on the board at time t, in drawing order
+        """
+        i_checkpoint = max(0, bisect_right(self._checkpoint_times, t) - 1)
+        first_delta, vectors = self._checkpoints[i_checkpoint]
+        last_delta = bisect_right(self._delta_times, t, lo=first_delta)
+        if last_delta == first_delta:
+            return list(vectors)
+        board = {vector.id: vector for vector in vectors}
+        for op, op_vectors, ids in self._deltas[first_delta:last_delta]:
+            if op == BoardOps.add:
+                board.update({vector.id: vector for vector in op_vectors})
+            elif op == BoardOps.delete:
+                for vector_id in ids:
+                    board.pop(vector_id, None)
+            elif op == BoardOps.clear:
+                board = {}
+            else:
+                for vector in op_vectors:
+                    if vector.id in board:
+                        board[vector.id] = vector
+        return list(board.values())
@@ -205,6 +205,7 @@ class ToolManager(object):
         self._color_n = init_color
         self._thickness = init_thickness
         self.current_tool = None  # external access to current tool
+        self._tool_name = None
         self._text_size = 20
         self._init_tools()
         self.switch_tool(init_tool_name)
@@ -213,8 +214,12 @@ class ToolManager(object):
         if new_tool_name not in self._tools:
             ValueError(f'Invalid tool name (did you add to self._tools in _init_elements?): {new_tool_name}')
         self.current_tool = self._tools[new_tool_name]
+        self._tool_name = new_tool_name
         logging.info(f"Switched to tool: {new_tool_name}")
 
+    def get_tool_name(self):
+        return self._tool_name
+
     def _init_tools(self):
         self._tools = {'pencil': Pencil(self, self.vectors),
                        'line': Line(self, self.vectors),
@@ -1,11 +1,43 @@
-import json
-from vectors import Vector, PencilVec, LineVec, CircleVec, RectangleVec
+from vectors import Vector, PencilVec, LineVec, CircleVec, RectangleVec, TextVec
 import numpy as np
 from layout import EMPTY_BBOX
 import logging
+from enum import IntEnum
 from util import bboxes_intersect
+from board_file import save_board, save_board_json, load_board
+from chunked_board import save_chunked_board, is_chunked_board, LazyBoard
 
-VECTORS = [PencilVec, LineVec, CircleVec, RectangleVec]
+VECTORS = [PencilVec, LineVec, CircleVec, RectangleVec, TextVec]
+
+
+class BoardOps(IntEnum):
+    """
+    Changes to the set of (finished) vectors on the board, sent to op callbacks.
+    Values are used in files (journal, etc.), only append.
+    """
+    add = 0  # new vectors finished
+    delete = 1
+    move = 2  # vectors replaced by moved versions (same ids)
+    restyle = 3  # vectors replaced by versions w/new color/thickness (same ids)
+    clear = 4  # everything deleted
+
+
+def write_board(filename, vectors, deleted, journal_seq=0):
+    """
+    Save the vectors, format depends on the extension:
+        '.json':  old JSON format
+        '.wbc':  spatially chunked, lazily loadable (see chunked_board.py)
+        anything else:  binary format (see board_file.py)
+    :param journal_seq: the last journal record reflected in vectors/deleted (if saving a snapshot, not for JSON)
+    """
+    if filename.lower().endswith('.json'):
+        if journal_seq:
+            raise ValueError("JSON board files can't record a journal position:  %s" % (filename,))
+        save_board_json(filename, vectors, deleted)
+    elif filename.lower().endswith('.wbc'):
+        save_chunked_board(filename, vectors, deleted, journal_seq=journal_seq)
+    else:
+        save_board(filename, vectors, deleted, journal_seq=journal_seq)
 
 
 class VectorManager(object):
@@ -13,28 +45,177 @@ class VectorManager(object):
     Manages set of vectors on the board.
     """
 
-    def __init__(self, load_file=None):
-        if load_file:
-            self.load(load_file)
-
+    def __init__(self, load_file=None, memory_budget=None):
+        """
+        :param load_file: board file to start with
+        :param memory_budget: bytes, for lazily loaded (chunked) board files, see LazyBoard.
+        """
+        self._memory_budget = memory_budget
+        self._lazy = None  # LazyBoard, if the board was opened from a chunked file
         self._vecs_in_progress = []
         self._selected = []
         self._vectors = []
         self._deleted = []  # list of deleted vectors (current stored in self._vectors)
         self._types = {cls.__name__: cls for cls in VECTORS}
+        self._op_callbacks = []
+        self._generation = 0  # incremented with every op
+        self._loading = False  # board is still being loaded in the background (don't save it)
+        self._timeline = None  # Timeline, if recording one
+        self._applying_remote = False  # ops being applied came from another replica (not undoable here)
+        self._applying_loaded = False  # ops being applied are a file's contents, loading (already saved, not undoable)
+
+        if load_file:
+            self.load(load_file)
 
     def save(self, filename):
+        """
+        Save the board, (see write_board for formats).
+        """
+        write_board(filename, self.get_all_vectors(), self._deleted)
+
+    def get_snapshot(self):
+        """
+        Cheap, consistent copy of the board's state, safe to serialize on another thread:  finished vectors are
+        never changed in place (moves/restyles replace them), so copying the lists is enough.  On a chunked board,
+        the vectors still in the file are read when the snapshot is first used (see LazyBoard.snapshot), not here.
+        :returns: generation, vectors (list, or ChunkSnapshot), deleted
+        """
+        vectors = list(self._vectors) if self._lazy is None else self._lazy.snapshot(self._vectors)
+        return self._generation, vectors, list(self._deleted)
+
+    def get_all_vectors(self):
+        """
+        Every vector on the board, including lazily loaded ones that aren't in memory (slow for those).
+        """
+        if self._lazy is None:
+            return self._vectors
+        return list(self._lazy.iter_all()) + self._vectors
+
+    def add_op_callback(self, callback):
+        """
+        :param callback: function(op, vectors, old_vectors) called after every change to the board, where
+            op is a BoardOps, vectors is a list of the vectors added/deleted/cleared or the new versions of
+            moved/restyled vectors, and old_vectors is the list of versions they replaced (else None).
+        """
+        self._op_callbacks.append(callback)
+
+    def remove_op_callback(self, callback):
+        self._op_callbacks.remove(callback)
+
+    def _notify(self, op, vectors, old_vectors=None):
+        self._generation += 1
+        for callback in self._op_callbacks:
+            callback(op, vectors, old_vectors)
+
+    def set_loading(self, loading):
+        self._loading = loading
+
+    def is_loading(self):
+        return self._loading
+
+    def set_applying_remote(self, remote):
+        self._applying_remote = remote
+
+    def is_applying_remote(self):
+        return self._applying_remote
+
+    def set_applying_loaded(self, loaded):
+        self._applying_loaded = loaded
+
+    def is_applying_loaded(self):
+        return self._applying_loaded
+
+    def set_timeline(self, timeline):
+        self._timeline = timeline
 
-        def _serialize(vector):
-            packet = {'class': vector.name,  # vector names are their separate class names.
-                      'data': vector.get_data()}
-            return json.dumps(packet)
+    def get_vectors_at(self, t):
+        """
+        The board at an earlier time (see timeline.py).
+        :param t: epoch time, (time.time())
+        :returns: list of vectors
+        """
+        if self._timeline is None:
+            raise RuntimeError("No timeline is being recorded for this board.")
+        return self._timeline.get_vectors_at(t)
+
+    def get_generation(self):
+        """
+        Changes every time the board changes (not counting vectors in progress).
+        """
+        return self._generation
+
+    def apply_op(self, op, vectors=(), ids=(), notify=True):
+        """
+        Apply an op recorded somewhere else (journal, session, another board), vectors are matched by id.
+        :param op: BoardOps
+        :param vectors: the vectors to add, or the new versions of moved/restyled vectors
+        :param ids: the ids of vectors to delete
+        :param notify: send the op to the op callbacks
+        """
+        if op == BoardOps.add:
+            vectors = list(vectors)  # (never keep the caller's list, it may still change it)
+            self._vectors.extend(vectors)
+            old = None
+        elif op == BoardOps.delete:
+            vectors = self._delete_ids(ids)
+            old = None
+        elif op in (BoardOps.move, BoardOps.restyle):
+            old = self._replace(vectors)
+        elif op == BoardOps.clear:
+            vectors = self._clear()
+            old = None
+        else:
+            raise ValueError("Unknown op: %s" % (op,))
+        if notify:
+            self._notify(op, vectors if isinstance(vectors, list) else list(vectors), old)
+
+    def _delete_ids(self, ids):
+        """
+        :returns: list of deleted vectors (only those that are in memory)
+        """
+        ids = set(ids)
+        deleted = [vector for vector in self._vectors if vector.id in ids]
+        if deleted:
+            self._vectors = [vector for vector in self._vectors if vector.id not in ids]
+        if self._lazy is not None:
+            in_memory = {vector.id for vector in deleted}
+            for vector_id in ids - in_memory:
+                detached = self._lazy.detach(vector_id)
+                if detached is not None:
+                    deleted.append(detached)
+        self._deleted.extend(deleted)
+        return deleted
 
-        vectors = [_serialize(vector) for vector in self._vectors]
-        deleted = [_serialize(vector) for vector in self._deleted]
+    def _replace(self, new_vectors):
+        """
+        Replace vectors with new versions (with the same ids), keeping their place in the drawing order.
+        :returns: list of the old versions
+        """
+        new_by_id = {vector.id: vector for vector in new_vectors}
+        old = []
+        for i, vector in enumerate(self._vectors):
+            if vector.id in new_by_id:
+                old.append(vector)
+                self._vectors[i] = new_by_id.pop(vector.id)
+        for vector_id, vector in new_by_id.items():
+            # lazily loaded (or missing), move to memory
+            detached = self._lazy.detach(vector_id) if self._lazy is not None else None
+            if detached is not None:
+                old.append(detached)
+            self._vectors.append(vector)
+        return old
+
+    def _clear(self):
+        """
+        :returns: list of cleared vectors
+        """
+        cleared = self.get_all_vectors()
+        self._vectors = []
+        if self._lazy is not None:
+            self._lazy.close()
+            self._lazy = None
+        return cleared
 
-        with open(filename, 'w') as f:
-            json.dump([vectors, deleted], f)
     def get_selected(self):
         return self._selected
     def select_vectors(self, vecs):
@@ -42,8 +223,10 @@ class VectorManager(object):
         if len(self._vecs_in_progress)> 0:
             logging.warning("Selecting vectors while vectors in progress, finishing them.")
             self.finish_vectors()
+        selected_ids = {vec.id for vec in self._selected}
         for vec in vecs:
-            if vec not in self._selected:
+            if vec.id not in selected_ids:
+                selected_ids.add(vec.id)
                 selected = vec.copy()
                 vec.visible = False
                 selected.highlighted = True
@@ -52,7 +235,7 @@ class VectorManager(object):
     def deselect_vectors_unchanged(self, vecs=None):
         if vecs is None:
             vecs = self._selected
-        for vec in vecs:
+        for vec in list(vecs):
             vec.visible = True
             vec.highlighted = False
             self._selected.remove(vec)
@@ -60,31 +243,41 @@ class VectorManager(object):
     def deselect_vectors_commit(self, vecs=None):
         if vecs is None:
             vecs = self._selected
-        for vec in vecs:
+        committed = []
+        for vec in list(vecs):
             vec.visible = True
             vec.highlighted = False
-            self._vectors.append(vec)
+            committed.append(vec)
             self._selected.remove(vec)
+        if committed:
+            old = self._replace(committed)
+            self._notify(BoardOps.move, committed, old)
 
         
     def load(self, filename):
-
-        def _deserialize(string):
-            packet = json.loads(string)
-            return self._types[packet['class']].from_data(packet['data'])
-
-        with open(filename, 'r') as f:
-            vectors, deleted = json.load(f)
-
-        self._vectors = [_deserialize(vector) for vector in vectors]
-        self._deleted = [_deserialize(vector) for vector in deleted]
+        """
+        Load a board saved in any format.
+        Chunked files are opened lazily, their vectors are materialized as views need them.
+        """
+        if self._lazy is not None:
+            self._lazy.close()
+            self._lazy = None
+        if is_chunked_board(filename):
+            kwargs = {} if self._memory_budget is None else {'memory_budget': self._memory_budget}
+            self._lazy = LazyBoard(filename, **kwargs)
+            self._vectors, self._deleted = [], self._lazy.read_deleted()
+        else:
+            self._vectors, self._deleted = load_board(filename, self._types)
 
     def get_vectors_in(self, bbox):
         """
         Return all vectors that are visible in the bbox.
         i.e. whose bboxes intersect the given bbox.
         """
-        return [vector for vector in self._vectors if bboxes_intersect(vector.get_bbox(), bbox)]
+        vectors = [vector for vector in self._vectors if bboxes_intersect(vector.get_bbox(), bbox)]
+        if self._lazy is not None:
+            vectors = self._lazy.get_vectors_in(bbox, prefetch=False) + vectors
+        return vectors
 
     def start_vector(self, vector, also_finish=False):
         self._vecs_in_progress.append(vector)
@@ -93,32 +286,67 @@ class VectorManager(object):
             self.finish_vectors()
 
     def finish_vectors(self):
-        self._vectors.extend(self._vecs_in_progress)
+        finished = self._vecs_in_progress
+        self._vectors.extend(finished)
         self._vecs_in_progress = []
+        if finished:
+            self._notify(BoardOps.add, finished)
 
-    def cancel_vectors(self):
-        self._vecs_in_progress = []
+    def get_vectors_in_progress(self):
+        return self._vecs_in_progress
+
+    def cancel_vectors(self, vectors=None):
+        """
+        :param vectors: the vectors in progress to drop, or None for all of them
+        """
+        if vectors is None:
+            self._vecs_in_progress = []
+        else:
+            ids = {vector.id for vector in vectors}
+            self._vecs_in_progress = [vector for vector in self._vecs_in_progress if vector.id not in ids]
 
     def delete(self, vector):
-        self._deleted.append(vector)
-        self._vectors.remove(vector)
+        self.apply_op(BoardOps.delete, ids=(vector.id,))
 
     def clear(self, *args):
-        self._vectors = []
-        print("clearing vectors, TODO:  move them to the redo stack ")
+        self.apply_op(BoardOps.clear)
+
+    def restyle(self, vectors, color=None, thickness=None):
+        """
+        Replace the vectors with versions in a new color/thickness.
+        :param color: color name or (r, g, b), or None to keep the old one
+        :param thickness: int or None
+        """
+        self.apply_op(BoardOps.restyle, vectors=[vector.restyled(color, thickness) for vector in vectors])
 
     def undo_delete(self):
         if self._deleted:
-            self._vectors.append(self._deleted.pop())
+            vector = self._deleted.pop()
+            self._vectors.append(vector)
+            self._notify(BoardOps.add, [vector])
 
-    def render(self, img, view):
+    def render(self, img, view, counts=None):
+        """
+        :param counts: dict to fill in with the number of 'vectors' considered (in memory, or in lazily loaded
+            chunks near the view), how many were 'drawn' (in view) & 'culled', and 'in_progress', or None
+        """
         # print("Rendering %i vectors" % len(self._vectors))
+        lazy_vectors = self._lazy.get_vectors_in(view.board_bbox) if self._lazy is not None else []
+        for vector in lazy_vectors:
+            vector.render(img, view)
         for vector in self._vectors:
             vector.render(img, view)
 
         for vec in self._vecs_in_progress:
             vec.render(img, view)
 
+        if counts is not None:
+            counts['vectors'] = len(lazy_vectors) + len(self._vectors)
+            counts['drawn'] = sum(1 for vectors in (lazy_vectors, self._vectors) for vector in vectors
+                                  if view.sees_bbox(vector.get_bbox()))
+            counts['culled'] = counts['vectors'] - counts['drawn']
+            counts['in_progress'] = len(self._vecs_in_progress)
+
     def mouse_event(self, event, x, y, flags, param):
         # vectors are not interactive, only controlled by tools & controls.
         pass
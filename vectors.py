@@ -10,6 +10,18 @@ from abc import ABC, abstractmethod
 from util import get_bbox, PREC_BITS, PREC_SCALE, floats_to_fixed, get_circle_points
 import json
 import time
+import uuid
+from metrics import REGISTRY
+
+_CIRCLE_CACHE_HITS, _CIRCLE_CACHE_MISSES = REGISTRY.hit_rate(
+    'vectors.draw_points_cache', "circle/rectangle pixel points reused (view unchanged)")
+
+
+def new_vector_id():
+    """
+    Return a new id for a vector (random 63-bit int, so it fits in an int64 and is unique across boards/machines).
+    """
+    return uuid.uuid4().int >> 65
 
 
 class Vector(Renderable, ABC):
@@ -34,6 +46,7 @@ class Vector(Renderable, ABC):
         self._thickness = thickness
         self.highlighted = False
         self._points = []
+        self.id = new_vector_id()  # stable across copies, saves & loads
 
         super().__init__(self.__class__.__name__, EMPTY_BBOX)
 
@@ -48,7 +61,23 @@ class Vector(Renderable, ABC):
         c = self.__class__(self._color, self._thickness)
         c._points = self._points.copy()
         c._bbox = self._bbox.copy()
-        c._finalized_t = time.perf_counter()  # ???
+        c._finalized_t = self._finalized_t
+        c.id = self.id
+        if hasattr(self, '_centroid'):
+            c._centroid = self._centroid.copy()
+        return c
+
+    def restyled(self, color=None, thickness=None):
+        """
+        Return a copy (same id) with a new color and/or thickness.
+        :param color: (r, g, b) tuple or string, or None to keep the old one
+        :param thickness: int or None
+        """
+        c = self.copy()
+        if color is not None:
+            c._color = COLORS_BGR[color] if isinstance(color, str) else tuple(color)
+        if thickness is not None:
+            c._thickness = thickness
         return c
 
     @abstractmethod
@@ -77,6 +106,7 @@ class Vector(Renderable, ABC):
 
     def finalize(self):
         self._finalized_t = time.time()
+        self._points = np.array(self._points, dtype=np.float64).reshape(-1, 2)  # done adding points
         self._centroid = np.mean(self._points, axis=0)
 
     def get_centroid(self):
@@ -111,17 +141,26 @@ class Vector(Renderable, ABC):
         data = {'color': self._color,
                 'thickness': self._thickness,
                 'points': np.array(self._points).tolist(),
-                'timestamp': self._finalized_t}
+                'timestamp': self._finalized_t,
+                'id': self.id}
         return data
 
     @classmethod
     def from_data(cls, data):
+        """
+        :param data: dict from get_data, may also have precomputed 'bbox' and 'centroid' (from bulk loading).
+        """
         r = cls(data['color'], data['thickness'])
-        r._points = data['points']
-        r._bbox = get_bbox(r._points)
-        r._finalized_t = data['timestamp']
+        r._set_data(data)
         return r
 
+    def _set_data(self, data):
+        self._points = np.asarray(data['points'], dtype=np.float64).reshape(-1, 2)
+        self._bbox = data['bbox'] if 'bbox' in data else get_bbox(self._points)
+        self._centroid = data['centroid'] if 'centroid' in data else np.mean(self._points, axis=0)
+        self._finalized_t = data['timestamp']
+        self.id = data.get('id', self.id)  # old files have no ids
+
     def _get_color(self, color_v):
         if self.highlighted:
             return COLORS_BGR['neon green']
@@ -192,8 +231,11 @@ class CircleVec(LineVec):
 
         old_view, draw_pts = self._view_cache.get(view.win_name, (None, None))
         if old_view is None or view != old_view or draw_pts is None:
+            _CIRCLE_CACHE_MISSES.inc()
             draw_pts = self._recalc_pts(view)
             self._view_cache[view.win_name] = view, draw_pts
+        else:
+            _CIRCLE_CACHE_HITS.inc()
         return draw_pts
 
     _NAME = 'circle'
@@ -251,6 +293,16 @@ class TextVec(Vector):
     def add_letters(self, letters):
         self._text += letters
 
+    def copy(self):
+        c = super().copy()
+        c._text = self._text
+        c._text_size = self._text_size
+        return c
+
+    def restyled(self, color=None, thickness=None):
+        # text has no thickness, (size is separate)
+        return super().restyled(color, None)
+
     def render(self, img, view):
         if view.sees_bbox(self._bbox):
             xy = (np.array(view.pts_to_pixels(self._points[0]),dtype=np.int32))  # no high-precision available for cv2.putText
@@ -268,8 +320,7 @@ class TextVec(Vector):
 
     @classmethod
     def from_data(cls, data):
-        r = cls(data['color'], data['thickness'], data['text'], data['text_size'])
-        r._points = data['points']
-        r._bbox = get_bbox(r._points)
-        r._finalized_t = data['timestamp']
+        r = cls(data['color'], data['text_size'])
+        r._set_data(data)
+        r._text = data['text']
         return r
@@ -0,0 +1,220 @@
+"""
+Render a video of a recorded session (or a saved board, drawn in the order its vectors were made), no display needed.
+
+The frames are split by time into segments, rendered by a process pool (each worker seeks its own SessionPlayer to
+the start of its segment, see session.py) into temporary chunk files, which are then concatenated:  by the ffmpeg
+concat demuxer if ffmpeg is installed (no re-encoding), otherwise the chunks are lossless (FFV1) and get encoded
+once, as they're joined.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import mkdtemp
+import cv2
+import numpy as np
+from board_view import BoardView
+from layout import COLORS_BGR
+from session import Session, SessionPlayer, SessionRecorder
+from vector_manager import VectorManager, BoardOps
+
+_FOURCC = {'.avi': 'MJPG', '.mp4': 'mp4v'}
+_LOSSLESS_FOURCCS = ['FFV1', 'png ']  # (for chunks that will be encoded again, first one OpenCV can write)
+_TIME_EPS = 1e-6  # (frame times are computed, so records at "the same" time may be a rounding error later)
+
+
+def board_to_session(board_file, session_file, max_gap=2.0):
+    """
+    Make a session from a saved board, each vector appearing at its timestamp.
+    :param max_gap: seconds, longer pauses between vectors are shortened to this
+    """
+    vectors = sorted(VectorManager(board_file).get_all_vectors(), key=lambda v: v._finalized_t or 0.)
+    clock = [0.]
+    vm = VectorManager()
+    recorder = SessionRecorder(vm, session_file, time_fn=lambda: clock[0])
+    t_last = None
+    for vector in vectors:
+        t = vector._finalized_t or 0.
+        if t_last is not None:
+            clock[0] += min(max(t - t_last, 0.), max_gap)
+        t_last = t
+        vm.apply_op(BoardOps.add, vectors=[vector])
+        recorder.tick()
+    recorder.close()
+
+
+def fit_view(bbox, size, margin=0.05):
+    """
+    :param bbox: {'x': (x_min, x_max), 'y': (y_min, y_max)}, board coords
+    :returns: BoardView of the given pixel size showing all of it
+    """
+    x_range = max(bbox['x'][1] - bbox['x'][0], 1e-6)
+    y_range = max(bbox['y'][1] - bbox['y'][0], 1e-6)
+    zoom = min(size[0] / x_range, size[1] / y_range) * (1. - 2 * margin)
+    center = np.array([sum(bbox['x']), sum(bbox['y'])]) / 2
+    return BoardView('export', size, center - np.array(size) / 2. / zoom, zoom)
+
+
+def _session_bbox(session):
+    """
+    Bounding box of everything ever on the board during the session, (grown with each op as the session plays).
+    """
+    player = SessionPlayer(session)
+    bounds = [np.inf, -np.inf, np.inf, -np.inf]
+
+    def _include(vectors):
+        for vector in vectors:
+            bbox = vector.get_bbox()
+            bounds[0], bounds[1] = min(bounds[0], bbox['x'][0]), max(bounds[1], bbox['x'][1])
+            bounds[2], bounds[3] = min(bounds[2], bbox['y'][0]), max(bounds[3], bbox['y'][1])
+
+    player.vector_manager.add_op_callback(lambda op, vectors, old_vectors: _include(vectors))
+    while player._next < len(session):
+        player.advance_to(session.times[player._next])
+        _include(player.vector_manager.get_vectors_in_progress())
+    x_min, x_max, y_min, y_max = bounds
+    if x_min > x_max:
+        return {'x': (-1., 1.), 'y': (-1., 1.)}
+    return {'x': (x_min, x_max), 'y': (y_min, y_max)}
+
+
+def interpolate_view(view_path, t, size):
+    """
+    :param view_path: list of (t, (x, y) board coords of the upper left corner, zoom), sorted by t
+    :returns: BoardView at time t, (linearly interpolated)
+    """
+    times = [key[0] for key in view_path]
+    i = int(np.clip(np.searchsorted(times, t) - 1, 0, len(view_path) - 1))
+    t0, origin0, zoom0 = view_path[i]
+    t1, origin1, zoom1 = view_path[min(i + 1, len(view_path) - 1)]
+    w = 0. if t1 <= t0 else float(np.clip((t - t0) / (t1 - t0), 0., 1.))
+    origin = (1 - w) * np.array(origin0, dtype=np.float64) + w * np.array(origin1, dtype=np.float64)
+    return BoardView('export', size, origin, (1 - w) * zoom0 + w * zoom1)
+
+
+def _render_segment(session_file, chunk_file, fourcc, frame_times, fps, size, view_path):
+    """
+    Worker:  render frames at the given session times into a chunk file.
+    :param view_path: see interpolate_view, or a BoardView
+    """
+    player = SessionPlayer(session_file)
+    player.seek(frame_times[0] + _TIME_EPS)
+    writer = cv2.VideoWriter(chunk_file, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    blank = np.full((size[1], size[0], 3), COLORS_BGR['off_white'], dtype=np.uint8)
+    for t in frame_times:
+        player.advance_to(t + _TIME_EPS)
+        view = view_path if isinstance(view_path, BoardView) else interpolate_view(view_path, t, size)
+        frame = blank.copy()
+        player.vector_manager.render(frame, view)
+        writer.write(frame)
+    writer.release()
+    return chunk_file
+
+
+def _lossless_fourcc(temp_dir, size, fps):
+    """
+    :returns: fourcc of the first lossless codec OpenCV can write (to .avi), or None
+    """
+    for fourcc in _LOSSLESS_FOURCCS:
+        probe_file = os.path.join(temp_dir, 'probe.avi')
+        writer = cv2.VideoWriter(probe_file, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        ok = writer.isOpened()
+        writer.release()
+        if ok:
+            return fourcc
+    return None
+
+
+def _concat_ffmpeg(chunk_files, out_file, temp_dir):
+    """
+    Join the chunks without re-encoding them (ffmpeg's concat demuxer).
+    """
+    list_file = os.path.join(temp_dir, 'chunks.txt')
+    with open(list_file, 'w') as f:
+        for chunk_file in chunk_files:
+            f.write("file '%s'\n" % (chunk_file.replace("'", "'\\''"),))
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy',
+                    out_file], check=True)
+
+
+def _concat_encode(chunk_files, out_file, fourcc, fps, size):
+    """
+    Join (lossless) chunks by encoding their frames into the output, (the only lossy pass).
+    :returns: number of frames written
+    """
+    writer = cv2.VideoWriter(out_file, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    n_frames = 0
+    for chunk_file in chunk_files:
+        reader = cv2.VideoCapture(chunk_file)
+        while True:
+            ok, frame = reader.read()
+            if not ok:
+                break
+            writer.write(frame)
+            n_frames += 1
+        reader.release()
+    writer.release()
+    return n_frames
+
+
+def export_video(source, out_file, size=(1280, 720), fps=30.0, speed=1.0, view_path=None, n_workers=None,
+                 frames_per_segment=300):
+    """
+    :param source: session file, or a saved board
+    :param out_file: video file, '.avi' (MJPG) or '.mp4' (mp4v)
+    :param size: (width, height) pixels
+    :param speed: session seconds per video second
+    :param view_path: list of (t, (x, y) upper left corner, zoom), or None to fit everything drawn in the session
+    :param n_workers: processes, default:  one per core
+    :param frames_per_segment: frames rendered by one worker task
+    :returns: number of frames written
+    """
+    t_start = time.perf_counter()
+    temp_dir = mkdtemp()
+    try:
+        try:
+            session = Session(source)
+            session_file = source
+        except ValueError:
+            session_file = os.path.join(temp_dir, 'board.wbs')
+            board_to_session(source, session_file)
+            session = Session(session_file)
+
+        n_frames = int(np.floor(session.get_duration() * fps / speed + _TIME_EPS)) + 1
+        frame_times = np.arange(n_frames) * speed / fps
+        view = fit_view(_session_bbox(session), size) if view_path is None else view_path
+        fourcc = _FOURCC.get(os.path.splitext(out_file)[1].lower(), 'mp4v')
+        use_ffmpeg = shutil.which('ffmpeg') is not None
+        chunk_fourcc, ext = fourcc, os.path.splitext(out_file)[1]
+        if not use_ffmpeg:
+            chunk_fourcc = _lossless_fourcc(temp_dir, size, fps) or fourcc
+            ext = '.avi' if chunk_fourcc != fourcc else ext
+        segments = [frame_times[i:i + frames_per_segment] for i in range(0, len(frame_times), frames_per_segment)]
+        chunk_files = [os.path.join(temp_dir, 'chunk_%05i%s' % (i, ext)) for i in range(len(segments))]
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(_render_segment, session_file, chunk_file, chunk_fourcc, segment, fps, size, view)
+                       for chunk_file, segment in zip(chunk_files, segments)]
+            for future in futures:
+                future.result()
+
+        if use_ffmpeg:
+            _concat_ffmpeg(chunk_files, out_file, temp_dir)
+        else:
+            n_frames = _concat_encode(chunk_files, out_file, fourcc, fps, size)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    logging.info("Exported %i frames (%.1f sec of video) to %s in %.1f sec." %
+                 (n_frames, n_frames / fps, out_file, time.perf_counter() - t_start))
+    return n_frames
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage:  python video_export.py <session or board file> <video file> [speed]")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    export_video(sys.argv[1], sys.argv[2], speed=float(sys.argv[3]) if len(sys.argv) > 3 else 1.0)
@@ -1,11 +1,26 @@
+import time
+_T_IMPORT = time.perf_counter()  # (startup is timed from here, before the heavy imports)
 import cv2
 import numpy as np
 from layout import COLORS_RGB, SLIDERS, CONTROL_LAYOUT, BOARD_LAYOUT, VECTOR_DEF, EMPTY_BBOX, INIT_OPTIONS
 import logging
 from windows import UIWindow
-import time
 from board_view import BoardView
 from vector_manager import VectorManager
+from journal import Journal
+from autosave import AutoSaver
+from history import History
+from timeline import Timeline
+from share_server import ShareServer
+from board_sync import SyncServer
+from frame_ring import FrameRing
+from session import SessionRecorder
+from metrics import REGISTRY, MetricsServer
+from board_metrics import BoardMetrics
+from latency import LatencyTracker
+from memory_stats import MemoryAccounting, AllocationSnapshots
+from display import OpenCVBackend
+from layout_cache import LAYOUT_CACHE, DEFAULT_CACHE_FILE
 from tools import ToolManager
 from util import unit_to_abs_bbox
 from buttons import ColorButton, ToolButton, ArtistButton, DialButton
@@ -17,14 +32,56 @@ from popup_artists import TextSizeArtist, ThicknessArtist
 
 
 class WhiteboardApp(object):
-    def __init__(self, state_file=None):
+    def __init__(self, state_file=None, autosave_file=None, autosave_interval=30.0, stream_load=True,
+                 share_port=None, sync_port=None, frame_ring=None, record_file=None, metrics_port=None,
+                 metrics_file='whiteboard_metrics.json', display=None, layout_cache_file=None,
+                 timeline=False):
+        """
+        :param state_file: board file to load and keep saved (journaled, see journal.py), or None.
+        :param autosave_file: also save a copy of the board here every autosave_interval seconds (if changed).
+        :param stream_load: load the state file in the background (windows fill in as it loads).
+        :param share_port: serve the board window to viewers on this port (see share_server.py), or None.
+        :param sync_port: serve the board's vector ops to viewers on this port (see board_sync.py), or None.
+        :param frame_ring: publish board frames to shared memory with this name (see frame_ring.py), or None.
+        :param record_file: record the session here (see session.py), or None.
+        :param metrics_port: serve metrics snapshots (JSON) on this local port (see metrics.py), or None.
+        :param metrics_file: where the 'm' key writes a metrics snapshot.
+        :param display: DisplayBackend for the windows & events (see display.py), default:  OpenCV windows.
+        :param layout_cache_file: keep startup geometry here for the next start (see layout_cache.py), or None,
+            (the command line uses DEFAULT_CACHE_FILE).
+        :param timeline: record the board's past states (see timeline.py), (checkpoints of the whole board, and on a
+            chunked board every chunk is read).
+        """
         logging.info("Starting Whiteboard...")
+        self._t_init = time.perf_counter()
+        LAYOUT_CACHE.load(layout_cache_file, {'board': BOARD_LAYOUT['win_size'],
+                                              'control': CONTROL_LAYOUT['win_size']})
+        self._display = display if display is not None else OpenCVBackend()
 
-        self._vector_manager = VectorManager(state_file)
+        self._vector_manager = VectorManager()
+        views, zoom_controllers = self._make_zoom()
+        self._journal = Journal(self._vector_manager, state_file, stream=stream_load, view=views['board']) \
+            if state_file is not None else None
+        self._autosaver = AutoSaver(self._vector_manager, autosave_file, autosave_interval) \
+            if autosave_file is not None else None
+        self._history = History(self._vector_manager)
+        self._timeline = Timeline(self._vector_manager) if timeline else None
+        self._sync_server = SyncServer(self._vector_manager, sync_port) if sync_port is not None else None
+        self._recorder = SessionRecorder(self._vector_manager, record_file) if record_file is not None else None
+        self._board_metrics = BoardMetrics(self._vector_manager)
+        self._memory = MemoryAccounting(self._vector_manager, self._history, self._timeline)
+        self._allocations = AllocationSnapshots()
+        self._frame_ms = REGISTRY.histogram('app.frame_ms', "time between frames")
+        self._fps = REGISTRY.gauge('app.fps', "frames per second, over the last couple of seconds")
+        self._metrics_file = metrics_file
+        self._metrics_server = MetricsServer(port=metrics_port) if metrics_port is not None else None
+        if self._autosaver is not None:
+            REGISTRY.gauge('autosave.stats', fn=self._autosaver.get_stats)
+        if self._sync_server is not None:
+            REGISTRY.gauge('sync_server.stats', fn=self._sync_server.get_stats)
         self._tool_manager = ToolManager(self, self._vector_manager)
         self._tool_manager.set_color_thickness(INIT_OPTIONS['color'], INIT_OPTIONS['thickness'])
         self._tool_manager.set_text_size(INIT_OPTIONS['font_size'])
-        views, zoom_controllers = self._make_zoom()
 
         self._windows = {'control': self._make_control_window(views['control'],
                                                               self._tool_manager,
@@ -34,12 +91,28 @@ class WhiteboardApp(object):
                                                           self._tool_manager,
                                                           self._vector_manager)}
         self._active_window_n = 'control'
+        self._share_server = None
+        if share_port is not None:
+            self._share_server = ShareServer(share_port)
+            REGISTRY.gauge('share_server.stats', fn=self._share_server.get_stats)
+            self._windows['board'].add_frame_callback(self._share_server.share_frame)
+        self._frame_ring = None
+        if frame_ring is not None:
+            width, height = self._windows['board'].get_size()
+            self._frame_ring = FrameRing(frame_ring, (height, width, 3))
+            self._windows['board'].add_frame_callback(self._frame_ring.publish)
+        self._latency = LatencyTracker(time_fn=self._display.time)
+        for window in self._windows.values():
+            window.set_latency_tracker(self._latency)
         self._win_titles = {win_kind: self._windows[win_kind].get_name_and_title()[1] for win_kind in self._windows}
         #  Added last, so mouse signals are sent to other controls first.
         # self._windows['control'].add_control(self._zoom_controllers['control'])
         # self._windows['board'].add_control(self._zoom_controllers['board'])
 
         self._options = {k: INIT_OPTIONS[k] for k in INIT_OPTIONS}
+        self._set_profiling(self._options['show_hud'])
+        LAYOUT_CACHE.save()
+        self._startup_ms = REGISTRY.gauge('app.startup_ms', "imports, setup & first frame (ms)")
         # self.set_option('snap_to_grid', INIT_OPTIONS['snap_to_grid'])
 
     def set_active_window(self, win_name):
@@ -59,6 +132,13 @@ class WhiteboardApp(object):
     def toggle_option(self, option_name):
         self.set_option(option_name, not self.get_option(option_name))
 
+    def _set_profiling(self, on):
+        """
+        Time every stage of every window's refresh (see frame_profiler.py), shown in the board window's HUD.
+        """
+        for window in self._windows.values():
+            window.set_profiling(on)
+
     def _make_zoom(self):
         """
         The views are the parts of the board that are visible in each window.
@@ -96,7 +176,8 @@ class WhiteboardApp(object):
                       tool_manager,
                       title=CONTROL_LAYOUT['win_name'],
                       window_size=ctrl_win_size,
-                      bkg_color_n=BOARD_LAYOUT['bkg_color'])
+                      bkg_color_n=BOARD_LAYOUT['bkg_color'],
+                      display=self._display)
 
         # Color buttons
         color_name_grid = CONTROL_LAYOUT['color_box']['options']
@@ -158,10 +239,12 @@ class WhiteboardApp(object):
         return cw
 
     def undo(self, *_):
-        logging.info("Undoing last action.")
+        if not self._history.undo():
+            logging.info("Nothing to undo.")
 
     def redo(self, *_):
-        logging.info("Redoing last action.")
+        if not self._history.redo():
+            logging.info("Nothing to redo.")
 
     def _make_board_window(self, view, tool_manager, vector_manager):
         board_win_size = BOARD_LAYOUT['win_size']
@@ -172,7 +255,8 @@ class WhiteboardApp(object):
                       tool_manager,
                       title=BOARD_LAYOUT['win_name'],
                       window_size=board_win_size,
-                      bkg_color_n=BOARD_LAYOUT['bkg_color'])
+                      bkg_color_n=BOARD_LAYOUT['bkg_color'],
+                      display=self._display)
 
         # zoom slider
         zoom_slider_box = unit_to_abs_bbox(BOARD_LAYOUT['zoom_bar']['loc'], board_win_size)
@@ -187,52 +271,125 @@ class WhiteboardApp(object):
         for window in self._windows:
             self._windows[window].start()
 
-        n_frames, t_start = 0, time.perf_counter()
-        while True:
-
-            # Redraw windows:
-            # for win_name in self._windows:
-            #    self._windows[win_name].refresh()
-            self._windows['control'].refresh(options=dict(show_grid=self.get_option('show_grid')))
-            self._windows['board'].refresh(options=dict(show_grid=self.get_option('show_grid')))
-
-            # Flush to screen & handle keypresses:
-            key = cv2.waitKey(1) & 0xFF
-            if not self._keypress(key):
-                break
-
-            # Report FPS:
-            n_frames += 1
-            t = time.perf_counter()
-            if t - t_start > 2:
-                logging.info("FPS: %d" % (n_frames / (t - t_start)))
-
-                def get_vec_strs(vs):
-                    strs = []
-                    for v in vs:
-                        strs.append("%s: (H: %i) (%.2f, %.2f) -> (%.2f, %.2f)" % (v.name, 1 if v.highlighted else 0,
-                                                                                  v._points[0][0], v._points[0][1],
-                                                                                  v._points[-1][0], v._points[-1][1]))
-                    return strs
-                # Report vectors:
-                vecs = get_vec_strs(self._vector_manager._vectors)
-                active_vecs = get_vec_strs(self._vector_manager._vecs_in_progress)
-                logging.info("Vectors: %s" % pprint.pformat(vecs))
-                logging.info("Active vectors: %s" % pprint.pformat(active_vecs))
-
-                n_frames, t_start = 0, t
-
-        cv2.destroyAllWindows()
+        t_run = time.perf_counter()
+        n_frames, t_start = 0, t_run
+        t_frame = t_start
+        try:
+            while True:
+
+                # Redraw windows:
+                # for win_name in self._windows:
+                #    self._windows[win_name].refresh()
+                self._windows['control'].refresh(options=dict(show_grid=self.get_option('show_grid')))
+                self._windows['board'].refresh(options=dict(show_grid=self.get_option('show_grid'),
+                                                            show_hud=self.get_option('show_hud')))
+
+                # Flush to screen & handle keypresses:
+                key = self._display.wait_key(1) & 0xFF
+                if not self._keypress(key):
+                    break
+
+                if self._journal is not None:
+                    self._journal.tick()
+                if self._autosaver is not None:
+                    self._autosaver.tick()
+                if self._sync_server is not None:
+                    self._sync_server.tick()
+                if self._recorder is not None:
+                    self._recorder.tick()
+                self._memory.tick()
+
+                # Report FPS:
+                n_frames += 1
+                t = time.perf_counter()
+                if t_run is not None:
+                    self._report_startup(t_run, t)
+                    t_run = None
+                self._frame_ms.observe((t - t_frame) * 1000.)
+                t_frame = t
+                if t - t_start > 2:
+                    self._fps.set(n_frames / (t - t_start))
+                    logging.info("FPS: %d" % (n_frames / (t - t_start)))
+                    n_frames, t_start = 0, t
+        finally:
+            self._close()
+
+    def _close(self):
+        """
+        Stop everything run() started, (also when the loop raised:  the journal still gets synced, shared memory
+        unlinked, threads stopped).
+        """
+        closers = [self._journal, self._autosaver, self._share_server, self._sync_server, self._frame_ring,
+                   self._recorder, self._metrics_server, self._board_metrics, self._memory]
+        for closer in closers:
+            if closer is None:
+                continue
+            try:
+                closer.close()
+            except Exception:
+                logging.exception("Failed closing %s." % (type(closer).__name__,))
+        self._allocations.stop()
+        self._display.destroy_all()
+
+    def _report_startup(self, t_run, t_first_frame):
+        startup = {'imports': (self._t_init - _T_IMPORT) * 1000., 'setup': (t_run - self._t_init) * 1000.,
+                   'first_frame': (t_first_frame - t_run) * 1000., 'total': (t_first_frame - _T_IMPORT) * 1000.}
+        self._startup_ms.set(startup)
+        logging.info("Startup:  %.0f ms (imports %.0f ms, setup %.0f ms, first frame %.0f ms)." % (
+            startup['total'], startup['imports'], startup['setup'], startup['first_frame']))
+
+    def dump_vectors(self):
+        """
+        Debug:  log every vector (slow on big boards, only on request, 'v' key).
+        """
+        def get_vec_strs(vs):
+            strs = []
+            for v in vs:
+                strs.append("%s: (H: %i) (%.2f, %.2f) -> (%.2f, %.2f)" % (v.name, 1 if v.highlighted else 0,
+                                                                          v._points[0][0], v._points[0][1],
+                                                                          v._points[-1][0], v._points[-1][1]))
+            return strs
+        logging.info("Vectors: %s" % pprint.pformat(get_vec_strs(self._vector_manager.get_all_vectors())))
+        logging.info("Active vectors: %s" % pprint.pformat(get_vec_strs(self._vector_manager._vecs_in_progress)))
+
+    def diff_allocations(self, limit=10):
+        """
+        Debug:  take a tracemalloc snapshot ('t' key), log what was allocated since the previous one & the memory
+        accounting, (the first press starts tracing).
+        """
+        label = self._allocations.take()
+        if len(self._allocations.get_labels()) < 2:
+            logging.info("Took allocation snapshot %s, take another to see what was allocated since." % (label,))
+            return
+        lines = ["%+10.1f kB %+8i  %s" % (line['size_diff'] / 1024., line['count_diff'], line['where'])
+                 for line in self._allocations.diff(limit=limit)]
+        logging.info("Allocated since the last snapshot (kB, blocks, where):\n%s" % ("\n".join(lines),))
+        logging.info("Memory:  %s" % pprint.pformat(self._memory.update()))
 
     def _keypress(self, key):
         if key == 27 or key == ord('q'):
             print("User quit.")
             return False
+        if key == ord('m'):
+            self._memory.update()
+            REGISTRY.write_json(self._metrics_file)
+            return True
+        if key == ord('v'):
+            self.dump_vectors()
+            return True
+        if key == ord('t'):
+            self.diff_allocations()
+            return True
+        if key == ord('p'):
+            self.toggle_option('show_hud')
+            self._set_profiling(self.get_option('show_hud'))
+            return True
         if not self._windows[self._active_window_n].keypress(key):
             return False
         return True
 
 
 if __name__ == "__main__":
+    import sys
     logging.basicConfig(level=logging.INFO)
-    WhiteboardApp().run()
+    WhiteboardApp(state_file=sys.argv[1] if len(sys.argv) > 1 else None, layout_cache_file=DEFAULT_CACHE_FILE).run()
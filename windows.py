@@ -11,6 +11,9 @@ from slider import Slider
 from button_box import ButtonBox
 from buttons import Button, ColorButton, ToolButton
 from layout import COLORS_BGR, CONTROL_LAYOUT, EMPTY_BBOX
+from frame_profiler import FrameProfiler, MOUSE
+from display import OpenCVBackend
+import time
 
 
 class UIWindow(object):
@@ -20,18 +23,23 @@ class UIWindow(object):
     """
 
     def __init__(self, name,app, board_view, vector_manager, tool_manager, title, window_size, visible=True,
-                 win_params=cv2.WINDOW_NORMAL, bkg_color_n='off_white'):
+                 win_params=cv2.WINDOW_NORMAL, bkg_color_n='off_white', display=None):
+        """
+        :param display: DisplayBackend (see display.py), default:  OpenCV windows
+        """
         self._name = name  # (for cv2)
         self._window_size = window_size
         self._win_params = win_params
         self._title = title
         self._visible = visible
         self._app = app
+        self._display = display if display is not None else OpenCVBackend()
 
         # for rendering window:
         self._color_v = COLORS_BGR[bkg_color_n]
         self._draw_color_v = COLORS_BGR[BOARD_LAYOUT['obj_color']]
-        self._blank = (np.zeros((window_size[1], window_size[0], 3)) + self._color_v).astype(dtype=np.uint8)
+        self._blank = np.empty((window_size[1], window_size[0], 3), dtype=np.uint8)
+        self._blank[:] = self._color_v
         self._pan_start_xy = None
         self._old_view = None
 
@@ -47,6 +55,30 @@ class UIWindow(object):
         self.vectors = vector_manager
         self.tools = tool_manager
         self._controls = []
+        self._frame_callbacks = []
+        self._profiler = None  # FrameProfiler, when profiling
+        self._latency = None  # LatencyTracker, when measuring latency
+
+    def add_frame_callback(self, callback):
+        """
+        :param callback: function(frame) called with every rendered frame, (must not modify it).
+        """
+        self._frame_callbacks.append(callback)
+
+    def set_profiling(self, on):
+        """
+        Start (with new timings) or stop timing each stage of refresh() and mouse events.
+        """
+        self._profiler = FrameProfiler() if on else None
+
+    def get_profiler(self):
+        return self._profiler
+
+    def set_latency_tracker(self, tracker):
+        """
+        :param tracker: LatencyTracker (see latency.py) to time mouse events until they're shown, or None
+        """
+        self._latency = tracker
 
     def get_size(self):
         return self._window_size
@@ -73,20 +105,51 @@ class UIWindow(object):
         self._controls.append(control)
 
     def start(self):
-        cv2.namedWindow(self._title)
-        cv2.resizeWindow(self._title, self._window_size[0], self._window_size[1])
-        cv2.setMouseCallback(self._title, self.cv2_mouse_event, param=self._name)
+        self._display.create_window(self._title, self._window_size, self.cv2_mouse_event, param=self._name)
 
     def refresh(self, options = {}):
+        """
+        :param options: 'show_grid', and 'show_hud' to draw the profiler's numbers (if profiling)
+        """
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.start_frame()
+        if self._latency is not None:
+            self._latency.start_frame(self._name)
         frame = self._blank.copy()
+        if profiler is not None:
+            profiler.mark('blank')
         if 'show_grid' in options and options['show_grid']:
             self.view.render_grid(frame, line_color_v = self._draw_color_v, bkg_color_v = self._color_v)
-        self.vectors.render(frame, self.view)
+        if profiler is not None:
+            profiler.mark('grid')
+        self.vectors.render(frame, self.view, counts=profiler.get_counts() if profiler is not None else None)
+        if profiler is not None:
+            profiler.mark('vectors')
         for control in self._controls:
             control.render(frame)
+        if profiler is not None:
+            profiler.mark('controls')
         if self._app.is_active_window(self._name):
             self.tools.render(frame, self)
-        cv2.imshow(self._title, frame)
+        if profiler is not None:
+            profiler.mark('tools')
+        for callback in self._frame_callbacks:
+            callback(frame)
+        if self._latency is not None and self._frame_callbacks:
+            self._latency.frame_presented(self._name, 'callbacks')
+        if profiler is not None:
+            profiler.mark('callbacks')
+            if options.get('show_hud', False):
+                frame = frame.copy()  # (the callbacks may keep the frame, so viewers don't see the HUD)
+                profiler.draw_hud(frame)
+                profiler.mark('hud')
+        self._display.show(self._title, frame)
+        if self._latency is not None:
+            self._latency.frame_presented(self._name, 'imshow')
+        if profiler is not None:
+            profiler.mark('imshow')
+            profiler.end_frame()
 
     def _update_mouseover(self, xy):
         for i, control in enumerate(self._controls):
@@ -99,25 +162,41 @@ class UIWindow(object):
             self._control_moused_over = None
 
     def cv2_mouse_event(self, event, x, y, flags, param):
+        if self._profiler is None and self._latency is None:
+            self._dispatch_mouse_event(event, x, y)
+            return
+        t_start = time.perf_counter()
+        t_event = self._latency.now() if self._latency is not None else None  # (the display's clock)
+        handled_by = self._dispatch_mouse_event(event, x, y)
+        if self._profiler is not None:
+            self._profiler.add_time(MOUSE, (time.perf_counter() - t_start) * 1000.)
+        if self._latency is not None and handled_by is not None:
+            self._latency.event_handled(self._name, t_event, handled_by)
+
+    def _dispatch_mouse_event(self, event, x, y):
         """
         Figure out which tool/control has the mouse (if any), or which should get it, 
         then call the appropriate mouse_<event> method
+        :returns: name of the tool that got the event, 'controls', or None
         """
         self._app.set_active_window(self._name)
         if event == cv2.EVENT_MOUSEMOVE:
             self._update_mouseover((x, y))
             self._cur_xy = (x, y)
+            handled_by = None
 
             if self._control_with_mouse is not None:
+                handled_by = 'controls'
                 rv = self._controls[self._control_with_mouse].mouse_move((x, y))
                 if rv == MouseReturnStates.released:
                     self._control_with_mouse = None
                     
             if self._tool_has_mouse:
+                handled_by = self.tools.get_tool_name()
                 rv = self.tools.current_tool.mouse_move((x, y),self)
                 if rv == MouseReturnStates.released:
                     self._tool_has_mouse = False
-                    
+            return handled_by
                 
         elif event == cv2.EVENT_LBUTTONDOWN:
             if self._control_with_mouse is not None or self._tool_has_mouse:
@@ -128,23 +207,29 @@ class UIWindow(object):
                     if rv == MouseReturnStates.captured:
                         self._control_with_mouse = i
                     if rv in [MouseReturnStates.captured, MouseReturnStates.released]:
-                        return
+                        return 'controls'
 
+            handled_by = self.tools.get_tool_name()
             rv = self.tools.current_tool.mouse_down((x, y),self)
             if rv == MouseReturnStates.captured:
                 self._tool_has_mouse = True
+            return handled_by
             
         elif event == cv2.EVENT_LBUTTONUP:
             if self._control_with_mouse is not None:
                 rv = self._controls[self._control_with_mouse].mouse_up((x, y))
                 if rv == MouseReturnStates.released:
                     self._control_with_mouse = None
+                return 'controls'
                 
             elif self._tool_has_mouse:
+                handled_by = self.tools.get_tool_name()
                 rv = self.tools.current_tool.mouse_up((x, y),self)
                 if rv == MouseReturnStates.released:
                     self._tool_has_mouse = False
-                return
+                return handled_by
+        return None
+
     def keypress(self, key):
         if key & 0xff != 255:
             print("Window %s pressed key %s." % (self._title, key))
@@ -152,5 +237,5 @@ class UIWindow(object):
                     
             
     def close(self):
-        cv2.destroyWindow(self._title)
+        self._display.destroy_window(self._title)
         
\ No newline at end of file